@@ -0,0 +1,362 @@
+import time
+
+# taken before anything else is imported, so the startup cost of the CLI itself is measured too
+_started = time.perf_counter()
+
+import argparse
+import csv
+import importlib
+import json
+import logging
+import os
+import sys
+from tcg_logging import configure_logging
+from tcg_metrics import metrics
+
+# Get the custom Logger from Configuration File
+logger = logging.getLogger(__name__)
+
+# seconds every subcommand may spend importing, the CLI's own imports included, before a warning is logged
+IMPORT_BUDGETS = {'scrape': 3.0, 'validate': 0.5, 'upload': 0.8, 'history': 0.5, 'delta': 0.5, 'crawl': 3.0, 'reparse': 3.0, 'cache': 0.5, 'catalog': 0.5}
+
+# the modules every subcommand needs; selenium, pandas, pyarrow and boto3 are only loaded by the ones listed here
+COMMAND_MODULES = {
+    'scrape': ['tcg_scraper'],
+    'validate': ['tcg_validations', 'tcg_row_sink'],
+    'upload': ['upload_to_s3'],
+    'history': ['tcg_price_history'],
+    'delta': ['tcg_delta'],
+    'crawl': ['tcg_crawl_coordinator'],
+    'reparse': ['tcg_reparse', 'tcg_html_extractors'],
+    'cache': ['tcg_page_cache'],
+    'catalog': ['tcg_card_catalog'],
+}
+
+def import_modules(command):
+    """
+    Imports the modules of a subcommand and logs the time it took against the subcommand's budget.
+
+    Args:
+        command (str): The subcommand, a key of COMMAND_MODULES.
+
+    Returns:
+        list: The imported modules, in the order of COMMAND_MODULES[command].
+    """
+    start = time.perf_counter()
+    modules = [importlib.import_module(name) for name in COMMAND_MODULES[command]]
+    elapsed = time.perf_counter() - start
+    total = time.perf_counter() - _started
+    budget = IMPORT_BUDGETS[command]
+    metrics.record('import', total)
+    if total > budget:
+        logger.warning("Imports of '%s' took %.0f ms (%.0f ms for its modules), over the budget of %.0f ms.",
+                       command, total * 1000, elapsed * 1000, budget * 1000)
+    else:
+        logger.info("Imports of '%s' took %.0f ms (%.0f ms for its modules), within the budget of %.0f ms.",
+                    command, total * 1000, elapsed * 1000, budget * 1000)
+    return modules
+
+def build_parser():
+    """
+    Returns the parser of the optcg command line.
+    """
+    parser = argparse.ArgumentParser(prog='optcg', description="One Piece TCG price pipeline.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    # the scrape options belong to tcg_scraper.parse_args(), which only runs once selenium is imported
+    subparsers.add_parser('scrape', add_help=False,
+                          help="Scrape today's prices from tcgplayer.com, see 'optcg scrape --help'.")
+
+    validate = subparsers.add_parser('validate', help="Validate a daily csv without loading pandas.")
+    validate.add_argument('file', help="The daily csv.")
+    validate.add_argument('--chunksize', type=int, default=10000, help="Rows read at a time.")
+    validate.add_argument('--strict', action='store_true',
+                          help="Exit with status 1 if the file has duplicates or prices below current_lowest_price.")
+    validate.add_argument('--catalog', default=None, metavar='DB',
+                          help="The card catalog of a compact daily csv, see 'optcg scrape --catalog'.")
+
+    upload = subparsers.add_parser('upload', help="Upload files to S3.")
+    upload.add_argument('files', nargs='+', help="The files to upload.")
+    upload.add_argument('--bucket', default=os.getenv('S3_OPTCG_BUCKET_NAME'),
+                        help="The bucket (env: S3_OPTCG_BUCKET_NAME).")
+    upload.add_argument('--append-only', action='store_true',
+                        help="Only upload the bytes appended since the last upload, for logs and the url ledger.")
+
+    history = subparsers.add_parser('history', help="Query or fill the price history database.")
+    history.add_argument('--db', default=None, help="The price history database. Defaults to output/price_history.db.")
+    history_commands = history.add_subparsers(dest='history_command', required=True)
+    ingest = history_commands.add_parser('ingest', help="Add daily csv files to the database.")
+    ingest.add_argument('files', nargs='+', help="The daily csv files.")
+    ingest.add_argument('--catalog', default=None, metavar='DB', help="The card catalog of compact daily csv files.")
+    cards = history_commands.add_parser('cards', help="Find the keys of the cards whose name contains a text.")
+    cards.add_argument('name')
+    series = history_commands.add_parser('series', help="Price series of one card.")
+    series.add_argument('key', help="The card key, see 'optcg history cards'.")
+    series.add_argument('--start', help="First date, YYYY-MM-DD.")
+    series.add_argument('--end', help="Last date, YYYY-MM-DD.")
+    movers = history_commands.add_parser('movers', help="Cards whose price changed the most between two dates.")
+    movers.add_argument('start', help="YYYY-MM-DD")
+    movers.add_argument('end', help="YYYY-MM-DD")
+    movers.add_argument('--limit', type=int, default=20)
+    sets = history_commands.add_parser('sets', help="Card count and prices of every set on a date.")
+    sets.add_argument('date', help="YYYY-MM-DD")
+    for command in [series, movers, sets]:
+        command.add_argument('--price', default='normal_market_price', help="The price column.")
+
+    delta = subparsers.add_parser('delta', help="Publish daily csv files as deltas, or apply deltas to a SQLite stand-in of the loader.")
+    delta_commands = delta.add_subparsers(dest='delta_command', required=True)
+    publish = delta_commands.add_parser('publish', help="Write the delta of a daily csv since the last published snapshot.")
+    publish.add_argument('file', help="The validated daily csv.")
+    publish.add_argument('date', help="The date of its rows, YYYY-MM-DD.")
+    publish.add_argument('--dir', default=None, help="Directory of the deltas. Defaults to output/deltas.")
+    publish.add_argument('--catalog', default=None, metavar='DB', help="The card catalog of a compact daily csv.")
+    apply = delta_commands.add_parser('apply', help="Apply delta manifests, in order, to a SQLite database.")
+    apply.add_argument('manifests', nargs='+', help="The manifest files.")
+    apply.add_argument('--db', required=True, help="The SQLite database standing in for the loader's MySQL.")
+
+    crawl = subparsers.add_parser('crawl', help="Sharded crawl: plan a run, work on it from any number of processes, merge the shards.")
+    crawl.add_argument('--db', default=None, help="The lease database, shared by every worker. Defaults to output/shards/leases.db.")
+    crawl.add_argument('--run', default=None, help="The run id. Defaults to today's date, YYYYMMDD.")
+    crawl_commands = crawl.add_subparsers(dest='crawl_command', required=True)
+    plan = crawl_commands.add_parser('plan', help="Store the search pages of the run as leases.")
+    plan.add_argument('--pages', type=int, default=None, help="Number of search pages. Read from tcgplayer.com if not given.")
+    work = crawl_commands.add_parser('work', help="Scrape leased pages until the run is finished.")
+    work.add_argument('--threads', type=int, default=1, help="Browsers of this worker.")
+    work.add_argument('--batch', type=int, default=1, help="Pages leased at a time.")
+    work.add_argument('--lease', type=float, default=900, help="Seconds a page is leased for.")
+    work.add_argument('--parse-workers', type=int, default=0, help="Processes parsing the product pages while the browsers navigate.")
+    work.add_argument('--grid', action='store_true', help="Read the cards from the search result tiles.")
+    work.add_argument('--enrich', action='store_true', help="Read the grid, then the product pages for the missing prices.")
+    merge = crawl_commands.add_parser('merge', help="Merge the shards of the run into the daily csv.")
+    merge.add_argument('--wait', action='store_true', help="Wait for the run to finish first.")
+    merge.add_argument('--output', default=None, help="The daily csv. Defaults to output/optcg_data_<run>.csv.")
+    crawl_commands.add_parser('status', help="Number of pages of the run in every state.")
+
+    reparse = subparsers.add_parser('reparse', help="Parse the pages cached on a date again, on every CPU core, instead of crawling again.")
+    reparse.add_argument('dates', nargs='+', help="The dates of the cached pages, YYYY-MM-DD.")
+    reparse.add_argument('--cache-dir', default=None, help="The page cache. Defaults to cache/pages.")
+    reparse.add_argument('--workers', type=int, default=None, help="Worker processes. Defaults to the number of CPUs.")
+    reparse.add_argument('--extractor', default=os.getenv('OPTCG_EXTRACTOR', 'soup'),
+                         help="HTML parser the product pages are read with (env: OPTCG_EXTRACTOR).")
+    reparse.add_argument('--output-dir', default=None, help="Directory of the csv files. Defaults to output/reparsed.")
+
+    cache = subparsers.add_parser('cache', help="Inspect or trim the page cache.")
+    cache.add_argument('--cache-dir', default=None, help="The page cache. Defaults to cache/pages.")
+    cache.add_argument('--max-gb', type=float, default=2.0, help="Size the cached pages may take, in GB.")
+    cache.add_argument('--max-age-days', type=float, default=90, help="Age after which a page is evicted.")
+    cache_commands = cache.add_subparsers(dest='cache_command', required=True)
+    cache_commands.add_parser('stats', help="Number and size of the cached pages.")
+    cache_commands.add_parser('evict', help="Drop the pages over the age and size limits.")
+
+    catalog = subparsers.add_parser('catalog', help="Inspect the card catalog or expand compact daily rows.")
+    catalog.add_argument('--db', default=None, help="The card catalog. Defaults to output/card_catalog.db.")
+    catalog_commands = catalog.add_subparsers(dest='catalog_command', required=True)
+    catalog_commands.add_parser('stats', help="Number of cards in the catalog.")
+    expand = catalog_commands.add_parser('expand', help="Write a compact daily csv out with the columns of the daily csv.")
+    expand.add_argument('file', help="The compact daily csv.")
+    expand.add_argument('output', help="The csv to write.")
+    return parser
+
+def run_scrape(scraper_args):
+    tcg_scraper, = import_modules('scrape')
+    args = tcg_scraper.parse_args(scraper_args)
+    tcg_scraper.main(workers=args.workers, http=args.http, http_workers=args.http_workers, rate=args.rate,
+                     extractor=args.extractor, parse_workers=args.parse_workers, grid=args.grid, enrich=args.enrich, cache=args.cache, catalog=args.catalog, resume=args.resume,
+                     incremental=args.incremental, parquet=args.parquet, history=args.history, delta=args.delta,
+                     upload=args.upload)
+    return 0
+
+def read_daily_rows(file_name, catalog_db=None, chunksize=10000):
+    """
+    Reads a daily csv in chunks of rows, expanding the rows of a compact csv through its card catalog.
+
+    Args:
+        file_name (str): The daily csv.
+        catalog_db (str, optional): The card catalog when file_name is a compact csv.
+        chunksize (int): Number of rows per chunk.
+
+    Yields:
+        list: The next chunk of rows.
+    """
+    if catalog_db is None:
+        from tcg_row_sink import read_csv_rows
+        yield from read_csv_rows(file_name, chunksize=chunksize)
+        return
+    card_catalog, = import_modules('catalog')
+    with card_catalog.CardCatalog(catalog_db) as catalog:
+        yield from catalog.expand_csv(file_name, chunksize=chunksize)
+
+def run_validate(args):
+    vtcg, _ = import_modules('validate')
+    validator = vtcg.StreamingValidator()
+    for chunk in read_daily_rows(args.file, args.catalog, chunksize=args.chunksize):
+        validator.write(chunk)
+    report = {
+        'file': args.file,
+        'rows': validator.row_count(),
+        'schema': validator.df_show_schema(),
+        'lowest_price_failures': validator.validate_lowest_price(),
+        'duplicates': validator.check_for_dupes(),
+        'nulls': validator.count_nulls(),
+    }
+    print(json.dumps(report, indent=2))
+    if args.strict and (report['duplicates'] or report['lowest_price_failures']):
+        return 1
+    return 0
+
+def run_upload(args, parser):
+    if not args.bucket:
+        parser.error("upload needs --bucket or S3_OPTCG_BUCKET_NAME.")
+    upload_to_s3, = import_modules('upload')
+    if args.append_only:
+        for file_name in args.files:
+            print(upload_to_s3.upload_new_bytes(file_name, bucket=args.bucket) or f"{file_name}: nothing new")
+    else:
+        for object_name in upload_to_s3.upload_files(args.files, bucket=args.bucket):
+            print(object_name)
+    return 0
+
+def run_history(args):
+    price_history, = import_modules('history')
+    db_path = args.db or price_history.DEFAULT_HISTORY_PATH
+    with price_history.PriceHistoryStore(db_path) as store:
+        if args.history_command == 'ingest':
+            rows = [(file_name, sum(store.ingest_rows(chunk) for chunk in read_daily_rows(file_name, args.catalog)))
+                    for file_name in args.files]
+        elif args.history_command == 'cards':
+            rows = store.find_cards(args.name)
+        elif args.history_command == 'series':
+            rows = store.price_series(args.key, args.price, args.start, args.end)
+        elif args.history_command == 'movers':
+            rows = store.top_movers(args.start, args.end, args.price, args.limit)
+        else:
+            rows = store.set_aggregate(args.date, args.price)
+    for row in rows:
+        print('\t'.join('' if value is None else str(value) for value in row))
+    return 0
+
+def run_delta(args):
+    tcg_delta, = import_modules('delta')
+    if args.delta_command == 'publish':
+        publisher = tcg_delta.DeltaPublisher(args.dir or tcg_delta.DEFAULT_DELTA_DIR)
+        manifest = publisher.prepare((row for chunk in read_daily_rows(args.file, args.catalog) for row in chunk),
+                                     args.date)
+        publisher.commit(manifest)
+        print(json.dumps(manifest, indent=2))
+        return 0
+    loader = tcg_delta.SqliteDeltaLoader(args.db)
+    try:
+        for manifest_path in args.manifests:
+            manifest = loader.apply(manifest_path)
+            print(f"{manifest['delta_file']}: {manifest['inserts']} insert(s), {manifest['updates']} update(s), "
+                  f"{manifest['deletes']} delete(s)")
+    finally:
+        loader.close()
+    return 0
+
+def run_crawl(args):
+    coordinator_module, = import_modules('crawl')
+    tcg = coordinator_module.tcg
+    store = coordinator_module.LeaseStore(args.db or coordinator_module.DEFAULT_LEASE_DB)
+    coordinator = coordinator_module.Coordinator(store)
+    run_id = args.run or tcg.get_todays_date()[0]
+    try:
+        if args.crawl_command == 'plan':
+            page_nums = list(range(1, args.pages + 1)) if args.pages else None
+            if page_nums is None:
+                driver = tcg.create_driver()
+                try:
+                    tcg.download_elements_from_webpage(driver, url=tcg.build_search_url(1))
+                    page_nums = tcg.get_max_page_number(driver)
+                finally:
+                    driver.quit()
+            print(coordinator.plan(page_nums, run_id=run_id))
+        elif args.crawl_command == 'work':
+            worker = coordinator_module.ShardWorker(store, run_id, threads=args.threads, lease_seconds=args.lease,
+                                                    batch=args.batch, grid=args.grid, enrich=args.enrich,
+                                                    parse_workers=args.parse_workers)
+            print(f"{worker.run()} row(s) written to {worker.shard_path}")
+        elif args.crawl_command == 'merge':
+            if args.wait:
+                coordinator.wait(run_id)
+            output = args.output or os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'output',
+                                                 f'optcg_data_{run_id}.csv')
+            print(f"{coordinator.merge(run_id, output, url_index=coordinator_module.ScrapedUrlIndex())} row(s) merged into {output}")
+        print(json.dumps(store.status(run_id)))
+    finally:
+        store.close()
+    return 0
+
+def run_reparse(args):
+    tcg_reparse, extractors = import_modules('reparse')
+    extractors.get_extractor(args.extractor) # fail here, not in every worker, if the parser is not installed
+    for date in args.dates:
+        output_path = None
+        if args.output_dir:
+            output_path = os.path.join(args.output_dir, f"optcg_data_{date.replace('-', '')}.csv")
+        print(json.dumps(tcg_reparse.reparse(date, cache_dir=args.cache_dir or tcg_reparse.DEFAULT_CACHE_DIR,
+                                             output_path=output_path, workers=args.workers, extractor=args.extractor)))
+    return 0
+
+def run_cache(args):
+    page_cache, = import_modules('cache')
+    with page_cache.PageCache(args.cache_dir or page_cache.DEFAULT_CACHE_DIR, max_bytes=int(args.max_gb * 1024 ** 3),
+                              max_age_days=args.max_age_days) as cache:
+        if args.cache_command == 'evict':
+            print(f"{cache.evict()} blob(s) deleted")
+        print(json.dumps(cache.stats()))
+    return 0
+
+def run_catalog(args):
+    card_catalog, = import_modules('catalog')
+    with card_catalog.CardCatalog(args.db or card_catalog.DEFAULT_CATALOG_PATH) as catalog:
+        if args.catalog_command == 'stats':
+            print(json.dumps({'cards': len(catalog)}))
+            return 0
+        rows = 0
+        with open(args.output, 'w', newline='') as file:
+            writer = None
+            for chunk in catalog.expand_csv(args.file):
+                if writer is None:
+                    writer = csv.DictWriter(file, fieldnames=list(chunk[0]))
+                    writer.writeheader()
+                writer.writerows(chunk)
+                rows += len(chunk)
+    print(f"{rows} row(s) written to {args.output}")
+    return 0
+
+def main(argv=None):
+    """
+    Runs the optcg command line.
+
+    Args:
+        argv (list, optional): The arguments. Defaults to sys.argv[1:].
+
+    Returns:
+        int: The exit status.
+    """
+    parser = build_parser()
+    args, extra = parser.parse_known_args(argv)
+    if args.command != 'scrape' and extra:
+        parser.error(f"unrecognized arguments: {' '.join(extra)}")
+    configure_logging()
+    if args.command == 'scrape':
+        return run_scrape(extra)
+    if args.command == 'validate':
+        return run_validate(args)
+    if args.command == 'upload':
+        return run_upload(args, parser)
+    if args.command == 'history':
+        return run_history(args)
+    if args.command == 'delta':
+        return run_delta(args)
+    if args.command == 'reparse':
+        return run_reparse(args)
+    if args.command == 'cache':
+        return run_cache(args)
+    if args.command == 'catalog':
+        return run_catalog(args)
+    return run_crawl(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,306 @@
+import argparse
+import contextlib
+import glob
+import io
+import json
+import logging
+from tcg_logging import configure_logging
+import os
+import re
+import resource
+import sys
+import tempfile
+import time
+from urllib.parse import urljoin, urlsplit
+from bs4 import BeautifulSoup
+import pandas as pd
+import tcg_scraper_functions as tcg
+import tcg_http_fetcher as fetcher
+from tcg_fixture_server import FixtureServer, FIXTURES_DIR
+from tcg_page_readiness import wait_for_page_ready
+from tcg_url_index import ScrapedUrlIndex
+from tcg_validations import DataFrameValidator
+
+# Get the absolute directory of the current script
+abs_dir = os.path.dirname(os.path.abspath(__file__))
+
+# Get the custom Logger from Configuration File
+logger = logging.getLogger(__name__)
+
+DEFAULT_CORPUS_DIR = os.path.join(abs_dir, '..', 'bench', 'corpus')
+DEFAULT_BASELINE_PATH = os.path.join(abs_dir, '..', 'bench', 'baseline.json')
+
+TILE_SELECTOR = "div.search-result__content > a"
+
+def _product_file(href):
+    # /product/<slug>.html?xid=... and https://www.tcgplayer.com/product/<id>/<slug>?xid=... both map to product/<slug>.html
+    slug = urlsplit(href).path.rstrip('/').rsplit('/', 1)[-1]
+    slug = re.sub(r'\.html$', '', slug)
+    return f'product/{slug}.html'
+
+def record_corpus(driver, page_nums, corpus_dir=DEFAULT_CORPUS_DIR):
+    """
+    Saves real search and product pages as a replayable corpus. Needs network access and is only run once.
+
+    Every search page is saved as search-<page>.html with its tile links rewritten to the saved
+    product pages, and every product page, after its JavaScript has run, as product/<slug>.html.
+
+    Args:
+        driver: The WebDriver instance.
+        page_nums (list): The search pages to record.
+        corpus_dir (str): Directory the pages are saved in.
+
+    Returns:
+        int: The number of product pages saved.
+    """
+    os.makedirs(os.path.join(corpus_dir, 'product'), exist_ok=True)
+    saved = 0
+    for page in page_nums:
+        elements = tcg.download_elements_from_webpage(driver, tcg.build_search_url(page))
+        links = tcg.get_product_links(elements)
+        soup = BeautifulSoup(driver.page_source, 'html.parser')
+        for tile in soup.select(TILE_SELECTOR):
+            tile['href'] = '/' + _product_file(tile.get('href', '')) + '?xid=replay'
+        with open(os.path.join(corpus_dir, f'search-{page}.html'), 'w', encoding='utf-8') as file:
+            file.write(str(soup))
+
+        for link in links:
+            driver.get(link)
+            wait_for_page_ready(driver)
+            with open(os.path.join(corpus_dir, _product_file(link)), 'w', encoding='utf-8') as file:
+                file.write(driver.page_source)
+            saved += 1
+        logger.info(f"Recorded search page {page} and {len(links)} product page(s) into {corpus_dir}.")
+    return saved
+
+class StageTimer:
+    """
+    Collects the latency of every occurrence of each benchmark stage.
+    """
+    def __init__(self):
+        self.durations = {}
+
+    def record(self, stage, duration):
+        self.durations.setdefault(stage, []).append(duration)
+
+    def summary(self):
+        """
+        Returns the count and p50/p95/p99/max in milliseconds of every stage.
+        """
+        summary = {}
+        for stage, durations in self.durations.items():
+            durations = sorted(durations)
+
+            def percentile(p):
+                return round(1000 * durations[min(len(durations) - 1, int(p * len(durations)))], 3)
+
+            summary[stage] = {'count': len(durations), 'p50': percentile(0.5), 'p95': percentile(0.95),
+                              'p99': percentile(0.99), 'max': round(1000 * durations[-1], 3)}
+        return summary
+
+class _ReplayElement:
+    def __init__(self, driver, tag):
+        self.driver = driver
+        self.tag = tag
+
+    def get_attribute(self, name):
+        value = self.tag.get(name)
+        return urljoin(self.driver.current_url, value) if name == 'href' and value is not None else value
+
+    def click(self):
+        self.driver.get(self.get_attribute('href'))
+
+class ReplayDriver:
+    """
+    Stand-in for the Chrome driver that serves the pages of a recorded corpus from disk.
+
+    It implements what get_card_data() and download_elements_from_webpage() use: get(), back(),
+    find_elements() by CSS selector, page_source and current_url. The time from opening a
+    product page to leaving it again is recorded as the 'product_page' stage.
+    """
+    def __init__(self, corpus_dir, timer=None):
+        self.corpus_dir = corpus_dir
+        self.timer = timer
+        self.history = []
+        self.pages = {}
+        self.soup = None
+        self.opened_at = None
+
+    @property
+    def current_url(self):
+        return self.history[-1] if self.history else 'http://replay/'
+
+    @property
+    def page_source(self):
+        return self._html(self.current_url)
+
+    def _html(self, url):
+        path = urlsplit(url).path.lstrip('/')
+        if path not in self.pages:
+            with open(os.path.join(self.corpus_dir, path), encoding='utf-8') as file:
+                self.pages[path] = file.read()
+        return self.pages[path]
+
+    def _load(self):
+        self.soup = BeautifulSoup(self.page_source, 'html.parser')
+        if '/product/' in self.current_url:
+            self.opened_at = time.perf_counter()
+
+    def get(self, url):
+        self.history.append(urljoin('http://replay/', url))
+        self._load()
+
+    def back(self):
+        if self.opened_at is not None and self.timer is not None:
+            self.timer.record('product_page', time.perf_counter() - self.opened_at)
+        self.opened_at = None
+        self.history.pop()
+        self._load()
+
+    def find_elements(self, by, value):
+        return [_ReplayElement(self, tag) for tag in self.soup.select(value)]
+
+    def quit(self):
+        pass
+
+def search_pages(corpus_dir):
+    """
+    Returns the search pages of a corpus, relative to corpus_dir.
+    """
+    return sorted(os.path.relpath(path, corpus_dir) for path in glob.glob(os.path.join(corpus_dir, 'search*.html')))
+
+def run_replay(corpus_dir=FIXTURES_DIR, repeat=1, http=False, latency=0.0):
+    """
+    Replays a recorded corpus through the scraping, writing and validation stages and measures them.
+
+    Args:
+        corpus_dir (str): Directory of the recorded corpus. Defaults to the unit test fixtures.
+        repeat (int): How many times the whole corpus is replayed.
+        http (bool): Serve the corpus from a local HTTP server and fetch the product pages over
+            HTTP instead of clicking through them with a replay driver.
+        latency (float): Seconds the local HTTP server waits before answering, in http mode.
+
+    Returns:
+        dict: cards, seconds, cards_per_sec, peak_rss_mb and the latency percentiles of every stage.
+    """
+    timer = StageTimer()
+    pages = search_pages(corpus_dir)
+    cards = 0
+    date = '2000-01-01'
+    # get_card_data() and DataFrameValidator print as they go, keep that out of the report
+    with tempfile.TemporaryDirectory() as temp_dir, FixtureServer(corpus_dir, latency=latency) as server, \
+            contextlib.redirect_stdout(io.StringIO()):
+        session = fetcher.create_session() if http else None
+        start = time.perf_counter()
+        for run in range(repeat):
+            data_file_path = os.path.join(temp_dir, f'optcg_data_{run}.csv')
+            url_index = ScrapedUrlIndex(os.path.join(temp_dir, f'card_link_list_{run}.csv'))
+            driver = ReplayDriver(corpus_dir, timer)
+            for page in pages:
+                stage_start = time.perf_counter()
+                if http:
+                    links = fetcher.fetch_product_links(session, server.url(page))
+                else:
+                    elements = tcg.download_elements_from_webpage(driver, page)
+                timer.record('search_page', time.perf_counter() - stage_start)
+
+                stage_start = time.perf_counter()
+                if http:
+                    card_data, urls = fetcher.fetch_card_data(links, date, session=session)
+                else:
+                    card_data, urls = tcg.get_card_data(elements, driver, date, url_index=url_index)
+                timer.record('get_card_data', time.perf_counter() - stage_start)
+
+                stage_start = time.perf_counter()
+                if card_data:
+                    tcg.write_csv(data_file_path, card_data)
+                timer.record('write_csv', time.perf_counter() - stage_start)
+                cards += len(card_data)
+
+            stage_start = time.perf_counter()
+            validator = DataFrameValidator(pd.read_csv(data_file_path))
+            validator.df_show_schema()
+            validator.validate_lowest_price()
+            validator.check_for_dupes()
+            validator.count_nulls()
+            validator.row_count()
+            timer.record('validate', time.perf_counter() - stage_start)
+        seconds = time.perf_counter() - start
+
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+    results = {
+        'mode': 'http' if http else 'driver',
+        'cards': cards,
+        'seconds': round(seconds, 3),
+        'cards_per_sec': round(cards / seconds, 2) if seconds else 0.0,
+        'peak_rss_mb': round(peak_rss, 1),
+        'stages': timer.summary(),
+    }
+    logger.info(f"Replay benchmark: {results}")
+    return results
+
+def compare_to_baseline(results, baseline, tolerance=0.2):
+    """
+    Lists the metrics that got worse than the baseline by more than tolerance.
+
+    Args:
+        results (dict): The results of run_replay().
+        baseline (dict): Earlier results of run_replay() in the same mode.
+        tolerance (float): Allowed relative slow down, 0.2 is 20%.
+
+    Returns:
+        list: A message for every regression. Empty if there is none.
+    """
+    regressions = []
+    if results['cards_per_sec'] < baseline['cards_per_sec'] * (1 - tolerance):
+        regressions.append(f"cards_per_sec dropped from {baseline['cards_per_sec']} to {results['cards_per_sec']}")
+    for stage, stats in results['stages'].items():
+        before = baseline.get('stages', {}).get(stage)
+        if before and stats['p95'] > before['p95'] * (1 + tolerance):
+            regressions.append(f"{stage} p95 went from {before['p95']} ms to {stats['p95']} ms")
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Record a corpus of tcgplayer.com pages once, then replay it to measure throughput.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    record = subparsers.add_parser('record', help="Save real search and product pages into the corpus (needs network access).")
+    record.add_argument('--pages', type=int, default=1, help="Number of search pages to record, starting at page 1.")
+    record.add_argument('--corpus', default=DEFAULT_CORPUS_DIR, help="Directory the pages are saved in.")
+    replay = subparsers.add_parser('replay', help="Replay the corpus and report cards/sec, stage latencies and peak memory.")
+    replay.add_argument('--corpus', default=FIXTURES_DIR, help="Directory of the recorded corpus.")
+    replay.add_argument('--repeat', type=int, default=10, help="How many times the corpus is replayed.")
+    replay.add_argument('--http', action='store_true', help="Fetch the pages from a local HTTP server instead of a replay driver.")
+    replay.add_argument('--latency', type=float, default=0.0, help="Seconds the local HTTP server waits before answering.")
+    replay.add_argument('--baseline', default=DEFAULT_BASELINE_PATH, help="Baseline file to compare with.")
+    replay.add_argument('--save-baseline', action='store_true', help="Store the results as the new baseline.")
+    replay.add_argument('--tolerance', type=float, default=0.2, help="Allowed relative slow down before a metric counts as a regression.")
+    args = parser.parse_args()
+    configure_logging()
+
+    if args.command == 'record':
+        driver = tcg.create_driver()
+        try:
+            print(f"{record_corpus(driver, range(1, args.pages + 1), args.corpus)} product page(s) recorded.")
+        finally:
+            driver.quit()
+        sys.exit(0)
+
+    results = run_replay(args.corpus, repeat=args.repeat, http=args.http, latency=args.latency)
+    print(json.dumps(results, indent=2))
+
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            baselines = json.load(file)
+    if args.save_baseline:
+        baselines[results['mode']] = results
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, 'w') as file:
+            json.dump(baselines, file, indent=2)
+        print(f"Baseline saved to {args.baseline}.")
+    elif results['mode'] in baselines:
+        regressions = compare_to_baseline(results, baselines[results['mode']], args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,222 @@
+import csv
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import tcg_data_preprocessing as pp
+from tcg_price_history import PRICE_COLUMNS, card_key, _type_list
+from tcg_row_sink import read_csv_rows
+
+# Get the absolute directory of the current script
+abs_dir = os.path.dirname(os.path.abspath(__file__))
+
+# Get the custom Logger from Configuration File
+logger = logging.getLogger(__name__)
+
+DEFAULT_CATALOG_PATH = os.path.join(abs_dir, '..', 'output', 'card_catalog.db')
+DEFAULT_COMPACT_DIR = os.path.join(abs_dir, '..', 'output', 'compact')
+
+# the columns of a compact daily row, the identity of the card is in the catalog
+COMPACT_COLUMNS = ['card_id', 'date'] + PRICE_COLUMNS
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cards (
+    card_id INTEGER PRIMARY KEY,
+    card_key TEXT NOT NULL UNIQUE,
+    full_product_name TEXT NOT NULL,
+    name TEXT,
+    type TEXT, -- JSON list of the types in the order of the product name
+    "set" TEXT,
+    first_seen TEXT
+);
+"""
+
+def parse_identity(product_name):
+    """
+    Parses the name, type(s) and set of a card from its full product name, like parse_card_html() does.
+
+    Returns:
+        tuple: The card name, the list of card types and the set.
+
+    Raises:
+        IndexError: If the product name has no ' - <set>' part.
+    """
+    product_set = re.split('- ', product_name, maxsplit=1)[1].strip()
+    return pp.get_card_name(product_name), pp.get_card_type(product_name), product_set
+
+def _stored_types(value):
+    # catalogs written before the types were stored as JSON hold them sorted and comma separated
+    if not value:
+        return []
+    return json.loads(value) if value.startswith('[') else value.split(',')
+
+class CardCatalog:
+    """
+    Persistent catalog of every card seen, with a stable integer id and its parsed name, type and set.
+
+    The identity of a product never changes, so identity() parses a full product name once and
+    then returns it from memory, also on later days since the catalog is read back on open. A card
+    gets its card_id the first time card_id() sees it. Ids are never reused and are keyed by
+    card_key(), the identity the price history and the deltas use, because the rows reaching the
+    sinks do not carry their product link. A daily row then only needs (card_id, date, prices),
+    see compact(), which the scraper passes to its CsvRowSink as the transform, and expand()
+    joins the identity back on for the readers of the daily rows, see read_daily_rows().
+
+    Example usage:
+        catalog = set_default_catalog(CardCatalog())
+        card_id = catalog.card_id(row)
+    """
+    def __init__(self, db_path=DEFAULT_CATALOG_PATH):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self.connection = sqlite3.connect(db_path, check_same_thread=False)
+        self.connection.executescript(SCHEMA)
+        self.lock = threading.Lock()
+        self.ids = {}
+        self.cards = {}
+        self.identities = {}
+        for card_id, key, full_product_name, name, card_type, card_set in self.connection.execute(
+                'SELECT card_id, card_key, full_product_name, name, type, "set" FROM cards'):
+            self._remember(card_id, key, full_product_name, name, _stored_types(card_type), card_set)
+        logger.info(f"Loaded {len(self.ids)} card(s) from the catalog {db_path}.")
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _remember(self, card_id, key, full_product_name, name, card_types, card_set):
+        self.ids[key] = card_id
+        self.cards[card_id] = {'full_product_name': full_product_name, 'name': name, 'type': card_types, 'set': card_set}
+        self.identities[full_product_name] = (name, card_types, card_set)
+
+    def identity(self, product_name):
+        """
+        parse_identity() of a full product name, parsed only the first time the name is seen.
+
+        Returns:
+            tuple: The card name, a new list of the card types and the set.
+        """
+        identity = self.identities.get(product_name)
+        if identity is None:
+            # a plain dict is enough, parsing the same name twice in two threads gives the same result
+            identity = self.identities[product_name] = parse_identity(product_name)
+        name, card_types, card_set = identity
+        return name, list(card_types), card_set
+
+    def card_id(self, row):
+        """
+        Returns the id of the card of a row, adding the card to the catalog the first time it is seen.
+
+        Args:
+            row (dict): A card dictionary as written to the daily csv.
+
+        Returns:
+            int: The card_id.
+        """
+        key = card_key(row['full_product_name'], row['set'], row['type'])
+        card_id = self.ids.get(key)
+        if card_id is not None:
+            return card_id
+        with self.lock:
+            if key in self.ids:
+                return self.ids[key]
+            card_types = _type_list(row['type']) # in their order, card_key() sorts them itself
+            with self.connection:
+                card_id = self.connection.execute(
+                    'INSERT INTO cards (card_key, full_product_name, name, type, "set", first_seen) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    (key, row['full_product_name'], row['name'], json.dumps(card_types), row['set'],
+                     row.get('date'))).lastrowid
+            self._remember(card_id, key, row['full_product_name'], row['name'], card_types, row['set'])
+        return card_id
+
+    def compact(self, row):
+        """
+        Returns the compact form of a row: its card_id, date and prices.
+        """
+        compact = {'card_id': self.card_id(row), 'date': row['date']}
+        for column in PRICE_COLUMNS:
+            value = row.get(column)
+            compact[column] = None if value is None or value != value else value
+        return compact
+
+    def expand(self, compact_rows):
+        """
+        Joins the identity of every card back onto compact rows.
+
+        Yields:
+            dict: The rows with the columns of the daily csv.
+
+        Raises:
+            KeyError: If a card_id is not in the catalog.
+        """
+        for row in compact_rows:
+            card = self.cards[int(row['card_id'])]
+            yield {'full_product_name': card['full_product_name'], 'name': card['name'], 'type': str(card['type']),
+                   'set': card['set'], **{column: row.get(column) for column in PRICE_COLUMNS}, 'date': row['date']}
+
+    def expand_csv(self, file_name, chunksize=10000):
+        """
+        expand() over the rows of a compact daily csv, in chunks like read_csv_rows().
+
+        Yields:
+            list: The next chunk of expanded rows.
+        """
+        for chunk in read_csv_rows(file_name, chunksize=chunksize, numeric_columns=PRICE_COLUMNS):
+            yield list(self.expand(chunk))
+
+    def export_csv(self, file_name):
+        """
+        Writes the card_id, full_product_name, name, type and set of every card, for the readers of the compact csv files.
+
+        Returns:
+            int: The number of cards written.
+        """
+        with self.lock:
+            cards = sorted(self.cards.items())
+        os.makedirs(os.path.dirname(os.path.abspath(file_name)), exist_ok=True)
+        with open(file_name, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(['card_id', 'full_product_name', 'name', 'type', 'set'])
+            for card_id, card in cards:
+                writer.writerow([card_id, card['full_product_name'], card['name'], str(card['type']), card['set']])
+        return len(cards)
+
+def read_daily_rows(file_name, catalog=None, chunksize=10000):
+    """
+    Reads a daily csv in chunks of rows with the columns of the daily csv, like read_csv_rows().
+
+    Args:
+        file_name (str): The daily csv, or a compact one when a catalog is given.
+        catalog (CardCatalog, optional): The catalog of the card ids of a compact csv.
+
+    Yields:
+        list: The next chunk of rows.
+    """
+    if catalog is not None:
+        yield from catalog.expand_csv(file_name, chunksize=chunksize)
+    else:
+        yield from read_csv_rows(file_name, chunksize=chunksize)
+
+_default_catalog = None
+
+def set_default_catalog(catalog):
+    """
+    Sets the catalog parse_card_html() takes the identity of the cards from, None to parse it every time.
+    """
+    global _default_catalog
+    _default_catalog = catalog
+    return catalog
+
+def default_catalog():
+    return _default_catalog
@@ -0,0 +1,151 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import tcg_scraper_functions as tcg
+
+# Get the absolute directory of the current script
+abs_dir = os.path.dirname(os.path.abspath(__file__))
+
+# Get the custom Logger from Configuration File
+logger = logging.getLogger(__name__)
+
+DEFAULT_SNAPSHOT_PATH = os.path.join(abs_dir, '..', 'logs', 'card_snapshot.json')
+
+# reads the link and visible text of every tile of the search results grid in one round trip
+TILE_TEXT_SCRIPT = """
+return Array.from(document.querySelectorAll('div.search-result__content > a'))
+    .map(tile => [tile.href, tile.innerText]);
+"""
+
+def tile_fingerprint(text):
+    """
+    Hashes the visible text of a search result tile (name, set, rarity, market price, listings).
+
+    Args:
+        text (str): The text of the tile.
+
+    Returns:
+        str: A hex digest that changes whenever anything shown on the tile changes.
+    """
+    normalized = ' '.join(text.split())
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+
+def get_tile_fingerprints(driver):
+    """
+    Fingerprints every tile of the search results page the driver is on.
+
+    Args:
+        driver: The WebDriver instance, on a search results page.
+
+    Returns:
+        dict: The fingerprint of each tile, keyed by its cleaned product link.
+    """
+    fingerprints = {}
+    for href, text in driver.execute_script(TILE_TEXT_SCRIPT):
+        link = tcg.clean_card_link(href)
+        if link is not None:
+            fingerprints[link] = tile_fingerprint(text)
+    return fingerprints
+
+class SnapshotStore:
+    """
+    The last scraped row and tile fingerprint of every product, stored in logs/card_snapshot.json.
+
+    The snapshot is read once when the run starts and written once by save() when it ends, so
+    the writes do not grow with the number of search pages.
+
+    Example usage:
+        snapshot = SnapshotStore()
+        carried, carried_urls, fingerprints = snapshot.carry_forward(driver, '2024-01-02', url_index)
+        rows = snapshot.record(pairs, fingerprints)
+        snapshot.save()
+    """
+    def __init__(self, file_path=DEFAULT_SNAPSHOT_PATH):
+        self.file_path = file_path
+        self.lock = threading.Lock()
+        self.products = {}
+        self.changed = False
+        if os.path.exists(file_path):
+            with open(file_path) as file:
+                self.products = json.load(file)
+        logger.info(f"Loaded the snapshot of {len(self.products)} product(s) from {file_path}.")
+
+    def __len__(self):
+        return len(self.products)
+
+    def fingerprint(self, link):
+        product = self.products.get(link)
+        return product['fingerprint'] if product else None
+
+    def carry_forward(self, driver, date, url_index):
+        """
+        Carries the rows of unchanged tiles forward from the last snapshot.
+
+        A tile is unchanged when its fingerprint matches the stored one. Its stored row is copied
+        with today's date and an 'unchanged' scrape_status. Once the rows are written, add the
+        returned urls to url_index so get_card_data() skips their product pages.
+
+        Args:
+            driver: The WebDriver instance, on a search results page.
+            date (str): The current date.
+            url_index (ScrapedUrlIndex): Index of the links already scraped.
+
+        Returns:
+            tuple: The carried forward rows, their {'url', 'date'} dictionaries and the fingerprints
+                of the tiles on the page, keyed by link.
+        """
+        fingerprints = get_tile_fingerprints(driver)
+        carried = []
+        with self.lock:
+            for link, fingerprint in fingerprints.items():
+                product = self.products.get(link)
+                if (date, link) in url_index or product is None or product['fingerprint'] != fingerprint:
+                    continue
+                row = dict(product['row'])
+                row['date'] = date
+                row['scrape_status'] = 'unchanged'
+                carried.append((link, row))
+        logger.info(f"{len(carried)} of {len(fingerprints)} tile(s) unchanged since the last snapshot.")
+        return [row for _, row in carried], [{'url': link, 'date': date} for link, _ in carried], fingerprints
+
+    def record(self, pairs, fingerprints):
+        """
+        Marks freshly scraped rows and stores them with their tile fingerprint.
+
+        The rows are only kept in memory, save() writes the snapshot once the run is over.
+
+        Args:
+            pairs (list): (card dictionary, product link) pairs, as iter_card_data() yields them. A
+                card without a link is marked but not stored.
+            fingerprints (dict): The tile fingerprints returned by carry_forward().
+
+        Returns:
+            list: The card dictionaries with a 'scraped' scrape_status.
+        """
+        rows = []
+        with self.lock:
+            for card, link in pairs:
+                row = dict(card, scrape_status='scraped')
+                rows.append(row)
+                fingerprint = fingerprints.get(link) if link is not None else None
+                if fingerprint is not None:
+                    self.products[link] = {'fingerprint': fingerprint, 'row': row}
+                    self.changed = True
+        return rows
+
+    def save(self):
+        """
+        Writes the snapshot to its file if rows were recorded since it was loaded or last saved.
+        """
+        with self.lock:
+            if not self.changed:
+                return
+            temp_path = f'{self.file_path}.tmp'
+            os.makedirs(os.path.dirname(os.path.abspath(self.file_path)), exist_ok=True)
+            with open(temp_path, 'w') as file:
+                json.dump(self.products, file)
+            os.replace(temp_path, self.file_path)
+            self.changed = False
+        logger.info(f"Saved the snapshot of {len(self.products)} product(s) to {self.file_path}.")
@@ -0,0 +1,389 @@
+import csv
+import glob
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import tcg_scraper_functions as tcg
+from tcg_row_sink import CsvRowSink, read_csv_rows
+from tcg_price_history import card_key
+from tcg_scraper_pool import ScraperPool
+from tcg_url_index import ScrapedUrlIndex
+
+# Get the absolute directory of the current script
+abs_dir = os.path.dirname(os.path.abspath(__file__))
+
+# Get the custom Logger from Configuration File
+logger = logging.getLogger(__name__)
+
+DEFAULT_SHARD_DIR = os.path.join(abs_dir, '..', 'output', 'shards')
+DEFAULT_LEASE_DB = os.path.join(DEFAULT_SHARD_DIR, 'leases.db')
+
+PENDING, LEASED, DONE, FAILED = 'pending', 'leased', 'done', 'failed'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    date TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS leases (
+    run_id TEXT NOT NULL REFERENCES runs(run_id),
+    page INTEGER NOT NULL,
+    state TEXT NOT NULL,
+    worker TEXT,
+    expires_at REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (run_id, page)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS leases_state ON leases(run_id, state, expires_at);
+"""
+
+class LeaseStore:
+    """
+    SQLite store of the search pages of sharded runs and the leases workers hold on them.
+
+    A worker claims pages for lease_seconds. A lease that is neither completed nor renewed before
+    it expires, because its worker died or hung, is handed to the next worker that claims, and a
+    page claimed max_attempts times without being completed is marked failed. Claims run in an
+    IMMEDIATE transaction, so any number of processes can share the database file. Workers on
+    other hosts need the file on a shared volume with working file locks, and clocks in sync.
+
+    Example usage:
+        store = LeaseStore()
+        store.create_run('20240101', '2024-01-01', range(1, 101))
+        pages = store.claim('20240101', 'host-1:4242', lease_seconds=900, batch=2)
+    """
+    def __init__(self, db_path=DEFAULT_LEASE_DB, max_attempts=3):
+        self.db_path = db_path
+        self.max_attempts = max_attempts
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        # autocommit mode, every write below opens its own transaction
+        self.connection = sqlite3.connect(db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def _transaction(self, statements):
+        with self.lock:
+            cursor = self.connection.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            try:
+                result = statements(cursor)
+            except Exception:
+                cursor.execute('ROLLBACK')
+                raise
+            cursor.execute('COMMIT')
+            return result
+
+    def _fail_exhausted(self, cursor, run_id, now):
+        # an expired lease that used up its attempts is not handed out again
+        cursor.execute('UPDATE leases SET state = ?, worker = NULL, expires_at = NULL '
+                       'WHERE run_id = ? AND state = ? AND expires_at < ? AND attempts >= ?',
+                       (FAILED, run_id, LEASED, now, self.max_attempts))
+
+    def create_run(self, run_id, date, page_nums):
+        """
+        Stores the pages of a run as pending. Pages already stored for the run keep their state.
+        """
+        page_nums = list(page_nums)
+        def statements(cursor):
+            cursor.execute('INSERT OR IGNORE INTO runs VALUES (?, ?, ?)', (run_id, date, time.time()))
+            cursor.executemany('INSERT OR IGNORE INTO leases (run_id, page, state) VALUES (?, ?, ?)',
+                               [(run_id, page, PENDING) for page in page_nums])
+        self._transaction(statements)
+        logger.info(f"Run {run_id} of {date} planned with {len(page_nums)} page(s).")
+
+    def run_date(self, run_id):
+        with self.lock:
+            row = self.connection.execute('SELECT date FROM runs WHERE run_id = ?', (run_id,)).fetchone()
+        if row is None:
+            raise ValueError(f"Run {run_id} was not planned.")
+        return row[0]
+
+    def claim(self, run_id, worker, lease_seconds=900, batch=1):
+        """
+        Leases up to batch pending or expired pages to worker.
+
+        Returns:
+            list: The leased page numbers, empty if no page is available right now.
+        """
+        def statements(cursor):
+            now = time.time()
+            self._fail_exhausted(cursor, run_id, now)
+            pages = [row[0] for row in cursor.execute(
+                'SELECT page FROM leases WHERE run_id = ? AND (state = ? OR (state = ? AND expires_at < ?)) '
+                'ORDER BY page LIMIT ?', (run_id, PENDING, LEASED, now, batch))]
+            cursor.executemany('UPDATE leases SET state = ?, worker = ?, expires_at = ?, attempts = attempts + 1 '
+                               'WHERE run_id = ? AND page = ?',
+                               [(LEASED, worker, now + lease_seconds, run_id, page) for page in pages])
+            return pages
+        pages = self._transaction(statements)
+        if pages:
+            logger.info(f"Worker {worker} leased page(s) {pages} of run {run_id}.")
+        return pages
+
+    def renew(self, run_id, page, worker, lease_seconds=900):
+        """
+        Extends the lease of worker on a page.
+
+        Returns:
+            bool: False if the lease expired and went to another worker.
+        """
+        return self._transaction(lambda cursor: cursor.execute(
+            'UPDATE leases SET expires_at = ? WHERE run_id = ? AND page = ? AND state = ? AND worker = ?',
+            (time.time() + lease_seconds, run_id, page, LEASED, worker)).rowcount == 1)
+
+    def complete(self, run_id, page, worker):
+        """
+        Marks a page leased to worker as done.
+
+        Returns:
+            bool: False if the lease had gone to another worker. The rows are kept anyway, the
+                merge drops the duplicates.
+        """
+        return self._transaction(lambda cursor: cursor.execute(
+            'UPDATE leases SET state = ?, expires_at = NULL WHERE run_id = ? AND page = ? AND state = ? AND worker = ?',
+            (DONE, run_id, page, LEASED, worker)).rowcount == 1)
+
+    def release(self, run_id, page, worker):
+        """
+        Gives a page leased to worker back to the other workers, or marks it failed once it used up its attempts.
+        """
+        def statements(cursor):
+            cursor.execute('UPDATE leases SET state = CASE WHEN attempts >= ? THEN ? ELSE ? END, worker = NULL, '
+                           'expires_at = NULL WHERE run_id = ? AND page = ? AND state = ? AND worker = ?',
+                           (self.max_attempts, FAILED, PENDING, run_id, page, LEASED, worker))
+        self._transaction(statements)
+
+    def status(self, run_id):
+        """
+        Returns the number of pages of a run in every state.
+        """
+        def statements(cursor):
+            self._fail_exhausted(cursor, run_id, time.time())
+            return cursor.execute('SELECT state, COUNT(*) FROM leases WHERE run_id = ? GROUP BY state',
+                                  (run_id,)).fetchall()
+        counts = dict.fromkeys([PENDING, LEASED, DONE, FAILED], 0)
+        counts.update(self._transaction(statements))
+        return counts
+
+    def is_finished(self, run_id):
+        """
+        True once every page of a run is done or failed.
+        """
+        status = self.status(run_id)
+        return status[PENDING] == 0 and status[LEASED] == 0
+
+def default_worker_id():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+class ShardWorker:
+    """
+    Scrapes the pages it leases from a LeaseStore into a shard file of its own.
+
+    The worker runs a ScraperPool whose threads claim pages from the store whenever their queue
+    runs dry. A heartbeat thread renews the leases of the pages in progress every third of
+    lease_seconds, so a page that takes longer than its lease is not handed to a second worker
+    while this one is alive. Rows go to
+    <shard_dir>/<run_id>/<worker>.csv and the scraped links to a ledger next to it, so workers
+    never write to the same file. Pages that fail are released to the other workers.
+
+    Args:
+        store (LeaseStore): The store of the run.
+        run_id (str): The run to work on.
+        worker_id (str, optional): Name of the worker. Defaults to <hostname>:<pid>.
+        shard_dir (str): Directory the shard files are written to.
+        threads (int): Number of browsers of this worker.
+        lease_seconds (float): How long a page is leased, longer than a page takes to scrape.
+        batch (int): Pages leased per claim.
+        poll_seconds (float): How long to wait before claiming again while other workers hold the remaining pages.
+        driver_factory (callable): Creates the drivers.
+
+    Example usage:
+        ShardWorker(LeaseStore(), '20240101', threads=2).run()
+    """
+    def __init__(self, store, run_id, worker_id=None, shard_dir=DEFAULT_SHARD_DIR, threads=1, lease_seconds=900,
+                 batch=1, poll_seconds=10, driver_factory=tcg.create_driver, **pool_options):
+        self.store = store
+        self.run_id = run_id
+        self.worker_id = worker_id or default_worker_id()
+        self.lease_seconds = lease_seconds
+        self.batch = batch
+        self.poll_seconds = poll_seconds
+        self.date = store.run_date(run_id)
+        self.active = set() # the pages in progress, renewed by the heartbeat
+        self.active_lock = threading.Lock()
+        self.stopped = threading.Event()
+        run_dir = os.path.join(shard_dir, run_id)
+        os.makedirs(run_dir, exist_ok=True)
+        name = self.worker_id.replace(os.sep, '_').replace(':', '_')
+        self.shard_path = os.path.join(run_dir, f'{name}.csv')
+        self.url_index = ScrapedUrlIndex(os.path.join(run_dir, f'{name}.links.csv'))
+        # every attempt at a page is a lease of its own, so the pool does not retry pages itself
+        self.pool = ScraperPool(threads, self.date, self.shard_path, self.url_index, driver_factory=driver_factory,
+                                max_page_attempts=1, manifest=self, page_source=self.claim_pages,
+                                on_page_failed=self.release_page, **pool_options)
+
+    def claim_pages(self):
+        """
+        Leases the next pages, waiting while other workers still hold the last ones. Returns [] once the run is finished.
+        """
+        while True:
+            pages = self.store.claim(self.run_id, self.worker_id, self.lease_seconds, self.batch)
+            with self.active_lock:
+                self.active.update(pages)
+            if pages or self.store.is_finished(self.run_id):
+                return pages
+            time.sleep(self.poll_seconds)
+
+    def _renew(self, page):
+        if not self.store.renew(self.run_id, page, self.worker_id, self.lease_seconds):
+            logger.info(f"Lease on page {page} of run {self.run_id} was lost, scraping it anyway.")
+            return False
+        return True
+
+    def heartbeat(self):
+        """
+        Renews the leases of the pages in progress until the worker stops.
+        """
+        while not self.stopped.wait(self.lease_seconds / 3):
+            with self.active_lock:
+                pages = list(self.active)
+            for page in pages:
+                if not self._renew(page):
+                    with self.active_lock:
+                        self.active.discard(page)
+
+    # the pool reports its progress through the RunManifest methods set_pending and complete_page
+    def set_pending(self, page, links):
+        if self._renew(page):
+            with self.active_lock:
+                self.active.add(page)
+
+    def complete_page(self, page):
+        with self.active_lock:
+            self.active.discard(page)
+        if not self.store.complete(self.run_id, page, self.worker_id):
+            logger.info(f"Page {page} of run {self.run_id} finished after its lease went to another worker.")
+
+    def release_page(self, page, error):
+        with self.active_lock:
+            self.active.discard(page)
+        self.store.release(self.run_id, page, self.worker_id)
+
+    def run(self):
+        """
+        Scrapes leased pages until every page of the run is done or failed.
+
+        Returns:
+            int: The number of rows written to the shard.
+        """
+        logger.info(f"Worker {self.worker_id} joined run {self.run_id}, writing to {self.shard_path}.")
+        heartbeat = threading.Thread(target=self.heartbeat, name='lease-heartbeat', daemon=True)
+        heartbeat.start()
+        try:
+            self.pool.run([])
+        except Exception as e:
+            # the failed pages were released as they failed, other workers may have scraped them since
+            logger.error(f"Worker {self.worker_id} finished with failed page(s): {e}")
+        finally:
+            self.stopped.set()
+            heartbeat.join()
+            self.pool.close()
+        return self.pool.cards_written
+
+def _merge_key(row):
+    # the shards are read as text and the daily file with read_csv_rows(), empty cells compare equal either way
+    return card_key(row['full_product_name'] or '', row['set'] or '', row['type'] or None), row['date']
+
+class Coordinator:
+    """
+    Plans a sharded run and merges the shards of its workers into the daily file.
+
+    Example usage:
+        coordinator = Coordinator(LeaseStore())
+        run_id = coordinator.plan(tcg.get_max_page_number(driver))
+        # start any number of ShardWorker processes, on this or other hosts
+        coordinator.wait(run_id)
+        coordinator.merge(run_id, 'output/optcg_data_20240101.csv')
+    """
+    def __init__(self, store, shard_dir=DEFAULT_SHARD_DIR):
+        self.store = store
+        self.shard_dir = shard_dir
+
+    def plan(self, page_nums, run_id=None, date=None):
+        """
+        Stores the pages of a run. Defaults to a run of today, named after the date.
+
+        Returns:
+            str: The run id.
+        """
+        if run_id is None or date is None:
+            file_date, date_column = tcg.get_todays_date()
+            run_id = run_id or file_date
+            date = date or date_column
+        self.store.create_run(run_id, date, page_nums)
+        return run_id
+
+    def wait(self, run_id, poll_seconds=10, timeout=None):
+        """
+        Blocks until every page of the run is done or failed.
+
+        Returns:
+            dict: The final status of the run.
+
+        Raises:
+            TimeoutError: If the run is not finished after timeout seconds.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.store.is_finished(run_id):
+            if deadline is not None and time.monotonic() > deadline:
+                raise TimeoutError(f"Run {run_id} is not finished: {self.store.status(run_id)}")
+            time.sleep(poll_seconds)
+        return self.store.status(run_id)
+
+    def merge(self, run_id, output_path, url_index=None):
+        """
+        Appends the rows of every shard of a run to the daily file, one row per card and date, and
+        adds the links scraped by the workers to url_index.
+
+        Cards are told apart by card_key() and date. A page scraped by two workers, after its first
+        lease expired, can give a card two rows whose prices differ; the row of the first shard, in
+        file name order, is kept. Cards the daily file already has are not appended again.
+
+        Returns:
+            int: The number of rows appended to the daily file.
+        """
+        run_dir = os.path.join(self.shard_dir, run_id)
+        shards = sorted(path for path in glob.glob(os.path.join(run_dir, '*.csv')) if not path.endswith('.links.csv'))
+        seen = set()
+        if os.path.isfile(output_path):
+            for chunk in read_csv_rows(output_path):
+                seen.update(_merge_key(row) for row in chunk)
+        written = 0
+        duplicates = 0
+        with CsvRowSink(output_path) as sink:
+            for shard in shards:
+                rows = []
+                with open(shard, newline='') as file:
+                    for row in csv.DictReader(file):
+                        key = _merge_key(row)
+                        if key in seen:
+                            duplicates += 1
+                            continue
+                        seen.add(key)
+                        rows.append(row)
+                written += sink.write(rows)
+        if url_index is not None:
+            for ledger in glob.glob(os.path.join(run_dir, '*.links.csv')):
+                url_index.add_many([{'date': date, 'url': url} for date, url in sorted(ScrapedUrlIndex(ledger).keys)])
+        status = self.store.status(run_id)
+        logger.info(f"Merged {len(shards)} shard(s) of run {run_id} into {output_path}: {written} row(s), "
+                    f"{duplicates} duplicate card(s) dropped. Pages: {status}")
+        return written
@@ -0,0 +1,274 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+# Get the custom Logger from Configuration File
+logger = logging.getLogger(__name__)
+
+# status codes that mean the site wants us to slow down or is temporarily unavailable
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+FetchResult = namedtuple('FetchResult', ['status', 'body', 'retry_after'], defaults=[None])
+
+class CrawlError(Exception):
+    """
+    Raised when a url could not be fetched, either because of a non retryable status
+    or because it still failed after all attempts.
+    """
+    def __init__(self, url, status, message):
+        super().__init__(f"{message} (status {status}) for {url}")
+        self.url = url
+        self.status = status
+
+class TokenBucket:
+    """
+    Token bucket allowing `rate` requests per second with bursts of up to `capacity` requests.
+    """
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        while True:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class HostLimiter:
+    """
+    Rate limit of a single host that adapts to how the host responds.
+
+    The rate grows additively after every successful request, up to max_rate, and is halved
+    whenever the host throttles us. A throttled host is paused for the backoff delay so that
+    every request to it waits, not only the one being retried.
+    """
+    def __init__(self, rate, burst, min_rate):
+        self.max_rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.bucket = TokenBucket(rate, burst)
+        self.paused_until = 0.0
+
+    @property
+    def rate(self):
+        return self.bucket.rate
+
+    async def acquire(self):
+        delay = self.paused_until - time.monotonic()
+        while delay > 0:
+            await asyncio.sleep(delay)
+            delay = self.paused_until - time.monotonic()
+        await self.bucket.acquire()
+
+    def on_success(self):
+        self.bucket.rate = min(self.max_rate, self.bucket.rate + self.max_rate * 0.05)
+
+    def on_throttle(self, delay):
+        self.bucket.rate = max(self.min_rate, self.bucket.rate / 2)
+        self.paused_until = max(self.paused_until, time.monotonic() + delay)
+
+class CrawlMetrics:
+    """
+    Throughput counters of a CrawlScheduler.
+    """
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.requests = 0
+        self.successes = 0
+        self.failures = 0
+        self.retries = 0
+        self.throttled = 0
+        self.timeouts = 0
+        self.bytes = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.total_latency = 0.0
+
+    def snapshot(self):
+        """
+        Returns the current counters together with the derived throughput figures.
+        """
+        elapsed = time.monotonic() - self.started_at
+        return {
+            'elapsed_seconds': round(elapsed, 3),
+            'requests': self.requests,
+            'successes': self.successes,
+            'failures': self.failures,
+            'retries': self.retries,
+            'throttled': self.throttled,
+            'timeouts': self.timeouts,
+            'bytes': self.bytes,
+            'peak_in_flight': self.peak_in_flight,
+            'requests_per_second': round(self.requests / elapsed, 3) if elapsed else 0.0,
+            'mean_latency_seconds': round(self.total_latency / self.requests, 3) if self.requests else 0.0,
+        }
+
+class CrawlScheduler:
+    """
+    Central scheduler every page and product fetch of the scraper goes through.
+
+    Fetches run on an asyncio event loop in a background thread, so any thread (the main
+    loop or the scraper pool workers) can submit urls. The scheduler enforces a token bucket
+    rate per host, caps the number of requests in flight and backs off adaptively when a host
+    answers with 429/5xx or times out.
+
+    Args:
+        fetch: Callable taking a url and returning a FetchResult. It may block, it runs in a thread pool.
+            It should raise TimeoutError or ConnectionError for failures worth retrying.
+        rate (float): Maximum requests per second per host.
+        burst (int): Number of requests a host may receive back to back.
+        max_in_flight (int): Maximum number of requests in flight over all hosts.
+        max_attempts (int): Number of attempts per url before giving up.
+        min_rate (float): Lowest rate the adaptive backoff may lower a host to.
+        backoff_base (float): Seconds of the first backoff, doubled on every further attempt.
+        max_backoff (float): Upper bound of a single backoff in seconds.
+
+    Example usage:
+        with CrawlScheduler(fetch, rate=2.0) as scheduler:
+            pages = scheduler.fetch_all(urls)
+            logger.info(scheduler.metrics.snapshot())
+    """
+    def __init__(self, fetch, rate=2.0, burst=4, max_in_flight=8, max_attempts=4, min_rate=0.2,
+                 backoff_base=1.0, max_backoff=60.0):
+        self.fetch = fetch
+        self.rate = rate
+        self.burst = burst
+        self.max_in_flight = max_in_flight
+        self.max_attempts = max_attempts
+        self.min_rate = min_rate
+        self.backoff_base = backoff_base
+        self.max_backoff = max_backoff
+        self.metrics = CrawlMetrics()
+        self.hosts = {}
+        self.loop = None
+        self.thread = None
+        self.executor = None
+        self.semaphore = None
+
+    def start(self):
+        self.loop = asyncio.new_event_loop()
+        self.executor = ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix='crawl-fetch')
+        self.thread = threading.Thread(target=self.loop.run_forever, name='crawl-scheduler', daemon=True)
+        self.thread.start()
+        asyncio.run_coroutine_threadsafe(self._create_semaphore(), self.loop).result()
+        logger.info(f"Crawl scheduler started at {self.rate} request(s)/s per host, {self.max_in_flight} in flight.")
+        return self
+
+    def stop(self):
+        if self.loop is None:
+            return
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+        self.executor.shutdown(wait=True)
+        self.loop = None
+        logger.info(f"Crawl scheduler stopped. Metrics: {self.metrics.snapshot()}")
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def submit(self, url):
+        """
+        Schedules a fetch of url.
+
+        Returns:
+            concurrent.futures.Future: Resolves to the response body, or raises CrawlError.
+        """
+        if self.loop is None:
+            raise RuntimeError("The crawl scheduler has not been started.")
+        return asyncio.run_coroutine_threadsafe(self._fetch(url), self.loop)
+
+    def fetch_all(self, urls):
+        """
+        Fetches every url and waits for all of them.
+
+        Returns:
+            list: The response body of each url, or the exception it failed with, in the order of urls.
+        """
+        futures = [self.submit(url) for url in urls]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append(e)
+        return results
+
+    def host_rates(self):
+        """
+        Returns the current adaptive request rate of every host seen so far.
+        """
+        return {host: round(limiter.rate, 3) for host, limiter in self.hosts.items()}
+
+    async def _create_semaphore(self):
+        self.semaphore = asyncio.Semaphore(self.max_in_flight)
+
+    def _limiter(self, url):
+        host = urlsplit(url).netloc
+        if host not in self.hosts:
+            self.hosts[host] = HostLimiter(self.rate, self.burst, self.min_rate)
+        return self.hosts[host]
+
+    def _backoff(self, attempt, retry_after):
+        if retry_after is not None:
+            return min(self.max_backoff, retry_after)
+        return min(self.max_backoff, self.backoff_base * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+
+    async def _fetch(self, url):
+        limiter = self._limiter(url)
+        status = None
+        for attempt in range(1, self.max_attempts + 1):
+            await limiter.acquire()
+            async with self.semaphore:
+                self.metrics.requests += 1
+                self.metrics.in_flight += 1
+                self.metrics.peak_in_flight = max(self.metrics.peak_in_flight, self.metrics.in_flight)
+                start = time.monotonic()
+                try:
+                    result = await self.loop.run_in_executor(self.executor, self.fetch, url)
+                except (TimeoutError, ConnectionError) as e:
+                    result = None
+                    self.metrics.timeouts += 1
+                    logger.info(f"Attempt {attempt} timed out for {url}: {e}")
+                finally:
+                    self.metrics.in_flight -= 1
+                    self.metrics.total_latency += time.monotonic() - start
+
+            if result is not None and result.status < 400:
+                limiter.on_success()
+                self.metrics.successes += 1
+                self.metrics.bytes += len(result.body)
+                return result.body
+
+            status = result.status if result is not None else None
+            if result is not None and result.status not in RETRY_STATUSES:
+                self.metrics.failures += 1
+                raise CrawlError(url, status, "Non retryable response")
+
+            if result is not None:
+                self.metrics.throttled += 1
+            delay = self._backoff(attempt, result.retry_after if result is not None else None)
+            limiter.on_throttle(delay)
+            if attempt < self.max_attempts:
+                self.metrics.retries += 1
+                logger.info(f"Backing off {delay:.2f} seconds on {urlsplit(url).netloc} after attempt {attempt} (status {status}).")
+
+        self.metrics.failures += 1
+        logger.error(f"Giving up on {url} after {self.max_attempts} attempt(s).")
+        raise CrawlError(url, status, f"Failed after {self.max_attempts} attempt(s)")
@@ -1,19 +1,20 @@
 import re 
 import logging
-import logging.config
-import numpy as np
-import os
+from tcg_metrics import timed
 
-# Get the absolute directory of the current script
-abs_dir = os.path.dirname(os.path.abspath(__file__))
+# Get the custom Logger from Configuration File
+logger = logging.getLogger(__name__)
 
-# Construct the absolute path to the logging configuration file
-logging_config_path = os.path.join(abs_dir, '..', 'util', 'logging_to_file.conf')
+CARD_TYPES = ['Alternate Art', 'Parallel', 'Box Topper', 'Promotion Pack', 
+              'Store Championship Participation Pack', 'Tournament Pack Vol.', 'Winner Pack Vol.', 'Manga']
 
-logging.config.fileConfig(fname=logging_config_path)
+# precompiled patterns shared by the scalar and batch functions
+PARENTHESES_PATTERN = re.compile(r'\((.*?)\)')
+CARD_TYPE_PATTERN = re.compile('|'.join(re.escape(card_type) for card_type in CARD_TYPES))
+CARD_NAME_END_PATTERN = re.compile(r'\(|- ')
 
-# Get the custom Logger from Configuration File
-logger = logging.getLogger(__name__)
+# the missing value pandas reads back from the csv, without importing numpy for it
+NAN = float('nan')
 
 def convert_to_number(s):
     """
@@ -28,9 +29,9 @@ def convert_to_number(s):
     s = s.replace("$", "")
     try:
         value = float(s)
-        logger.info(f'Successfully ran convert_to_number, resulting in {s} as the value')
+        logger.debug('Successfully ran convert_to_number, resulting in %s as the value', s)
     except ValueError:
-        value = np.nan
+        value = NAN
     except Exception as e:
         logger.error(f'Error in the method convert_to_number(): {e}')
         raise e
@@ -64,7 +65,7 @@ def get_card_name(s):
         # If neither '-' nor '(' is found
         else:
             s = s.strip()
-        logging.info(f"Successfully extracted card name: {s}")
+        logger.debug("Successfully extracted card name: %s", s)
     except Exception as e:
         logging.error(f"There was an issue with method get_card_name(): {e}")
         raise e
@@ -86,16 +87,118 @@ def get_card_type(s):
         list: A list of all matched card types. The list is empty if no card types were found.
     """
     try:
-        matches = re.findall(r'\((.*?)\)', s)
-        card_type_list = ['Alternate Art', 'Parallel', 'Box Topper', 'Promotion Pack', 
-                        'Store Championship Participation Pack', 'Tournament Pack Vol.', 'Winner Pack Vol.', 'Manga']
+        matches = PARENTHESES_PATTERN.findall(s)
         
         matched_items = []
         for match in matches:
-            if any(item in match for item in card_type_list):
+            if CARD_TYPE_PATTERN.search(match):
                 matched_items.append(match)
-        logging.info(f"Successfully extracted card type(s): {matched_items}")
+        logger.debug("Successfully extracted card type(s): %s", matched_items)
     except Exception as e:
         logging.error(f"There was an issue with method get_card_type(): {e}")
     else:
-        return matched_items
\ No newline at end of file
+        return matched_items
+
+def _map_distinct(values, function):
+    """
+    Applies function once to every distinct value and spreads the results back over every value.
+
+    The snapshots of a backfill repeat the same product names and prices day after day, so
+    pd.factorize() finds the distinct values in one vectorized pass and the results are taken
+    back by their codes with a single NumPy take. Missing values (None, NaN) give None.
+
+    Returns:
+        tuple: The results as an object pd.Series, with the index of values if it is a Series,
+            and the number of distinct values.
+    """
+    # pandas is only needed by the batch functions, so the scalar ones load without it
+    import numpy as np
+    import pandas as pd
+    series = pd.Series(values, dtype=object)
+    codes, distinct = pd.factorize(series)
+    results = np.empty(len(distinct) + 1, dtype=object) # the last slot stays None, code -1 is a missing value
+    for position, value in enumerate(distinct):
+        results[position] = function(value)
+    return pd.Series(results[codes], index=series.index, dtype=object), len(distinct)
+
+def _to_number(s):
+    # convert_to_number() without the per call logging, None where it fails like the scalar function
+    try:
+        return float(s.replace("$", ""))
+    except ValueError:
+        return None
+
+def _card_name(s):
+    # get_card_name(): the text before the first '(' or '- ', whichever comes first
+    return CARD_NAME_END_PATTERN.split(s, maxsplit=1)[0].strip()
+
+def _card_type(s):
+    return [match for match in PARENTHESES_PATTERN.findall(s) if CARD_TYPE_PATTERN.search(match)]
+
+@timed('preprocess')
+def convert_to_number_batch(values):
+    """
+    Batch version of convert_to_number() for pandas Series or NumPy arrays of currency strings.
+
+    Every distinct string is converted once, see _map_distinct().
+
+    Parameters:
+        values (pd.Series or np.ndarray): The currency strings to convert.
+
+    Returns:
+        pd.Series: The converted currencies as floats, None where the conversion failed, like convert_to_number().
+    """
+    try:
+        numbers, distinct = _map_distinct(values, _to_number)
+        logger.info(f"Successfully ran convert_to_number_batch on {len(numbers)} value(s) ({distinct} distinct), "
+                    f"{int(numbers.isna().sum())} could not be converted")
+    except Exception as e:
+        logger.error(f'Error in the method convert_to_number_batch(): {e}')
+        raise e
+    else:
+        return numbers
+
+@timed('preprocess')
+def get_card_name_batch(values):
+    """
+    Batch version of get_card_name() for pandas Series or NumPy arrays of full card names.
+
+    Every distinct name is parsed once, see _map_distinct().
+
+    Parameters:
+        values (pd.Series or np.ndarray): The strings containing the full card names.
+
+    Returns:
+        pd.Series: The extracted card names.
+    """
+    try:
+        names, distinct = _map_distinct(values, _card_name)
+        logger.info(f"Successfully extracted {len(names)} card name(s) ({distinct} distinct)")
+    except Exception as e:
+        logger.error(f"There was an issue with method get_card_name_batch(): {e}")
+        raise e
+    else:
+        return names
+
+@timed('preprocess')
+def get_card_type_batch(values):
+    """
+    Batch version of get_card_type() for pandas Series or NumPy arrays of full card names.
+
+    Every distinct name is parsed once, see _map_distinct(), so the cards of the same product
+    share one list of types.
+
+    Parameters:
+        values (pd.Series or np.ndarray): The strings containing the full card names and type(s).
+
+    Returns:
+        pd.Series: A list of all matched card types for each string, None for a missing name like get_card_type().
+    """
+    try:
+        card_types, distinct = _map_distinct(values, _card_type)
+        logger.info(f"Successfully extracted card type(s) for {len(card_types)} card(s) ({distinct} distinct)")
+    except Exception as e:
+        logger.error(f"There was an issue with method get_card_type_batch(): {e}")
+        raise e
+    else:
+        return card_types
@@ -0,0 +1,259 @@
+import csv
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+from tcg_price_history import PRICE_COLUMNS, card_key
+from tcg_row_sink import read_csv_rows
+
+# Get the absolute directory of the current script
+abs_dir = os.path.dirname(os.path.abspath(__file__))
+
+# Get the custom Logger from Configuration File
+logger = logging.getLogger(__name__)
+
+DEFAULT_DELTA_DIR = os.path.join(abs_dir, '..', 'output', 'deltas')
+
+# the columns the loader keeps for every card, the date is the date of the last change
+STATE_COLUMNS = ['full_product_name', 'name', 'type', 'set'] + PRICE_COLUMNS
+DELTA_COLUMNS = ['op', 'card_key'] + STATE_COLUMNS + ['date']
+
+INSERT, UPDATE, DELETE = 'insert', 'update', 'delete'
+
+def _state_value(column, value):
+    # the value as the csv and the loader store it, so rows of either side compare equal
+    if value is None or value == '' or (isinstance(value, float) and value != value):
+        return None
+    if column in PRICE_COLUMNS:
+        return float(value)
+    return str(value)
+
+def state_row(row):
+    """
+    Returns the STATE_COLUMNS of a card row, normalized.
+    """
+    return {column: _state_value(column, row.get(column)) for column in STATE_COLUMNS}
+
+def snapshot_checksum(snapshot):
+    """
+    Order independent checksum of a full snapshot, keyed by card_key().
+
+    The publisher and the loader compute it the same way, so the loader can check that a delta
+    applies to the state it has and that it reached the state the delta was computed for.
+    """
+    digest = hashlib.sha256()
+    for key in sorted(snapshot):
+        row = snapshot[key]
+        digest.update(json.dumps([key] + [row.get(column) for column in STATE_COLUMNS]).encode('utf-8'))
+    return digest.hexdigest()
+
+def compute_delta(previous, current):
+    """
+    Diffs two snapshots keyed by card_key().
+
+    Args:
+        previous (dict): The state row of every card of the last published snapshot.
+        current (dict): The state row of every card of today.
+
+    Returns:
+        tuple: The keys of the cards that are new, whose row changed and that were delisted.
+    """
+    inserts = [key for key in current if key not in previous]
+    updates = [key for key in current if key in previous and current[key] != previous[key]]
+    deletes = [key for key in previous if key not in current]
+    return inserts, updates, deletes
+
+class DeltaPublisher:
+    """
+    Publishes the daily rows as a delta of the last published snapshot instead of as a full csv.
+
+    prepare() writes delta_<date>_<sequence>.csv, one row per inserted, updated or delisted card
+    with an op column, and its manifest delta_<date>_<sequence>.json. The manifest holds the
+    sequence number and the checksums of the snapshot the delta applies to and of the snapshot
+    it produces, so a loader can apply the chain in order and detect a missing link. Once the
+    files are published, commit() makes today's rows the snapshot the next delta is computed
+    from; a delta that was never published is computed again against the same base next time.
+
+    Args:
+        delta_dir (str): Directory the deltas, manifests and the published snapshot are kept in.
+        max_delete_ratio (float): Refuse a delta delisting more than this share of the published
+            cards, which points to an incomplete scrape rather than to delistings.
+
+    Example usage:
+        publisher = DeltaPublisher()
+        manifest = publisher.prepare(rows, '2024-01-02')
+        upload_file(manifest['delta_path'], bucket)
+        upload_file(manifest['manifest_path'], bucket)
+        publisher.commit(manifest)
+    """
+    def __init__(self, delta_dir=DEFAULT_DELTA_DIR, max_delete_ratio=0.5):
+        self.delta_dir = delta_dir
+        self.max_delete_ratio = max_delete_ratio
+        self.snapshot_path = os.path.join(delta_dir, 'published_snapshot.json')
+        self.lock = threading.Lock()
+        self.state = {'sequence': 0, 'checksum': snapshot_checksum({}), 'rows': {}}
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path) as file:
+                self.state = json.load(file)
+        self.pending = None
+        logger.info(f"Loaded the published snapshot {self.state['sequence']} of {len(self.state['rows'])} card(s).")
+
+    def prepare(self, rows, date):
+        """
+        Writes the delta of rows against the published snapshot, and its manifest.
+
+        Args:
+            rows (iterable): Today's validated card dictionaries. A card seen twice keeps its last row.
+            date (str): The date of the rows, formatted as 'YYYY-MM-DD'.
+
+        Returns:
+            dict: The manifest, with the paths of the delta and manifest files under 'delta_path' and 'manifest_path'.
+
+        Raises:
+            ValueError: If the delta would delist more than max_delete_ratio of the published cards.
+        """
+        current = {}
+        for row in rows:
+            current[card_key(row['full_product_name'], row['set'], row['type'])] = state_row(row)
+        previous = self.state['rows']
+        inserts, updates, deletes = compute_delta(previous, current)
+        if previous and len(deletes) > self.max_delete_ratio * len(previous):
+            raise ValueError(f"The delta delists {len(deletes)} of {len(previous)} card(s), "
+                             f"more than {self.max_delete_ratio:.0%}. Is the scrape complete?")
+
+        sequence = self.state['sequence'] + 1
+        name = f"delta_{date.replace('-', '')}_{sequence:05d}"
+        delta_path = os.path.join(self.delta_dir, f'{name}.csv')
+        manifest_path = os.path.join(self.delta_dir, f'{name}.json')
+        os.makedirs(self.delta_dir, exist_ok=True)
+        with open(delta_path, 'w', newline='') as file:
+            writer = csv.DictWriter(file, fieldnames=DELTA_COLUMNS)
+            writer.writeheader()
+            for op, keys in [(INSERT, inserts), (UPDATE, updates)]:
+                for key in keys:
+                    writer.writerow(dict(current[key], op=op, card_key=key, date=date))
+            for key in deletes:
+                writer.writerow({'op': DELETE, 'card_key': key, 'date': date})
+        with open(delta_path, 'rb') as file:
+            delta_sha256 = hashlib.sha256(file.read()).hexdigest()
+
+        manifest = {
+            'sequence': sequence,
+            'date': date,
+            'delta_file': os.path.basename(delta_path),
+            'delta_sha256': delta_sha256,
+            'base_checksum': self.state['checksum'],
+            'checksum': snapshot_checksum(current),
+            'inserts': len(inserts),
+            'updates': len(updates),
+            'deletes': len(deletes),
+            'cards': len(current),
+        }
+        _write_json(manifest_path, manifest)
+        with self.lock:
+            self.pending = (sequence, current)
+        logger.info(f"Delta {sequence} of {date}: {len(inserts)} insert(s), {len(updates)} update(s), "
+                    f"{len(deletes)} delete(s) out of {len(current)} card(s).")
+        return dict(manifest, delta_path=delta_path, manifest_path=manifest_path)
+
+    def prepare_csv(self, file_name, date, chunksize=10000):
+        """
+        prepare() over the rows of a daily csv.
+        """
+        return self.prepare((row for chunk in read_csv_rows(file_name, chunksize=chunksize) for row in chunk), date)
+
+    def commit(self, manifest):
+        """
+        Makes the snapshot of a published delta the base of the next one.
+        """
+        with self.lock:
+            if self.pending is None or self.pending[0] != manifest['sequence']:
+                raise ValueError(f"Delta {manifest['sequence']} was not prepared by this publisher.")
+            self.state = {'sequence': manifest['sequence'], 'checksum': manifest['checksum'], 'rows': self.pending[1]}
+            self.pending = None
+            _write_json(self.snapshot_path, self.state)
+        logger.info(f"Delta {manifest['sequence']} committed as the published snapshot.")
+
+def _write_json(path, data):
+    temp_path = f'{path}.tmp'
+    with open(temp_path, 'w') as file:
+        json.dump(data, file)
+    os.replace(temp_path, path)
+
+class SqliteDeltaLoader:
+    """
+    Stand-in for the downstream loader: applies a chain of deltas to a SQLite cards table.
+
+    Inserts and updates are upserts on card_key and deletes remove the card, all of a delta in one
+    transaction. A delta is refused unless it is the next in the sequence and its base checksum is
+    the checksum of the table, and the table must match the manifest's checksum afterwards. The
+    MySQL loader does the same with INSERT ... ON DUPLICATE KEY UPDATE.
+
+    Example usage:
+        loader = SqliteDeltaLoader('loader.db')
+        loader.apply('output/deltas/delta_20240102_00002.json')
+    """
+    def __init__(self, db_path=':memory:'):
+        self.connection = sqlite3.connect(db_path)
+        columns = ', '.join(f'"{column}" {"REAL" if column in PRICE_COLUMNS else "TEXT"}' for column in STATE_COLUMNS)
+        self.connection.executescript(f"""
+            CREATE TABLE IF NOT EXISTS cards (card_key TEXT PRIMARY KEY, {columns}, date TEXT);
+            CREATE TABLE IF NOT EXISTS delta_state (id INTEGER PRIMARY KEY CHECK (id = 1), sequence INTEGER NOT NULL);
+            INSERT OR IGNORE INTO delta_state VALUES (1, 0);
+        """)
+
+    def close(self):
+        self.connection.close()
+
+    @property
+    def sequence(self):
+        return self.connection.execute('SELECT sequence FROM delta_state').fetchone()[0]
+
+    def snapshot(self):
+        """
+        Returns the state row of every card in the table, keyed by card_key.
+        """
+        quoted = ', '.join(f'"{column}"' for column in STATE_COLUMNS)
+        return {row[0]: dict(zip(STATE_COLUMNS, row[1:]))
+                for row in self.connection.execute(f'SELECT card_key, {quoted} FROM cards')}
+
+    def apply(self, manifest_path):
+        """
+        Applies the delta of a manifest.
+
+        Raises:
+            ValueError: If the delta is out of sequence, corrupt, or does not apply to the table.
+        """
+        with open(manifest_path) as file:
+            manifest = json.load(file)
+        delta_path = os.path.join(os.path.dirname(manifest_path), manifest['delta_file'])
+        with open(delta_path, 'rb') as file:
+            if hashlib.sha256(file.read()).hexdigest() != manifest['delta_sha256']:
+                raise ValueError(f"{delta_path} does not match the checksum of its manifest.")
+        if manifest['sequence'] != self.sequence + 1:
+            raise ValueError(f"Delta {manifest['sequence']} does not follow the loaded delta {self.sequence}.")
+        if manifest['base_checksum'] != snapshot_checksum(self.snapshot()):
+            raise ValueError(f"Delta {manifest['sequence']} was computed against a different snapshot.")
+
+        quoted = ', '.join(f'"{column}"' for column in STATE_COLUMNS)
+        placeholders = ', '.join('?' for _ in STATE_COLUMNS)
+        updates = ', '.join(f'"{column}" = excluded."{column}"' for column in STATE_COLUMNS + ['date'])
+        with self.connection:
+            for chunk in read_csv_rows(delta_path, numeric_columns=PRICE_COLUMNS):
+                for row in chunk:
+                    if row['op'] == DELETE:
+                        self.connection.execute('DELETE FROM cards WHERE card_key = ?', (row['card_key'],))
+                    else:
+                        self.connection.execute(
+                            f'INSERT INTO cards (card_key, {quoted}, date) VALUES (?, {placeholders}, ?) '
+                            f'ON CONFLICT(card_key) DO UPDATE SET {updates}',
+                            [row['card_key']] + [row[column] for column in STATE_COLUMNS] + [row['date']])
+            if snapshot_checksum(self.snapshot()) != manifest['checksum']:
+                # leaving the with block with an exception rolls the delta back
+                raise ValueError(f"Delta {manifest['sequence']} did not reproduce the published snapshot.")
+            self.connection.execute('UPDATE delta_state SET sequence = ?', (manifest['sequence'],))
+        logger.info(f"Delta {manifest['sequence']} applied: {manifest['inserts']} insert(s), "
+                    f"{manifest['updates']} update(s), {manifest['deletes']} delete(s).")
+        return manifest
@@ -0,0 +1,236 @@
+import json
+import logging
+import os
+import threading
+from selenium import webdriver
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.chrome.service import Service
+from webdriver_manager.chrome import ChromeDriverManager
+
+# Get the absolute directory of the current script
+abs_dir = os.path.dirname(os.path.abspath(__file__))
+
+# Get the custom Logger from Configuration File
+logger = logging.getLogger(__name__)
+
+CHROMEDRIVER_VERSION = '114.0.5735.90'
+DEFAULT_CACHE_DIR = os.path.join(abs_dir, '..', 'cache')
+DEFAULT_PROFILE_ROOT = os.path.join(DEFAULT_CACHE_DIR, 'chrome_profiles')
+DEFAULT_DRIVER_PATH_CACHE = os.path.join(DEFAULT_CACHE_DIR, 'chromedriver_path.json')
+
+# resources the scraper never parses: images, fonts and third party tracking
+BLOCKED_URL_PATTERNS = [
+    '*.png', '*.jpg', '*.jpeg', '*.gif', '*.webp', '*.svg', '*.ico',
+    '*.woff', '*.woff2', '*.ttf', '*.otf',
+    '*google-analytics.com*', '*googletagmanager.com*', '*doubleclick.net*', '*facebook.net*',
+    '*hotjar.com*', '*segment.io*', '*newrelic.com*', '*nr-data.net*', '*bing.com*',
+]
+
+_driver_paths = {}
+_driver_paths_lock = threading.Lock()
+
+def resolve_driver_path(version=CHROMEDRIVER_VERSION, cache_path=DEFAULT_DRIVER_PATH_CACHE):
+    """
+    Returns the path of the chromedriver binary, installing it only if no installed binary is known.
+
+    ChromeDriverManager().install() checks for, and possibly downloads, the binary on every call.
+    The resolved path is kept in memory for the process and in cache_path for later runs, and is
+    only resolved again if the cached binary no longer exists. OPTCG_CHROMEDRIVER overrides it.
+
+    Args:
+        version (str): The chromedriver version.
+        cache_path (str): JSON file keeping the resolved path of every version.
+
+    Returns:
+        str: The path of the chromedriver binary.
+    """
+    override = os.getenv('OPTCG_CHROMEDRIVER')
+    if override:
+        return override
+    with _driver_paths_lock:
+        path = _driver_paths.get(version)
+        if path is not None and os.path.isfile(path):
+            return path
+
+        cached = {}
+        if os.path.exists(cache_path):
+            with open(cache_path) as file:
+                cached = json.load(file)
+        path = cached.get(version)
+        if path is None or not os.path.isfile(path):
+            path = ChromeDriverManager(version=version).install()
+            cached[version] = path
+            os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+            temp_path = f'{cache_path}.tmp'
+            with open(temp_path, 'w') as file:
+                json.dump(cached, file)
+            os.replace(temp_path, cache_path)
+            logger.info(f"Chromedriver {version} installed at {path}.")
+        _driver_paths[version] = path
+        return path
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True # a process of another user
+    return True
+
+def _lock_pid(path):
+    # the pid in a claim file, or at the end of the hostname-pid target of Chrome's SingletonLock symlink
+    try:
+        text = os.readlink(path) if os.path.islink(path) else open(path).read()
+        return int(text.strip().rsplit('-', 1)[-1])
+    except (OSError, ValueError):
+        return None
+
+class DriverFactory:
+    """
+    Creates headless Chrome drivers that start from a persistent profile with a warm HTTP cache.
+
+    Chrome locks its user data directory, so every driver gets a profile directory of its own,
+    <profile_root>/worker-<n>. The lowest numbered directory that is free is claimed by creating
+    its claim file exclusively, which also keeps the workers of other processes out of it, and
+    released when the driver quits, so a restarted driver and the next run reuse the same warm
+    caches. A claim or SingletonLock left by a process that is gone is removed. Images, fonts and
+    tracking scripts are not downloaded.
+
+    Args:
+        profile_root (str): Directory the profile directories are kept in.
+        block_resources (bool): Block the requests matching BLOCKED_URL_PATTERNS.
+        disk_cache_size (int): Maximum size of the HTTP cache of each profile in bytes.
+        version (str): The chromedriver version.
+
+    Example usage:
+        factory = DriverFactory()
+        driver = factory()
+    """
+    CLAIM_FILE = 'optcg.claim'
+
+    def __init__(self, profile_root=DEFAULT_PROFILE_ROOT, block_resources=True, disk_cache_size=256 * 1024 * 1024,
+                 version=CHROMEDRIVER_VERSION):
+        self.profile_root = profile_root
+        self.block_resources = block_resources
+        self.disk_cache_size = disk_cache_size
+        self.version = version
+        self.lock = threading.Lock()
+
+    def _try_claim(self, profile_dir):
+        claim_path = os.path.join(profile_dir, self.CLAIM_FILE)
+        os.makedirs(profile_dir, exist_ok=True)
+        for _ in range(2):
+            try:
+                fd = os.open(claim_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                pid = _lock_pid(claim_path)
+                if pid is None or _pid_alive(pid):
+                    return False
+                logger.info(f"Removing the stale claim of process {pid} on {profile_dir}.")
+                try:
+                    os.remove(claim_path)
+                except FileNotFoundError:
+                    pass
+                continue
+            with os.fdopen(fd, 'w') as file:
+                file.write(str(os.getpid()))
+            break
+        else:
+            return False
+        # Chrome keeps a SingletonLock symlink in the directory while it runs
+        singleton_lock = os.path.join(profile_dir, 'SingletonLock')
+        if os.path.lexists(singleton_lock):
+            pid = _lock_pid(singleton_lock)
+            if pid is not None and _pid_alive(pid):
+                self.release_profile_dir(profile_dir) # a Chrome that was not started by us
+                return False
+            logger.info(f"Removing the stale SingletonLock of {profile_dir}.")
+            os.remove(singleton_lock)
+        return True
+
+    def claim_profile_dir(self):
+        """
+        Returns the lowest numbered free profile directory and claims it until release_profile_dir().
+        """
+        with self.lock:
+            worker = 0
+            while True:
+                profile_dir = os.path.join(self.profile_root, f'worker-{worker}')
+                if self._try_claim(profile_dir):
+                    return profile_dir
+                worker += 1
+
+    def release_profile_dir(self, profile_dir):
+        """
+        Releases a profile directory claimed by claim_profile_dir().
+        """
+        try:
+            os.remove(os.path.join(profile_dir, self.CLAIM_FILE))
+        except FileNotFoundError:
+            pass
+
+    def build_options(self, profile_dir):
+        """
+        Returns the Chrome options of a driver using profile_dir.
+        """
+        chrome_options = Options()
+        chrome_options.add_argument("--headless")
+        chrome_options.add_argument("--no-sandbox")
+        chrome_options.add_argument("--disable-dev-shm-usage")
+        chrome_options.add_argument(f"--user-data-dir={os.path.abspath(profile_dir)}")
+        chrome_options.add_argument(f"--disk-cache-size={self.disk_cache_size}")
+        chrome_options.set_capability("browserVersion", "98")
+        if self.block_resources:
+            chrome_options.add_argument("--blink-settings=imagesEnabled=false")
+            chrome_options.add_experimental_option("prefs", {"profile.managed_default_content_settings.images": 2})
+        return chrome_options
+
+    def __call__(self):
+        """
+        Creates a driver.
+
+        Raises:
+            Exception: If there is an error while creating the driver.
+        """
+        try:
+            logging.info("Creating driver")
+            profile_dir = self.claim_profile_dir()
+        except Exception as e:
+            logger.error(f"Failed to start the Chrome driver. Exception: {e}")
+            raise e
+        try:
+            service = Service(resolve_driver_path(self.version))
+            driver = webdriver.Chrome(service=service, options=self.build_options(profile_dir))
+            quit_driver = driver.quit
+            def quit():
+                # the profile is free again once Chrome is gone, also when quitting fails
+                try:
+                    quit_driver()
+                finally:
+                    self.release_profile_dir(profile_dir)
+            driver.quit = quit
+            if self.block_resources:
+                driver.execute_cdp_cmd('Network.enable', {})
+                driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': BLOCKED_URL_PATTERNS})
+        except Exception as e:
+            self.release_profile_dir(profile_dir)
+            logger.error(f"Failed to start the Chrome driver. Exception: {e}")
+            raise e
+        else:
+            logger.info(f"Driver successfully created with profile {profile_dir}.")
+        return driver
+
+_default_factory = None
+_default_factory_lock = threading.Lock()
+
+def default_driver_factory():
+    """
+    Returns the factory create_driver() uses, shared by the whole process.
+    """
+    global _default_factory
+    with _default_factory_lock:
+        if _default_factory is None:
+            _default_factory = DriverFactory(profile_root=os.getenv('OPTCG_CHROME_PROFILE_DIR', DEFAULT_PROFILE_ROOT),
+                                             block_resources=os.getenv('OPTCG_BLOCK_RESOURCES', '1') == '1')
+        return _default_factory
@@ -0,0 +1,68 @@
+import functools
+import os
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+# Get the absolute directory of the current script
+abs_dir = os.path.dirname(os.path.abspath(__file__))
+
+FIXTURES_DIR = os.path.join(abs_dir, 'fixtures')
+
+class _FixtureRequestHandler(SimpleHTTPRequestHandler):
+    def __init__(self, *args, latency=0.0, **kwargs):
+        self.latency = latency
+        super().__init__(*args, **kwargs)
+
+    def do_GET(self):
+        # emulate the round trip to tcgplayer.com so concurrency gains can be measured
+        if self.latency:
+            time.sleep(self.latency)
+        super().do_GET()
+
+    def log_message(self, format, *args):
+        pass
+
+class FixtureServer:
+    """
+    Serves saved HTML pages from a local HTTP server so the scraper can run without tcgplayer.com.
+
+    The search results page is served at /search.html and the product pages at
+    /product/<slug>.html, mirroring the layout of the fixtures directory.
+
+    Example usage:
+        with FixtureServer(latency=0.2) as server:
+            links = fetch_product_links(session, server.url('search.html'))
+    """
+    def __init__(self, directory=FIXTURES_DIR, latency=0.0):
+        self.directory = directory
+        self.latency = latency
+        self.httpd = None
+        self.thread = None
+
+    def start(self):
+        handler = functools.partial(_FixtureRequestHandler, directory=self.directory, latency=self.latency)
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.thread.join()
+            self.httpd = None
+
+    def url(self, path=''):
+        """
+        Returns the absolute URL of a fixture path on the running server.
+        """
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/{path.lstrip('/')}"
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
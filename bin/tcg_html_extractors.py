@@ -0,0 +1,231 @@
+import argparse
+import glob
+import logging
+from tcg_logging import configure_logging
+import os
+import time
+from bs4 import BeautifulSoup, SoupStrainer
+
+# Get the absolute directory of the current script
+abs_dir = os.path.dirname(os.path.abspath(__file__))
+
+# Get the custom Logger from Configuration File
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAGES_GLOB = os.path.join(abs_dir, 'fixtures', 'product', '*.html')
+
+# the product page nodes parse_card_html() reads
+LOWEST_PRICE_SELECTOR = 'span.spotlight__price'
+PRODUCT_NAME_SELECTOR = 'h1.product-details__name'
+PRICE_POINTS_SELECTOR = 'section.price-points.price-guide__points span.price'
+
+# the search result tile and the fields it shows, in the order extract_grid_tiles() returns them
+TILE_SELECTOR = 'div.search-result__content > a'
+GRID_FIELD_SELECTORS = ['.product-card__title', '.product-card__set-name', '.product-card__market-price--value',
+                        '.inventory__price-with-shipping']
+
+# reads the link and the fields of every tile of the search results grid in one round trip
+GRID_TILE_SCRIPT = """
+const fields = arguments[0];
+return Array.from(document.querySelectorAll(arguments[1])).map(tile => [tile.href].concat(
+    fields.map(selector => { const node = tile.querySelector(selector); return node ? node.textContent : null; })));
+"""
+
+def extract_grid_tiles(html):
+    """
+    Extracts the fields of every tile of a search results page, like GRID_TILE_SCRIPT does in the browser.
+
+    Args:
+        html (str): The HTML of the search results page.
+
+    Returns:
+        list: The href, title, set name, market price text and lowest listing price text of every
+            tile, None where the tile does not show the field.
+    """
+    soup = BeautifulSoup(html, 'html.parser')
+    tiles = []
+    for tile in soup.select(TILE_SELECTOR):
+        nodes = [tile.select_one(selector) for selector in GRID_FIELD_SELECTORS]
+        tiles.append([tile.get('href')] + [node.text if node is not None else None for node in nodes])
+    return tiles
+
+def _required(node, selector):
+    # a missing node raises the same AttributeError as BeautifulSoup's find(...).text did
+    if node is None:
+        raise AttributeError(f"No element matches {selector}")
+    return node
+
+class SoupExtractor:
+    """
+    Extracts the product page fields with BeautifulSoup and the pure python html.parser.
+
+    With strain=True only the three nodes that are read are built into the tree (SoupStrainer),
+    which skips building the rest of the page.
+    """
+    name = 'soup'
+
+    def __init__(self, strain=False):
+        self.parse_only = None
+        if strain:
+            self.name = 'soup-strainer'
+            self.parse_only = SoupStrainer(['span', 'h1', 'section'], class_=['spotlight__price', 'product-details__name',
+                                                                            'price-points price-guide__points'])
+
+    def extract(self, html):
+        """
+        Args:
+            html (str): The HTML of the product page.
+
+        Returns:
+            tuple: The lowest listed price text, the product name and the price point texts.
+
+        Raises:
+            AttributeError: If one of the expected elements is missing from the page.
+        """
+        soup = BeautifulSoup(html, 'html.parser', parse_only=self.parse_only)
+        lowest_price = soup.find('span', {'class': 'spotlight__price'}).text
+        product_name = soup.find('h1', {'class': 'product-details__name'}).text
+        prices_section = soup.find('section', class_='price-points price-guide__points')
+        prices = [span.text for span in prices_section.find_all('span', class_='price')]
+        return lowest_price, product_name, prices
+
+class LxmlExtractor:
+    """
+    Extracts the product page fields with lxml's C parser and precompiled CSS selectors.
+    Requires the lxml and cssselect packages.
+    """
+    name = 'lxml'
+
+    def __init__(self):
+        import lxml.html
+        from lxml.cssselect import CSSSelector
+        self.parser = lxml.html.HTMLParser()
+        self.fromstring = lxml.html.fromstring
+        self.lowest_price = CSSSelector(LOWEST_PRICE_SELECTOR)
+        self.product_name = CSSSelector(PRODUCT_NAME_SELECTOR)
+        self.prices = CSSSelector(PRICE_POINTS_SELECTOR)
+        self.prices_section = CSSSelector('section.price-points.price-guide__points')
+
+    def _first(self, selector, tree):
+        nodes = selector(tree)
+        return _required(nodes[0] if nodes else None, selector.css)
+
+    def extract(self, html):
+        tree = self.fromstring(html, parser=self.parser)
+        lowest_price = self._first(self.lowest_price, tree).text_content()
+        product_name = self._first(self.product_name, tree).text_content()
+        self._first(self.prices_section, tree)
+        prices = [node.text_content() for node in self.prices(tree)]
+        return lowest_price, product_name, prices
+
+class SelectolaxExtractor:
+    """
+    Extracts the product page fields with selectolax's lexbor parser and CSS selectors.
+    Requires the selectolax package.
+    """
+    name = 'selectolax'
+
+    def __init__(self):
+        from selectolax.lexbor import LexborHTMLParser
+        self.parser = LexborHTMLParser
+
+    def extract(self, html):
+        tree = self.parser(html)
+        lowest_price = _required(tree.css_first(LOWEST_PRICE_SELECTOR), LOWEST_PRICE_SELECTOR).text()
+        product_name = _required(tree.css_first(PRODUCT_NAME_SELECTOR), PRODUCT_NAME_SELECTOR).text()
+        _required(tree.css_first('section.price-points.price-guide__points'), PRICE_POINTS_SELECTOR)
+        prices = [node.text() for node in tree.css(PRICE_POINTS_SELECTOR)]
+        return lowest_price, product_name, prices
+
+EXTRACTORS = {
+    'soup': SoupExtractor,
+    'soup-strainer': lambda: SoupExtractor(strain=True),
+    'lxml': LxmlExtractor,
+    'selectolax': SelectolaxExtractor,
+}
+
+_default_extractor = None
+
+def get_extractor(name):
+    """
+    Creates the extractor registered under name.
+
+    Raises:
+        ValueError: If no extractor is registered under name.
+        ImportError: If the parser library of the extractor is not installed.
+    """
+    if name not in EXTRACTORS:
+        raise ValueError(f"Unknown extractor {name}. Expected one of {list(EXTRACTORS)}.")
+    return EXTRACTORS[name]()
+
+def set_default_extractor(name):
+    """
+    Sets the extractor parse_card_html() uses when none is passed.
+    """
+    global _default_extractor
+    _default_extractor = get_extractor(name)
+    logger.info(f"Extracting product pages with the {name} extractor.")
+    return _default_extractor
+
+def default_extractor():
+    """
+    Returns the extractor parse_card_html() uses when none is passed, OPTCG_EXTRACTOR or 'soup'.
+    """
+    if _default_extractor is None:
+        return set_default_extractor(os.getenv('OPTCG_EXTRACTOR', 'soup'))
+    return _default_extractor
+
+def init_parse_process(extractor, log_file):
+    """
+    Initializer of the processes that parse pages, see ParsePipeline and tcg_reparse.reparse().
+
+    The processes are started by a forkserver, so they have neither the handlers of the parent's
+    logging nor its default extractor. The extractor is built here, in the process, and never pickled.
+
+    Args:
+        extractor (str): The extractor the pages are parsed with, see EXTRACTORS.
+        log_file (str): The log file of the parent, see tcg_logging.configured_log_file(). None to not log to a file.
+    """
+    if log_file is not None:
+        configure_logging(log_file)
+    set_default_extractor(extractor)
+
+def benchmark_extractors(pages, names=None, repeat=20):
+    """
+    Times every extractor over the same product pages.
+
+    Args:
+        pages (list): The HTML of the saved product pages.
+        names (list, optional): The extractors to time. Defaults to every installed extractor.
+        repeat (int): How many times every page is parsed.
+
+    Returns:
+        dict: The mean parse time per page in seconds, keyed by extractor name.
+    """
+    results = {}
+    for name in names or list(EXTRACTORS):
+        try:
+            extractor = get_extractor(name)
+        except ImportError as e:
+            logger.info(f"Skipping the {name} extractor: {e}")
+            continue
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for html in pages:
+                extractor.extract(html)
+        results[name] = (time.perf_counter() - start) / (repeat * len(pages))
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time the product page extractors over saved product pages.")
+    parser.add_argument('--pages', default=DEFAULT_PAGES_GLOB, help="Glob of the saved product pages.")
+    parser.add_argument('--repeat', type=int, default=20, help="How many times every page is parsed.")
+    args = parser.parse_args()
+    configure_logging()
+    pages = []
+    for path in sorted(glob.glob(args.pages)):
+        with open(path, encoding='utf-8') as file:
+            pages.append(file.read())
+    print(f"{len(pages)} page(s), {args.repeat} repeat(s)")
+    for name, seconds in benchmark_extractors(pages, repeat=args.repeat).items():
+        print(f"{name:>14}: {seconds * 1000:.3f} ms/page")
@@ -0,0 +1,210 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from bs4 import BeautifulSoup
+import tcg_scraper_functions as tcg
+from tcg_crawl_scheduler import CrawlScheduler, FetchResult
+from tcg_url_index import ScrapedUrlIndex
+from tcg_metrics import metrics, timed
+from tcg_page_cache import cache_page
+
+# Get the custom Logger from Configuration File
+logger = logging.getLogger(__name__)
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/114.0.0.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/json;q=0.9,*/*;q=0.8',
+}
+
+def create_session(pool_size=8, max_retries=3):
+    """
+    Creates an HTTP session whose connections are pooled and reused between product pages.
+
+    Args:
+        pool_size (int): The number of keep-alive connections kept open per host.
+        max_retries (int): The number of retries on connection errors, 429 and 5xx responses.
+
+    Returns:
+        requests.Session: The configured session.
+    """
+    retry = Retry(total=max_retries, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504],
+                  allowed_methods=['GET'])
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.headers.update(DEFAULT_HEADERS)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    logger.info(f"HTTP session created with a pool of {pool_size} connection(s).")
+    return session
+
+@timed('navigation')
+def fetch_page(session, url, timeout=15):
+    """
+    Fetches the body of a page.
+
+    Args:
+        session (requests.Session): The session to fetch with.
+        url (str): The URL of the page.
+        timeout (int): Seconds to wait for the server before giving up.
+
+    Returns:
+        str: The response body.
+
+    Raises:
+        requests.RequestException: If the page could not be fetched.
+    """
+    response = session.get(url, timeout=timeout)
+    response.raise_for_status()
+    return response.text
+
+def parse_retry_after(value):
+    """
+    Converts a Retry-After header given in seconds to a float, or None if it is missing or a date.
+    """
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def create_scheduler(session, rate=2.0, max_in_flight=8, timeout=15):
+    """
+    Creates a CrawlScheduler that fetches through the given session.
+
+    Timeouts and connection errors are re-raised as the built-in TimeoutError and ConnectionError
+    so the scheduler retries them, and the Retry-After header of throttled responses is honored.
+    The session should be created with max_retries=0 so the scheduler is the only one retrying.
+
+    Args:
+        session (requests.Session): The session to fetch with.
+        rate (float): Maximum requests per second per host.
+        max_in_flight (int): Maximum number of requests in flight.
+        timeout (int): Seconds to wait for each page before giving up.
+
+    Returns:
+        CrawlScheduler: The scheduler, not yet started.
+    """
+    def fetch(url):
+        try:
+            with metrics.timer('navigation'):
+                response = session.get(url, timeout=timeout)
+        except requests.Timeout as e:
+            raise TimeoutError(str(e)) from e
+        except requests.ConnectionError as e:
+            raise ConnectionError(str(e)) from e
+        return FetchResult(response.status_code, response.text, parse_retry_after(response.headers.get('Retry-After')))
+
+    return CrawlScheduler(fetch, rate=rate, max_in_flight=max_in_flight)
+
+def fetch_product_links(session, url, timeout=15, scheduler=None):
+    """
+    Fetches a search results page and collects the product links of every tile.
+
+    Args:
+        session (requests.Session): The session to fetch with.
+        url (str): The URL of the search results page.
+        timeout (int): Seconds to wait for the server before giving up.
+        scheduler (CrawlScheduler, optional): Started scheduler to submit the fetch to instead of fetching directly.
+
+    Returns:
+        list: The absolute product links without their '?xid=' suffix.
+    """
+    html = scheduler.submit(url).result() if scheduler is not None else fetch_page(session, url, timeout)
+    soup = BeautifulSoup(html, 'html.parser')
+    links = []
+    for tile in soup.select("div.search-result__content > a"):
+        link = tcg.clean_card_link(urljoin(url, tile.get('href', '')))
+        if link is not None:
+            links.append(link)
+    logger.info(f"{len(links)} product link(s) collected from {url}.")
+    return links
+
+def fetch_card_data(links, date, session=None, max_workers=8, timeout=15, scheduler=None):
+    """
+    Fetches and parses product pages directly, without clicking through the search results.
+
+    Pages are fetched concurrently with at most max_workers requests in flight and parsed with
+    the same selectors as get_card_data(). A page that fails is logged and left out, so it is
+    picked up again on the next run because its link is not marked as scraped.
+
+    Args:
+        links (list): The product links to scrape.
+        date (str): The current date.
+        session (requests.Session, optional): The session to fetch with. A new one is created if not given.
+        max_workers (int): The maximum number of product pages fetched at the same time.
+        timeout (int): Seconds to wait for each page before giving up.
+        scheduler (CrawlScheduler, optional): Started scheduler to submit the fetches to. It then
+            controls the rate and concurrency instead of max_workers.
+
+    Returns:
+        tuple: The list of card dictionaries and the list of {'url', 'date'} dictionaries of the scraped links.
+
+    Example usage:
+        links = tcg.get_product_links(elements)
+        card_data, urls = fetch_card_data(links, '2021-10-01')
+    """
+    def parse(link, html):
+        cache_page(link, date, html)
+        try:
+            return tcg.parse_card_html(html, date)
+        except (AttributeError, IndexError) as e:
+            logger.error(f"Error parsing product page {link}: {e}")
+            return None
+
+    def fetch_and_parse(link):
+        try:
+            html = fetch_page(session, link, timeout)
+        except requests.RequestException as e:
+            logger.error(f"Error fetching product page {link}: {e}")
+            return None
+        return parse(link, html)
+
+    if scheduler is not None:
+        cards = []
+        for link, html in zip(links, scheduler.fetch_all(links)):
+            if isinstance(html, Exception):
+                logger.error(f"Error fetching product page {link}: {html}")
+                cards.append(None)
+            else:
+                cards.append(parse(link, html))
+    else:
+        if session is None:
+            session = create_session(pool_size=max_workers)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            cards = list(executor.map(fetch_and_parse, links))
+
+    card_list = []
+    url_list = []
+    for link, card in zip(links, cards):
+        if card is None:
+            continue
+        card_list.append(card)
+        url_list.append({'url': link, 'date': date})
+    logger.info(f"Card data was fetched for {len(card_list)} of {len(links)} product page(s).")
+    return card_list, url_list
+
+def get_card_data_over_http(elements, date, session=None, max_workers=8, scheduler=None, url_index=None):
+    """
+    Drop-in replacement for get_card_data() that fetches the product pages of a search page over HTTP.
+
+    The product links are read from the search result tiles once, links already scraped today
+    are skipped and the rest are fetched with fetch_card_data().
+
+    Args:
+        elements: The search result elements returned by download_elements_from_webpage().
+        date (str): The current date.
+        session (requests.Session, optional): The session to fetch with.
+        max_workers (int): The maximum number of product pages fetched at the same time.
+        scheduler (CrawlScheduler, optional): Started scheduler to submit the fetches to.
+        url_index (ScrapedUrlIndex, optional): Index of the links already scraped.
+
+    Returns:
+        tuple: The list of card dictionaries and the list of {'url', 'date'} dictionaries of the scraped links.
+    """
+    if url_index is None:
+        url_index = ScrapedUrlIndex()
+    links = [link for link in tcg.get_product_links(elements) if (date, link) not in url_index]
+    logger.info(f"{len(links)} product link(s) left to fetch on this page.")
+    return fetch_card_data(links, date, session=session, max_workers=max_workers, scheduler=scheduler)
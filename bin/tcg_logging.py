@@ -0,0 +1,132 @@
+import atexit
+import collections
+import logging
+import logging.config
+import os
+import queue
+import threading
+from logging.handlers import QueueHandler, QueueListener
+
+# Get the absolute directory of the current script
+abs_dir = os.path.dirname(os.path.abspath(__file__))
+
+# Construct the absolute path to the logging configuration file
+logging_config_path = os.path.join(abs_dir, '..', 'util', 'logging_to_file.conf')
+
+LOG_FILE_ENV = 'OPTCG_LOG_FILE'
+LOG_SAMPLE_ENV = 'OPTCG_LOG_SAMPLE'
+DEFAULT_LOG_FILE = os.path.join(abs_dir, '..', 'logs', 'tcg_pipeline.log')
+
+_lock = threading.Lock()
+_listener = None
+_sampler = None
+_log_file = None
+
+class DebugSampler(logging.Filter):
+    """
+    Lets the first and then every `every`-th DEBUG record of each message through and counts the rest.
+
+    Records are grouped by their unformatted message, so hot path calls must use %-style
+    arguments (logger.debug("Parsed %s", name)) rather than f-strings for the sampling to work.
+    """
+    def __init__(self, every=100):
+        super().__init__()
+        self.every = max(1, every)
+        self.lock = threading.Lock()
+        self.counts = collections.Counter()
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG:
+            return True
+        with self.lock:
+            self.counts[record.msg] += 1
+            count = self.counts[record.msg]
+        return (count - 1) % self.every == 0
+
+    def summary(self):
+        """
+        Returns how many times each sampled DEBUG message was logged, including the dropped ones.
+        """
+        with self.lock:
+            return {str(message): count for message, count in self.counts.items() if count > 1}
+
+class _InProcessQueueHandler(QueueHandler):
+    # the listener runs in the same process, so the record is passed on as is and only
+    # formatted by the listener thread instead of by the thread that logged it
+    def prepare(self, record):
+        return record
+
+def configure_logging(log_file=None, sample_every=None):
+    """
+    Configures logging for the whole process from util/logging_to_file.conf. Only the first call does anything.
+
+    The handlers of the configuration file are moved behind a queue: loggers only put records on
+    it, and a background listener thread formats and writes them, so logging does not block the
+    scraper on disk writes. The listener is stopped, and the queue drained, when the process exits.
+
+    Args:
+        log_file (str, optional): The log file. Defaults to OPTCG_LOG_FILE, or logs/tcg_pipeline.log in the repository.
+        sample_every (int, optional): Keep one in sample_every DEBUG records of each message.
+            Defaults to OPTCG_LOG_SAMPLE, or 100.
+
+    Returns:
+        QueueListener: The listener writing the records.
+    """
+    global _listener, _sampler, _log_file
+    with _lock:
+        if _listener is not None:
+            return _listener
+        _log_file = os.path.abspath(log_file or os.getenv(LOG_FILE_ENV, DEFAULT_LOG_FILE))
+        os.makedirs(os.path.dirname(_log_file), exist_ok=True)
+        logging.config.fileConfig(fname=logging_config_path, defaults={'log_path': _log_file},
+                                  disable_existing_loggers=False)
+
+        loggers = [logging.getLogger()] + [logger for logger in logging.Logger.manager.loggerDict.values()
+                                           if isinstance(logger, logging.Logger)]
+        handlers = []
+        for logger in loggers:
+            for handler in logger.handlers:
+                if handler not in handlers:
+                    handlers.append(handler)
+
+        _sampler = DebugSampler(sample_every or int(os.getenv(LOG_SAMPLE_ENV, '100')))
+        queue_handler = _InProcessQueueHandler(queue.SimpleQueue())
+        queue_handler.addFilter(_sampler)
+        for logger in loggers:
+            if any(handler in handlers for handler in logger.handlers):
+                logger.handlers = [queue_handler]
+
+        _listener = QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+        return _listener
+
+def configured_log_file():
+    """
+    Returns the path of the log file if logging is configured, None otherwise, so worker
+    processes can configure logging the same way.
+    """
+    return _log_file
+
+def get_log_file():
+    """
+    Returns the path of the log file, configuring logging first if needed.
+    """
+    configure_logging()
+    return _log_file
+
+def shutdown_logging():
+    """
+    Logs how often each sampled DEBUG message occurred, then writes out the queued records and stops the listener.
+    """
+    global _listener
+    with _lock:
+        if _listener is None:
+            return
+        sampled = _sampler.summary()
+        if sampled:
+            logging.getLogger(__name__).info("Sampled DEBUG message counts: %s", sampled)
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
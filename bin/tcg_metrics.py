@@ -0,0 +1,192 @@
+import functools
+import json
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+# Get the absolute directory of the current script
+abs_dir = os.path.dirname(os.path.abspath(__file__))
+
+# Get the custom Logger from Configuration File
+logger = logging.getLogger(__name__)
+
+DEFAULT_METRICS_DIR = os.path.join(abs_dir, '..', 'logs')
+
+class DurationStats:
+    """
+    Count, total and max of a stream of durations, with a fixed-size sample of them for the percentiles.
+
+    A run records a duration per card and stage, so the durations are not all kept. Once
+    sample_size of them are stored, every new one replaces a random stored one with the
+    probability that keeps the sample uniform over every duration recorded (reservoir sampling).
+    Count, total, mean and max are exact, p50 and p95 are read from the sample. Not thread-safe,
+    the owner holds its own lock.
+
+    Args:
+        sample_size (int): Number of durations kept for the percentiles.
+    """
+    def __init__(self, sample_size=1024):
+        self.sample_size = sample_size
+        self.sample = []
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.random = random.Random()
+
+    def add(self, duration):
+        self.count += 1
+        self.total += duration
+        self.max = max(self.max, duration)
+        if len(self.sample) < self.sample_size:
+            self.sample.append(duration)
+        else:
+            index = self.random.randrange(self.count)
+            if index < self.sample_size:
+                self.sample[index] = duration
+
+    def summary(self, digits=6):
+        """
+        Returns the count, total, mean, p50, p95 and max of the durations, rounded to digits.
+        """
+        values = sorted(self.sample)
+
+        def percentile(p):
+            return round(values[min(len(values) - 1, int(p * len(values)))], digits)
+
+        return {
+            'count': self.count,
+            'total': round(self.total, digits),
+            'mean': round(self.total / self.count, digits),
+            'p50': percentile(0.5),
+            'p95': percentile(0.95),
+            'max': round(self.max, digits),
+        }
+
+class RunMetrics:
+    """
+    Durations and counts of the stages of a run: navigation, readiness wait, parse, write, validate and upload.
+
+    Every timed call of a stage adds one duration to the DurationStats of the stage, so the memory
+    used does not grow with the number of cards. Counters count things that are not timed one
+    by one, like the rows written. Safe to use from every worker thread.
+
+    Example usage:
+        with metrics.timer('parse'):
+            card = parse_card_html(html, date)
+        metrics.increment('rows_written', len(rows))
+        metrics.write_json('logs/run_summary_20240101.json')
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started_at = time.time()
+        self.durations = {}
+        self.counters = {}
+
+    def record(self, stage, duration):
+        with self.lock:
+            stats = self.durations.get(stage)
+            if stats is None:
+                stats = self.durations[stage] = DurationStats()
+            stats.add(duration)
+
+    def increment(self, counter, value=1):
+        with self.lock:
+            self.counters[counter] = self.counters.get(counter, 0) + value
+
+    @contextmanager
+    def timer(self, stage):
+        """
+        Records how long the body of the with statement took, also when it raises.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def reset(self):
+        with self.lock:
+            self.started_at = time.time()
+            self.durations = {}
+            self.counters = {}
+
+    def summary(self):
+        """
+        Returns the wall time of the run, the counters and the count, total, mean, p50, p95 and
+        max in seconds of every stage, see DurationStats.
+        """
+        with self.lock:
+            stages = {stage: stats.summary() for stage, stats in self.durations.items()}
+            counters = dict(self.counters)
+            started_at = self.started_at
+        return {'wall_time': round(time.time() - started_at, 3), 'counters': counters, 'stages': stages}
+
+    def report(self):
+        """
+        Returns a human readable table of where the time of the run went, slowest stage first.
+
+        Stages overlap (a parse happens inside a page scrape, and workers run in parallel), so the
+        share of each stage is relative to the wall time of the run and the shares do not add up to 100%.
+        """
+        summary = self.summary()
+        wall_time = summary['wall_time'] or 1
+        lines = [f"Run took {summary['wall_time']:.1f}s."]
+        for stage, stats in sorted(summary['stages'].items(), key=lambda item: item[1]['total'], reverse=True):
+            lines.append(f"{stage:>20}: {stats['total']:9.3f}s total {100 * stats['total'] / wall_time:6.1f}% "
+                         f"{stats['count']:7d} call(s) p50 {1000 * stats['p50']:8.1f}ms p95 {1000 * stats['p95']:8.1f}ms")
+        for counter, value in sorted(summary['counters'].items()):
+            lines.append(f"{counter:>20}: {value}")
+        return '\n'.join(lines)
+
+    def to_prometheus(self, prefix='optcg'):
+        """
+        Returns the metrics in the Prometheus text exposition format, e.g. for the node exporter textfile collector.
+        """
+        summary = self.summary()
+        lines = [f'# HELP {prefix}_stage_duration_seconds Duration of the stages of the last run.',
+                 f'# TYPE {prefix}_stage_duration_seconds summary']
+        for stage, stats in sorted(summary['stages'].items()):
+            lines.append(f'{prefix}_stage_duration_seconds{{stage="{stage}",quantile="0.5"}} {stats["p50"]}')
+            lines.append(f'{prefix}_stage_duration_seconds{{stage="{stage}",quantile="0.95"}} {stats["p95"]}')
+            lines.append(f'{prefix}_stage_duration_seconds_sum{{stage="{stage}"}} {stats["total"]}')
+            lines.append(f'{prefix}_stage_duration_seconds_count{{stage="{stage}"}} {stats["count"]}')
+        for counter, value in sorted(summary['counters'].items()):
+            lines.append(f'# TYPE {prefix}_{counter}_total counter')
+            lines.append(f'{prefix}_{counter}_total {value}')
+        lines.append(f'# TYPE {prefix}_run_wall_time_seconds gauge')
+        lines.append(f'{prefix}_run_wall_time_seconds {summary["wall_time"]}')
+        return '\n'.join(lines) + '\n'
+
+    def write_json(self, path):
+        _write_atomically(path, json.dumps(self.summary(), indent=2))
+        logger.info(f"Run summary written to {path}.")
+
+    def write_prometheus(self, path, prefix='optcg'):
+        _write_atomically(path, self.to_prometheus(prefix))
+        logger.info(f"Prometheus metrics written to {path}.")
+
+def _write_atomically(path, text):
+    # the textfile collector must never read a half written file
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    temp_path = f'{path}.tmp'
+    with open(temp_path, 'w') as file:
+        file.write(text)
+    os.replace(temp_path, path)
+
+# shared by every module of a run
+metrics = RunMetrics()
+
+def timed(stage):
+    """
+    Decorator recording every call of the decorated function as one duration of stage.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with metrics.timer(stage):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,223 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from tcg_metrics import metrics
+
+# Get the absolute directory of the current script
+abs_dir = os.path.dirname(os.path.abspath(__file__))
+
+# Get the custom Logger from Configuration File
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = os.path.join(abs_dir, '..', 'cache', 'pages')
+
+PRODUCT, SEARCH = 'product', 'search'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    content_hash TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    raw_size INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS pages (
+    url TEXT NOT NULL,
+    date TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    content_hash TEXT NOT NULL REFERENCES blobs(content_hash),
+    stored_at REAL NOT NULL,
+    PRIMARY KEY (url, date)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS pages_date ON pages(date, kind);
+CREATE INDEX IF NOT EXISTS pages_content ON pages(content_hash);
+"""
+
+class PageCache:
+    """
+    Compressed, content-addressed cache of the raw HTML of every fetched page, keyed by URL and date.
+
+    Pages are stored zstd compressed under <cache_dir>/blobs/<hash[:2]>/<hash>.zst, where hash is
+    the sha256 of the HTML, so a page that did not change since an earlier day is stored once. An
+    SQLite index maps every (url, date) to its blob. evict() drops the pages older than
+    max_age_days, then the oldest days until the blobs take at most max_bytes, and deletes the
+    blobs no page refers to any more. Requires the zstandard package.
+
+    Args:
+        cache_dir (str): Directory of the index and the blobs.
+        max_bytes (int): Size the compressed blobs may take on disk.
+        max_age_days (float): Age after which a page is evicted.
+        level (int): zstd compression level.
+
+    Example usage:
+        cache = PageCache()
+        cache.put(link, '2024-01-01', driver.page_source)
+        html = cache.get(link, '2024-01-01')
+    """
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=2 * 1024 ** 3, max_age_days=90, level=6):
+        import zstandard
+        self.cache_dir = cache_dir
+        self.blob_dir = os.path.join(cache_dir, 'blobs')
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+        self.level = level
+        self.zstandard = zstandard
+        # compressors are not thread safe, every thread gets its own
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        os.makedirs(self.blob_dir, exist_ok=True)
+        self.connection = sqlite3.connect(os.path.join(cache_dir, 'index.db'), timeout=30, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def blob_path(self, content_hash):
+        return blob_path(self.cache_dir, content_hash)
+
+    def _compressor(self):
+        if not hasattr(self.local, 'compressor'):
+            self.local.compressor = self.zstandard.ZstdCompressor(level=self.level)
+        return self.local.compressor
+
+    def put(self, url, date, html, kind=PRODUCT):
+        """
+        Stores the HTML of a page fetched on date, replacing what was stored for the same url and date.
+
+        Returns:
+            str: The content hash of the page.
+        """
+        start = time.perf_counter()
+        raw = html.encode('utf-8')
+        content_hash = hashlib.sha256(raw).hexdigest()
+        path = self.blob_path(content_hash)
+        with self.lock:
+            known = self.connection.execute('SELECT 1 FROM blobs WHERE content_hash = ?', (content_hash,)).fetchone()
+        compressed = None
+        if not known or not os.path.exists(path):
+            compressed = self._compressor().compress(raw)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = f'{path}.{threading.get_ident()}.tmp'
+            with open(temp_path, 'wb') as file:
+                file.write(compressed)
+            os.replace(temp_path, path)
+        # the blob and the page that refers to it are added together, so evict() never sees the blob as an orphan
+        with self.lock, self.connection:
+            if compressed is not None:
+                self.connection.execute('INSERT OR REPLACE INTO blobs VALUES (?, ?, ?)',
+                                        (content_hash, len(compressed), len(raw)))
+            self.connection.execute('INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?)',
+                                    (url, date, kind, content_hash, time.time()))
+        metrics.record('cache_put', time.perf_counter() - start)
+        return content_hash
+
+    def get(self, url, date):
+        """
+        Returns the HTML of a page fetched on date, or None if it is not cached.
+        """
+        with self.lock:
+            row = self.connection.execute('SELECT content_hash FROM pages WHERE url = ? AND date = ?',
+                                          (url, date)).fetchone()
+        if row is None:
+            return None
+        return read_blob(self.blob_path(row[0]))
+
+    def pages(self, date=None, kind=None):
+        """
+        Returns the (url, date, kind, content_hash) of the cached pages, optionally of one date and kind.
+        """
+        query = 'SELECT url, date, kind, content_hash FROM pages WHERE 1 = 1'
+        params = []
+        if date is not None:
+            query += ' AND date = ?'
+            params.append(date)
+        if kind is not None:
+            query += ' AND kind = ?'
+            params.append(kind)
+        with self.lock:
+            return self.connection.execute(query + ' ORDER BY date, url', params).fetchall()
+
+    def stats(self):
+        """
+        Returns the number of pages and blobs, and the compressed and raw size of the blobs in bytes.
+        """
+        with self.lock:
+            pages = self.connection.execute('SELECT COUNT(*) FROM pages').fetchone()[0]
+            blobs, size, raw_size = self.connection.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(raw_size), 0) FROM blobs').fetchone()
+        return {'pages': pages, 'blobs': blobs, 'bytes': size, 'raw_bytes': raw_size}
+
+    def evict(self, now=None):
+        """
+        Applies the eviction policy: pages older than max_age_days go first, then the oldest
+        dates until the blobs fit in max_bytes. Blobs left without a page are deleted.
+
+        Returns:
+            int: The number of blobs deleted.
+        """
+        now = time.time() if now is None else now
+        with self.lock, self.connection:
+            self.connection.execute('DELETE FROM pages WHERE stored_at < ?', (now - self.max_age_days * 86400,))
+            dates = [row[0] for row in self.connection.execute('SELECT DISTINCT date FROM pages ORDER BY date')]
+            # the last date is kept whatever its size
+            for date in dates[:-1]:
+                if self._referenced_size() <= self.max_bytes:
+                    break
+                self.connection.execute('DELETE FROM pages WHERE date = ?', (date,))
+            orphans = [row[0] for row in self.connection.execute(
+                'SELECT content_hash FROM blobs WHERE content_hash NOT IN (SELECT content_hash FROM pages)')]
+            self.connection.executemany('DELETE FROM blobs WHERE content_hash = ?', [(orphan,) for orphan in orphans])
+        for orphan in orphans:
+            try:
+                os.remove(self.blob_path(orphan))
+            except FileNotFoundError:
+                pass
+        logger.info(f"Evicted {len(orphans)} blob(s) from the page cache. {self.stats()}")
+        return len(orphans)
+
+    def _referenced_size(self):
+        return self.connection.execute('SELECT COALESCE(SUM(size), 0) FROM blobs WHERE content_hash IN '
+                                       '(SELECT content_hash FROM pages)').fetchone()[0]
+
+def blob_path(cache_dir, content_hash):
+    return os.path.join(cache_dir, 'blobs', content_hash[:2], f'{content_hash}.zst')
+
+def read_blob(path):
+    """
+    Returns the HTML stored in a blob file. Also used by the reparse worker processes, which do not open the index.
+    """
+    import zstandard
+    with open(path, 'rb') as file:
+        return zstandard.ZstdDecompressor().decompress(file.read()).decode('utf-8')
+
+_default_cache = None
+
+def set_default_cache(cache):
+    """
+    Sets the cache the scraper stores every fetched page in, None to stop caching.
+    """
+    global _default_cache
+    _default_cache = cache
+    return cache
+
+def default_cache():
+    return _default_cache
+
+def cache_page(url, date, html, kind=PRODUCT):
+    """
+    Stores a fetched page in the default cache, if one is set. A failing cache never fails the scrape.
+    """
+    if _default_cache is None or url is None:
+        return
+    try:
+        _default_cache.put(url, date, html, kind)
+    except Exception as e:
+        logger.error(f"Error caching {url}: {e}")
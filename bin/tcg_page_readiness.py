@@ -0,0 +1,115 @@
+import logging
+import threading
+import time
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.common.exceptions import TimeoutException
+from tcg_metrics import metrics, DurationStats
+
+# Get the custom Logger from Configuration File
+logger = logging.getLogger(__name__)
+
+# the product page nodes parse_card_html() reads
+PRODUCT_PAGE_SELECTORS = ('span.spotlight__price', 'h1.product-details__name', 'section.price-points')
+
+class ReadinessStats:
+    """
+    Records how long each readiness wait took, so per-card latency reflects the real page load time.
+
+    The waits are kept in a DurationStats, so the memory used does not grow with the number of
+    cards, and the summary covers every wait since the last reset().
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.durations = DurationStats()
+        self.timeouts = 0
+
+    def record(self, duration, timed_out=False):
+        with self.lock:
+            self.durations.add(duration)
+            if timed_out:
+                self.timeouts += 1
+
+    def summary(self):
+        """
+        Returns the count, timeouts and mean/p50/p95/max of the recorded waits in seconds.
+        """
+        with self.lock:
+            if not self.durations.count:
+                return {'count': 0, 'timeouts': self.timeouts}
+            stats = self.durations.summary(digits=3)
+            timeouts = self.timeouts
+        return {'count': stats['count'], 'timeouts': timeouts,
+                **{key: stats[key] for key in ('mean', 'p50', 'p95', 'max')}}
+
+    def reset(self):
+        with self.lock:
+            self.durations = DurationStats()
+            self.timeouts = 0
+
+readiness_stats = ReadinessStats()
+
+class elements_present:
+    """
+    Expected condition that is met once every CSS selector matches at least one element.
+    """
+    def __init__(self, selectors):
+        self.selectors = selectors
+
+    def __call__(self, driver):
+        return all(driver.find_elements(By.CSS_SELECTOR, selector) for selector in self.selectors)
+
+class network_idle:
+    """
+    Expected condition that is met once the document has loaded and no new resource
+    has been requested for quiet_time seconds.
+    """
+    def __init__(self, quiet_time=0.5):
+        self.quiet_time = quiet_time
+        self.resource_count = None
+        self.changed_at = time.perf_counter()
+
+    def __call__(self, driver):
+        ready_state, resource_count = driver.execute_script(
+            "return [document.readyState, performance.getEntriesByType('resource').length];")
+        now = time.perf_counter()
+        if ready_state != 'complete' or resource_count != self.resource_count:
+            self.resource_count = resource_count
+            self.changed_at = now
+            return False
+        return now - self.changed_at >= self.quiet_time
+
+def wait_for_page_ready(driver, selectors=PRODUCT_PAGE_SELECTORS, timeout=5, poll_frequency=0.1,
+                        wait_for_network_idle=False, stats=readiness_stats):
+    """
+    Waits until the nodes we parse are in the DOM, instead of sleeping for a fixed time.
+
+    Args:
+        driver: The WebDriver instance.
+        selectors (tuple): CSS selectors that must all match before the page counts as ready.
+        timeout (float): Seconds to wait before giving up.
+        poll_frequency (float): Seconds between two checks of the DOM.
+        wait_for_network_idle (bool): Wait for the network to go quiet instead of for the selectors.
+        stats (ReadinessStats): Where the duration of the wait is recorded.
+
+    Returns:
+        float: The number of seconds the page took to become ready.
+
+    Raises:
+        TimeoutException: If the page was not ready within timeout seconds.
+    """
+    condition = network_idle() if wait_for_network_idle else elements_present(selectors)
+    start = time.perf_counter()
+    try:
+        WebDriverWait(driver, timeout, poll_frequency=poll_frequency).until(condition)
+    except TimeoutException:
+        stats.record(time.perf_counter() - start, timed_out=True)
+        metrics.record('readiness_wait', time.perf_counter() - start)
+        metrics.increment('readiness_timeouts')
+        logger.error(f"Page was not ready after {timeout} seconds: {driver.current_url}")
+        raise
+    duration = time.perf_counter() - start
+    stats.record(duration)
+    metrics.record('readiness_wait', duration)
+    logger.debug("Page ready in %.3f seconds.", duration)
+    return duration
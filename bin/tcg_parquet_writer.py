@@ -0,0 +1,146 @@
+import logging
+import os
+import threading
+import uuid
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+# Get the absolute directory of the current script
+abs_dir = os.path.dirname(os.path.abspath(__file__))
+
+# Get the custom Logger from Configuration File
+logger = logging.getLogger(__name__)
+
+DEFAULT_PARQUET_DIR = os.path.join(abs_dir, '..', 'output', 'parquet')
+
+PRICE_COLUMNS = ['current_lowest_price', 'normal_market_price', 'foil_market_price', 'normal_buylist_price',
+                 'foil_buylist_price', 'normal_listed_median_price', 'foil_listed_median_price']
+
+# the date is not stored in the files, it is the hive partition key of the directory
+CARD_SCHEMA = pa.schema(
+    [('full_product_name', pa.string()), ('name', pa.string()), ('type', pa.list_(pa.string())), ('set', pa.string())]
+    + [(column, pa.float64()) for column in PRICE_COLUMNS]
+    + [('scrape_status', pa.string())]
+)
+
+def _price(value):
+    # store missing prices as nulls rather than NaN
+    if value is None or value != value:
+        return None
+    return float(value)
+
+class ParquetSink:
+    """
+    Buffers card rows and writes them as typed Parquet partitioned by date.
+
+    Rows are written to <root_dir>/date=YYYY-MM-DD/part-<run>.parquet, one row group per
+    row_group_size rows. The sink gets the rows the CsvRowSink wrote, which already dropped the
+    duplicates, so the output does not need to be read back and rewritten at the end of the run.
+    Call close() to write the file footers.
+
+    Example usage:
+        with ParquetSink() as sink:
+            sink.write(card_data)
+    """
+    def __init__(self, root_dir=DEFAULT_PARQUET_DIR, row_group_size=5000):
+        self.root_dir = root_dir
+        self.row_group_size = row_group_size
+        self.run_id = uuid.uuid4().hex[:8]
+        self.lock = threading.Lock()
+        self.buffers = {}
+        self.writers = {}
+        self.rows_written = 0
+
+    def write(self, rows):
+        """
+        Adds card rows to the buffer of their date and flushes every buffer that is full.
+
+        Args:
+            rows (list): Card dictionaries as returned by get_card_data().
+        """
+        with self.lock:
+            for row in rows:
+                buffer = self.buffers.setdefault(row['date'], [])
+                buffer.append(row)
+                if len(buffer) >= self.row_group_size:
+                    self._flush_date(row['date'])
+
+    def flush(self):
+        """
+        Writes every buffered row as a row group of its date partition.
+        """
+        with self.lock:
+            for date in list(self.buffers):
+                self._flush_date(date)
+
+    def close(self):
+        self.flush()
+        with self.lock:
+            for writer in self.writers.values():
+                writer.close()
+            self.writers = {}
+        logger.info(f"Parquet sink closed. {self.rows_written} row(s) written.")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _flush_date(self, date):
+        rows = self.buffers.pop(date, [])
+        if not rows:
+            return
+        try:
+            columns = {
+                'full_product_name': [row.get('full_product_name') for row in rows],
+                'name': [row.get('name') for row in rows],
+                'type': [list(row.get('type') or []) for row in rows],
+                'set': [row.get('set') for row in rows],
+                'scrape_status': [row.get('scrape_status') for row in rows],
+            }
+            for column in PRICE_COLUMNS:
+                columns[column] = [_price(row.get(column)) for row in rows]
+            table = pa.Table.from_pydict(columns, schema=CARD_SCHEMA)
+
+            if date not in self.writers:
+                partition_dir = os.path.join(self.root_dir, f'date={date}')
+                os.makedirs(partition_dir, exist_ok=True)
+                path = os.path.join(partition_dir, f'part-{self.run_id}.parquet')
+                self.writers[date] = pq.ParquetWriter(path, CARD_SCHEMA, compression='zstd')
+            self.writers[date].write_table(table)
+        except Exception as e:
+            logger.error(f"Error writing the parquet row group of {date}: {e}")
+            raise e
+        else:
+            self.rows_written += len(rows)
+            logger.info(f"Row group of {len(rows)} row(s) written for {date}.")
+
+def read_parquet_history(root_dir=DEFAULT_PARQUET_DIR, columns=None, start_date=None, end_date=None):
+    """
+    Reads card rows back from the partitioned Parquet output.
+
+    Only the requested columns are read, and only the date partitions between start_date and
+    end_date are opened.
+
+    Args:
+        root_dir (str): Root directory of the partitioned output.
+        columns (list, optional): Columns to read. 'date' is always included.
+        start_date (str, optional): First date to read, formatted as 'YYYY-MM-DD'.
+        end_date (str, optional): Last date to read, formatted as 'YYYY-MM-DD'.
+
+    Returns:
+        pandas.DataFrame: The matching rows.
+    """
+    partitioning = ds.partitioning(pa.schema([('date', pa.string())]), flavor='hive')
+    dataset = ds.dataset(root_dir, format='parquet', partitioning=partitioning)
+    condition = None
+    if start_date is not None:
+        condition = ds.field('date') >= start_date
+    if end_date is not None:
+        upper = ds.field('date') <= end_date
+        condition = upper if condition is None else condition & upper
+    if columns is not None:
+        columns = [column for column in columns if column != 'date'] + ['date']
+    return dataset.to_table(columns=columns, filter=condition).to_pandas()
@@ -0,0 +1,136 @@
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from tcg_metrics import metrics
+from tcg_logging import configured_log_file
+from tcg_html_extractors import init_parse_process
+
+# Get the custom Logger from Configuration File
+logger = logging.getLogger(__name__)
+
+def parse_page(html, date):
+    """
+    Parses a product page in a parse process.
+
+    Returns:
+        tuple: The card dictionary and the seconds the parse took, which the parent records since
+            the metrics of the parse processes are not collected.
+    """
+    import tcg_scraper_functions as tcg
+    start = time.perf_counter()
+    card = tcg.parse_card_html(html, date)
+    return card, time.perf_counter() - start
+
+class ParsePipeline:
+    """
+    Parses product pages in a pool of processes while the browsers keep navigating.
+
+    The browser threads only capture the HTML of a product page and submit() it. The parse runs in
+    a ProcessPoolExecutor, so the extraction and preprocessing of several pages use several cores,
+    and a single writer thread takes the results in the order they were submitted and hands every
+    card to on_card. At most max_pending pages are in flight; submit() blocks beyond that, so a
+    slow parse holds the browsers back instead of letting the HTML pile up in memory. when_written()
+    runs a callback once every page submitted before it is handed over, e.g. to mark a search page
+    as finished in the run manifest only after its rows are written. A page that does not parse is
+    counted in errors and skipped. A failure of on_card or of a when_written() callback, e.g. a full
+    disk, stops the writing instead: nothing more is written, submit() raises it and close() raises it
+    again, so the rows are not lost silently.
+
+    Args:
+        date (str): The current date.
+        on_card (callable): Called with the CardRow and the product link of every parsed page, from the writer thread.
+        on_error (callable, optional): Called with the product link and the error of a page that did not parse.
+        workers (int, optional): Number of parse processes. Defaults to the number of CPUs.
+        max_pending (int): Pages submitted and not yet handed to on_card before submit() blocks.
+        extractor (str): The extractor the pages are parsed with, see tcg_html_extractors.EXTRACTORS.
+
+    Example usage:
+        with ParsePipeline(date, lambda row, link: sink.write_row(row)) as pipeline:
+            for html, link in tcg.iter_card_data(elements, driver, date, raw=True):
+                pipeline.submit(html, link)
+    """
+    def __init__(self, date, on_card, on_error=None, workers=None, max_pending=32, extractor='soup'):
+        self.date = date
+        self.on_card = on_card
+        self.on_error = on_error
+        # forking a process that runs browser and logging threads can deadlock, so the processes are
+        # started by a forkserver and configure their own logging
+        self.executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('forkserver'),
+                                            initializer=init_parse_process, initargs=(extractor, configured_log_file()))
+        self.pending = queue.Queue(maxsize=max_pending)
+        self.cards = 0
+        self.errors = 0
+        self.failure = None
+        self.writer = threading.Thread(target=self._write, name='parse-writer', daemon=True)
+        self.writer.start()
+
+    def submit(self, html, link):
+        """
+        Hands a product page to the parse processes, blocking while max_pending pages are in flight.
+
+        Raises:
+            Exception: The error that stopped the writer thread.
+        """
+        if self.failure is not None:
+            raise self.failure
+        start = time.perf_counter()
+        self.pending.put((self.executor.submit(parse_page, html, self.date), link))
+        metrics.record('parse_queue_wait', time.perf_counter() - start)
+
+    def when_written(self, callback):
+        """
+        Runs callback from the writer thread once every page submitted so far is handed to on_card or on_error.
+        """
+        self.pending.put((None, callback))
+
+    def close(self):
+        """
+        Waits for the submitted pages to be written and stops the parse processes.
+
+        Raises:
+            Exception: The first error of on_card or of a when_written() callback.
+        """
+        self.pending.put(None)
+        self.writer.join()
+        self.executor.shutdown()
+        logger.info(f"Parse pipeline closed. {self.cards} page(s) parsed, {self.errors} failed.")
+        if self.failure is not None:
+            raise self.failure
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _write(self):
+        import tcg_scraper_functions as tcg
+        while True:
+            item = self.pending.get()
+            if item is None:
+                return
+            future, link = item
+            if self.failure is not None:
+                continue # only drained, so a browser blocked in submit() gets to see the failure
+            try:
+                if future is None:
+                    link() # a when_written() callback
+                    continue
+                try:
+                    card, seconds = future.result()
+                except Exception as e:
+                    # the writer keeps going, a page that failed stays outstanding in the manifest
+                    self.errors += 1
+                    logger.error(f"Error parsing product page {link}: {e}")
+                    if self.on_error is not None:
+                        self.on_error(link, e)
+                    continue
+                metrics.record('parse', seconds)
+                self.on_card(tcg.CardRow(**card), link)
+                self.cards += 1
+            except Exception as e:
+                self.failure = e
+                logger.error(f"Error writing the parsed product pages, nothing more is written: {e}", exc_info=True)
@@ -0,0 +1,199 @@
+import ast
+import logging
+import os
+import sqlite3
+from tcg_row_sink import read_csv_rows
+
+# Get the absolute directory of the current script
+abs_dir = os.path.dirname(os.path.abspath(__file__))
+
+# Get the custom Logger from Configuration File
+logger = logging.getLogger(__name__)
+
+DEFAULT_HISTORY_PATH = os.path.join(abs_dir, '..', 'output', 'price_history.db')
+
+PRICE_COLUMNS = ['current_lowest_price', 'normal_market_price', 'foil_market_price', 'normal_buylist_price',
+                 'foil_buylist_price', 'normal_listed_median_price', 'foil_listed_median_price']
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS cards (
+    card_id INTEGER PRIMARY KEY,
+    card_key TEXT NOT NULL UNIQUE,
+    full_product_name TEXT,
+    name TEXT,
+    "set" TEXT,
+    type TEXT
+);
+CREATE TABLE IF NOT EXISTS prices (
+    card_id INTEGER NOT NULL REFERENCES cards(card_id),
+    date TEXT NOT NULL,
+    {', '.join(f'{column} REAL' for column in PRICE_COLUMNS)},
+    PRIMARY KEY (card_id, date)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS prices_date ON prices(date, card_id);
+CREATE INDEX IF NOT EXISTS cards_set ON cards("set");
+"""
+
+def _type_list(value):
+    # the csv stores the type list as its string representation
+    if isinstance(value, str):
+        value = ast.literal_eval(value) if value.startswith('[') else [value]
+    if value is None or (isinstance(value, float) and value != value):
+        return []
+    return list(value)
+
+def _card_types(value):
+    # sorted, so the card key does not depend on the order the types are listed in
+    return sorted(_type_list(value))
+
+def _price(value):
+    if value is None or value != value:
+        return None
+    return float(value)
+
+def card_key(full_product_name, card_set, card_type):
+    """
+    Normalized identity of a card: its full product name, set and type(s), lower cased and
+    with runs of white space collapsed.
+
+    Args:
+        full_product_name (str): The full product name.
+        card_set (str): The set of the card.
+        card_type (list or str): The card type(s), as a list or as stored in the csv.
+
+    Returns:
+        str: The card key.
+    """
+    def normalize(text):
+        return ' '.join(str(text).split()).lower()
+    return '|'.join([normalize(full_product_name), normalize(card_set), normalize(','.join(_card_types(card_type)))])
+
+class PriceHistoryStore:
+    """
+    SQLite store of every daily price snapshot, keyed by card and date.
+
+    Cards are stored once in the cards table, prices in a (card_id, date) keyed table with an
+    index on date, so the price series of a card and the movers between two dates are index
+    lookups instead of reads of every daily csv.
+
+    Example usage:
+        store = PriceHistoryStore()
+        store.ingest_csv('output/optcg_data_20240101.csv')
+        store.top_movers('2024-01-01', '2024-01-31')
+    """
+    def __init__(self, db_path=DEFAULT_HISTORY_PATH):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self.connection = sqlite3.connect(db_path)
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @staticmethod
+    def _check_price_column(price_column):
+        if price_column not in PRICE_COLUMNS:
+            raise ValueError(f"Unknown price column {price_column}. Expected one of {PRICE_COLUMNS}.")
+
+    def ingest_rows(self, rows):
+        """
+        Adds card rows to the store. A card already stored for the same date is replaced.
+
+        Args:
+            rows (list): Card dictionaries as written to the daily csv.
+
+        Returns:
+            int: The number of rows ingested.
+        """
+        try:
+            with self.connection:
+                cursor = self.connection.cursor()
+                for row in rows:
+                    key = card_key(row['full_product_name'], row['set'], row['type'])
+                    cursor.execute('INSERT OR IGNORE INTO cards (card_key, full_product_name, name, "set", type) '
+                                   'VALUES (?, ?, ?, ?, ?)',
+                                   (key, row['full_product_name'], row['name'], row['set'],
+                                    ','.join(_card_types(row['type']))))
+                    card_id = cursor.execute('SELECT card_id FROM cards WHERE card_key = ?', (key,)).fetchone()[0]
+                    cursor.execute(f'INSERT OR REPLACE INTO prices (card_id, date, {", ".join(PRICE_COLUMNS)}) '
+                                   f'VALUES (?, ?, {", ".join("?" for _ in PRICE_COLUMNS)})',
+                                   [card_id, row['date']] + [_price(row.get(column)) for column in PRICE_COLUMNS])
+        except Exception as e:
+            logger.error(f"Error in the method ingest_rows(): {e}")
+            raise e
+        else:
+            logger.info(f"{len(rows)} row(s) ingested into {self.db_path}.")
+        return len(rows)
+
+    def ingest_csv(self, file_name, chunksize=10000):
+        """
+        Adds the rows of a daily csv to the store, reading it in chunks.
+
+        Returns:
+            int: The number of rows ingested.
+        """
+        count = 0
+        for chunk in read_csv_rows(file_name, chunksize=chunksize, numeric_columns=PRICE_COLUMNS):
+            count += self.ingest_rows(chunk)
+        return count
+
+    def find_cards(self, name):
+        """
+        Returns the (card_key, full_product_name, set, type) of the cards whose name contains the given text.
+        """
+        return self.connection.execute('SELECT card_key, full_product_name, "set", type FROM cards '
+                                       'WHERE name LIKE ? ORDER BY full_product_name', (f'%{name}%',)).fetchall()
+
+    def price_series(self, key, price_column='normal_market_price', start_date=None, end_date=None):
+        """
+        Returns the (date, price) series of one card, oldest first.
+
+        Args:
+            key (str): The card_key() of the card.
+            price_column (str): The price to return.
+            start_date (str, optional): First date, formatted as 'YYYY-MM-DD'.
+            end_date (str, optional): Last date, formatted as 'YYYY-MM-DD'.
+        """
+        self._check_price_column(price_column)
+        return self.connection.execute(
+            f'SELECT p.date, p.{price_column} FROM prices p JOIN cards c ON c.card_id = p.card_id '
+            'WHERE c.card_key = ? AND p.date >= ? AND p.date <= ? ORDER BY p.date',
+            (key, start_date or '0000-00-00', end_date or '9999-99-99')).fetchall()
+
+    def top_movers(self, start_date, end_date, price_column='normal_market_price', limit=10):
+        """
+        Returns the cards whose price changed the most between two dates, by relative change.
+
+        Returns:
+            list: (full_product_name, set, type, start price, end price, change, percent change) tuples.
+        """
+        self._check_price_column(price_column)
+        return self.connection.execute(
+            f'SELECT c.full_product_name, c."set", c.type, s.{price_column}, e.{price_column}, '
+            f'e.{price_column} - s.{price_column} AS change, '
+            f'100.0 * (e.{price_column} - s.{price_column}) / s.{price_column} AS percent_change '
+            'FROM prices s JOIN prices e ON e.card_id = s.card_id AND e.date = ? '
+            'JOIN cards c ON c.card_id = s.card_id '
+            f'WHERE s.date = ? AND s.{price_column} > 0 AND e.{price_column} IS NOT NULL '
+            'ORDER BY ABS(percent_change) DESC LIMIT ?',
+            (end_date, start_date, limit)).fetchall()
+
+    def set_aggregate(self, date, price_column='normal_market_price'):
+        """
+        Returns the number of cards, total, average, minimum and maximum price of every set on a date.
+
+        Returns:
+            list: (set, cards, total, average, minimum, maximum) tuples, by set.
+        """
+        self._check_price_column(price_column)
+        return self.connection.execute(
+            f'SELECT c."set", COUNT(p.{price_column}), SUM(p.{price_column}), AVG(p.{price_column}), '
+            f'MIN(p.{price_column}), MAX(p.{price_column}) '
+            'FROM prices p JOIN cards c ON c.card_id = p.card_id WHERE p.date = ? '
+            'GROUP BY c."set" ORDER BY c."set"', (date,)).fetchall()
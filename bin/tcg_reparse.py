@@ -0,0 +1,96 @@
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urljoin
+from tcg_page_cache import PageCache, DEFAULT_CACHE_DIR, PRODUCT, SEARCH, blob_path, read_blob
+from tcg_row_sink import CsvRowSink
+from tcg_metrics import metrics
+from tcg_logging import configured_log_file
+from tcg_html_extractors import extract_grid_tiles, init_parse_process
+
+# Get the absolute directory of the current script
+abs_dir = os.path.dirname(os.path.abspath(__file__))
+
+# Get the custom Logger from Configuration File
+logger = logging.getLogger(__name__)
+
+DEFAULT_REPARSE_DIR = os.path.join(abs_dir, '..', 'output', 'reparsed')
+
+def reparse_page(task):
+    """
+    Parses one cached page again. Runs in the worker processes of reparse().
+
+    Args:
+        task (tuple): The cache directory and the url, date, kind and content hash of the page.
+
+    Returns:
+        tuple: The kind of the page, the (card, link) pairs it yields and the error, None if it parsed.
+    """
+    import tcg_scraper_functions as tcg
+    cache_dir, url, date, kind, content_hash = task
+    try:
+        html = read_blob(blob_path(cache_dir, content_hash))
+        if kind == SEARCH:
+            cards = []
+            for href, title, set_name, market_price, lowest_price in extract_grid_tiles(html):
+                link = tcg.clean_card_link(urljoin(url, href)) if href else None
+                if link is not None:
+                    cards.append((tcg.parse_grid_tile(title, set_name, market_price, lowest_price, date), link))
+            return kind, cards, None
+        return kind, [(tcg.parse_card_html(html, date), url)], None
+    except (OSError, AttributeError, IndexError) as e:
+        return kind, [], f"{url}: {e}"
+
+def reparse(date, cache_dir=DEFAULT_CACHE_DIR, output_path=None, workers=None, extractor='soup', chunksize=8):
+    """
+    Runs the extraction again over the pages cached on date, in parallel across CPU cores, instead of crawling again.
+
+    Every page is read and parsed in a worker process with the current parse_card_html() and the
+    chosen extractor, search pages with extract_grid_tiles(). A card whose product page was cached
+    keeps the product page row over its grid row. The rows are written in the order of the cache
+    index to a new csv, which is replaced if it exists.
+
+    Args:
+        date (str): The date of the pages, formatted as 'YYYY-MM-DD'.
+        cache_dir (str): Directory of the page cache.
+        output_path (str, optional): The csv to write. Defaults to output/reparsed/optcg_data_<YYYYMMDD>.csv.
+        workers (int, optional): Number of worker processes. Defaults to the number of CPUs.
+        extractor (str): The extractor the product pages are read with, see tcg_html_extractors.EXTRACTORS.
+        chunksize (int): Pages handed to a worker at a time.
+
+    Returns:
+        dict: The output path and the number of pages, rows and pages that failed to parse.
+
+    Example usage:
+        reparse('2024-01-01', workers=8)
+    """
+    start = time.perf_counter()
+    with PageCache(cache_dir) as cache:
+        pages = cache.pages(date=date)
+    if output_path is None:
+        output_path = os.path.join(DEFAULT_REPARSE_DIR, f"optcg_data_{date.replace('-', '')}.csv")
+    if os.path.exists(output_path):
+        os.remove(output_path)
+    product_links = {url for url, _, kind, _ in pages if kind == PRODUCT}
+    tasks = [(cache_dir, url, page_date, kind, content_hash) for url, page_date, kind, content_hash in pages]
+
+    failed = 0
+    # a forkserver, not fork, so a caller's logging or other threads are not copied into the workers
+    context = multiprocessing.get_context('forkserver')
+    with CsvRowSink(output_path) as sink, ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                                              initializer=init_parse_process,
+                                                              initargs=(extractor, configured_log_file())) as executor:
+        for kind, cards, error in executor.map(reparse_page, tasks, chunksize=chunksize):
+            if error is not None:
+                failed += 1
+                logger.error(f"Error reparsing cached page {error}")
+                continue
+            sink.write([card for card, link in cards if kind == PRODUCT or link not in product_links])
+
+    elapsed = time.perf_counter() - start
+    metrics.record('reparse', elapsed)
+    logger.info(f"Reparsed {len(pages)} cached page(s) of {date} into {sink.rows_written} row(s) "
+                f"in {elapsed:.1f}s, {failed} failed.")
+    return {'output_path': output_path, 'pages': len(pages), 'rows': sink.rows_written, 'failed': failed}
@@ -0,0 +1,223 @@
+import csv
+import io
+import logging
+import os
+import threading
+import time
+from tcg_metrics import metrics
+
+# Get the custom Logger from Configuration File
+logger = logging.getLogger(__name__)
+
+def _as_dict(row):
+    return row.as_dict() if hasattr(row, 'as_dict') else row
+
+def _row_values(fieldnames, row):
+    # the row as it is written to the csv, so rows read back from the file compare equal
+    return tuple('' if row.get(field) is None else str(row.get(field)) for field in fieldnames)
+
+def _read_records(file, offset=0):
+    """
+    Yields the byte offset and the values of every csv record of a file opened in binary mode, from offset on.
+    """
+    file.seek(offset)
+    position = offset
+    def lines():
+        nonlocal position
+        for line in file:
+            position += len(line)
+            yield line.decode('utf-8')
+    reader = csv.reader(lines())
+    while True:
+        start = position # the reader only takes the lines of the record it returns
+        try:
+            values = next(reader)
+        except StopIteration:
+            return
+        yield start, values
+
+def read_csv_rows(file_name, chunksize=10000, numeric_columns=None):
+    """
+    Reads a daily csv in chunks of row dictionaries without loading pandas.
+
+    Values are typed the way pd.read_csv reads them back: empty cells are None and the numeric
+    columns are floats, so StreamingValidator and PriceHistoryStore get the same rows from either.
+
+    Args:
+        file_name (str): The daily csv.
+        chunksize (int): Number of rows per chunk.
+        numeric_columns (list, optional): Columns read as floats. Defaults to every column with 'price' in its name.
+
+    Yields:
+        list: The next chunk of rows.
+    """
+    with open(file_name, newline='') as file:
+        reader = csv.DictReader(file)
+        if numeric_columns is None:
+            numeric_columns = [column for column in reader.fieldnames or [] if 'price' in column]
+        numeric_columns = set(numeric_columns)
+        chunk = []
+        for row in reader:
+            for column, value in row.items():
+                if value == '' or value is None:
+                    row[column] = None
+                elif column in numeric_columns:
+                    row[column] = float(value)
+            chunk.append(row)
+            if len(chunk) >= chunksize:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+class CsvRowSink:
+    """
+    Appends card rows to the daily csv as they arrive, dropping duplicates on the way.
+
+    The file is opened once and flushed after every write, so a crashed run loses at most the
+    card that was being scraped. Duplicates are detected with the hashes of the written rows,
+    loaded from the file on open, instead of reading the file back into pandas at the end of the
+    run. Only the hash and the byte offset of every row are kept in memory, not the row: when a
+    hash matches, the rows at its offsets are read back and compared, so a row is only dropped if
+    it was really written before. Every written row is also passed to the write() method of each
+    of the sinks.
+
+    Args:
+        file_name (str): The daily csv.
+        sinks (list): Other sinks the written rows are passed to, e.g. a ParquetSink or StreamingValidator.
+        transform (callable, optional): Turns a row into the row written to the file, e.g.
+            CardCatalog.compact. Duplicates are detected on the written row, the sinks still get the
+            rows as they were passed in.
+
+    Example usage:
+        with CsvRowSink('output/optcg_data_20240101.csv') as sink:
+            for row, link in tcg.iter_card_data(elements, driver, date):
+                sink.write_row(row)
+    """
+    def __init__(self, file_name, sinks=(), transform=None):
+        self.file_name = file_name
+        self.sinks = list(sinks)
+        self.transform = transform
+        self.lock = threading.Lock()
+        self.offsets = {} # hash of a written row -> byte offset, or tuple of offsets, of the rows with that hash
+        self.size = 0
+        self.fieldnames = None
+        self.file = None
+        self.buffer = io.StringIO() # every line is rendered here first to know its size in the file
+        self.writer = None
+        self.rows_written = 0
+        self.duplicates = 0
+        if os.path.isfile(file_name) and os.path.getsize(file_name) > 0:
+            rows = 0
+            with open(file_name, 'rb') as file:
+                records = _read_records(file)
+                self.fieldnames = next(records)[1]
+                for offset, values in records:
+                    self._remember(hash(tuple(values)), offset)
+                    rows += 1
+            logger.info(f"Loaded {rows} row(s) already written to {file_name}.")
+
+    def _open(self, row):
+        if self.fieldnames is None:
+            self.fieldnames = list(row.keys())
+            os.makedirs(os.path.dirname(os.path.abspath(self.file_name)), exist_ok=True)
+            self.file = open(self.file_name, 'w', newline='', encoding='utf-8')
+            self.writer = csv.DictWriter(self.buffer, fieldnames=self.fieldnames, extrasaction='ignore')
+            self.writer.writeheader()
+            self._write_buffer()
+        else:
+            self.file = open(self.file_name, 'a', newline='', encoding='utf-8')
+            self.size = os.path.getsize(self.file_name)
+            self.writer = csv.DictWriter(self.buffer, fieldnames=self.fieldnames, extrasaction='ignore')
+
+    def _write_buffer(self):
+        # writes the rendered line to the file, returns its offset
+        line = self.buffer.getvalue()
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        self.file.write(line)
+        offset = self.size
+        self.size += len(line.encode('utf-8'))
+        return offset
+
+    def _remember(self, key, offset):
+        offsets = self.offsets.get(key)
+        if offsets is None:
+            self.offsets[key] = offset
+        else:
+            self.offsets[key] = (offsets if isinstance(offsets, tuple) else (offsets,)) + (offset,)
+
+    def _is_written(self, key, values):
+        offsets = self.offsets.get(key)
+        if offsets is None:
+            return False
+        # different rows can share a hash, so the rows with the same hash are read back and compared
+        self.file.flush()
+        with open(self.file_name, 'rb') as file:
+            for offset in offsets if isinstance(offsets, tuple) else (offsets,):
+                if tuple(next(_read_records(file, offset))[1]) == values:
+                    return True
+        return False
+
+    def write_row(self, row):
+        """
+        Writes one row unless it was written before.
+
+        Returns:
+            bool: True if the row was written, False if it was a duplicate.
+        """
+        return self.write([row]) == 1
+
+    def write(self, rows):
+        """
+        Writes the rows that were not written before and passes them to every sink.
+
+        Args:
+            rows (list): CardRow records or card dictionaries.
+
+        Returns:
+            int: The number of rows written.
+        """
+        start = time.perf_counter()
+        written = []
+        try:
+            with self.lock:
+                for row in rows:
+                    row = _as_dict(row)
+                    file_row = self.transform(row) if self.transform is not None else row
+                    if self.writer is None:
+                        self._open(file_row)
+                    values = _row_values(self.fieldnames, file_row)
+                    key = hash(values)
+                    if self._is_written(key, values):
+                        self.duplicates += 1
+                        continue
+                    self.writer.writerow(file_row)
+                    self._remember(key, self._write_buffer())
+                    written.append(row)
+                if written:
+                    self.file.flush()
+                    self.rows_written += len(written)
+                    for sink in self.sinks:
+                        sink.write(written)
+        except Exception as e:
+            logger.error(f"Error in the method CsvRowSink.write(): {e}")
+            raise e
+        finally:
+            metrics.record('write', time.perf_counter() - start)
+        metrics.increment('rows_written', len(written))
+        return len(written)
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+                self.writer = None
+        logger.info(f"{self.file_name} closed. {self.rows_written} row(s) written, {self.duplicates} duplicate(s) dropped.")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
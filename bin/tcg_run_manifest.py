@@ -0,0 +1,101 @@
+import json
+import logging
+import os
+import threading
+
+# Get the absolute directory of the current script
+abs_dir = os.path.dirname(os.path.abspath(__file__))
+
+# Get the custom Logger from Configuration File
+logger = logging.getLogger(__name__)
+
+DEFAULT_MANIFEST_DIR = os.path.join(abs_dir, '..', 'logs')
+
+class RunManifest:
+    """
+    Checkpoint of a scraping run, stored as logs/run_manifest_YYYYMMDD.json.
+
+    The manifest records the search pages of the run, which of them are finished and, for the
+    page being scraped, the product links that are still outstanding. It is rewritten atomically
+    after every change, so a crashed run can be resumed from the last finished page.
+
+    Args:
+        file_date (str): The run date formatted as 'YYYYMMDD'.
+        resume (bool): Load the manifest of an earlier run on the same date instead of starting a new one.
+        manifest_dir (str): Directory the manifest is stored in.
+
+    Example usage:
+        manifest = RunManifest('20240101', resume=True)
+        for page in manifest.remaining_pages(page_nums):
+            manifest.set_pending(page, links)
+            ...
+            manifest.complete_page(page)
+    """
+    def __init__(self, file_date, resume=False, manifest_dir=DEFAULT_MANIFEST_DIR):
+        self.path = os.path.join(manifest_dir, f'run_manifest_{file_date}.json')
+        self.lock = threading.Lock()
+        self.data = {'date': file_date, 'pages': [], 'completed_pages': [], 'pending_urls': {}}
+        if resume and os.path.exists(self.path):
+            with open(self.path) as file:
+                self.data = json.load(file)
+            logger.info(f"Resuming run from {self.path}: {len(self.data['completed_pages'])} page(s) finished, "
+                        f"{sum(len(urls) for urls in self.data['pending_urls'].values())} product url(s) pending.")
+        else:
+            os.makedirs(manifest_dir, exist_ok=True)
+            self._save()
+
+    @property
+    def pages(self):
+        return list(self.data['pages'])
+
+    def set_pages(self, page_nums):
+        """
+        Records the search pages of the run, so a resumed run does not need to look them up again.
+        """
+        with self.lock:
+            self.data['pages'] = list(page_nums)
+            self._save()
+
+    def is_page_completed(self, page):
+        return page in self.data['completed_pages']
+
+    def remaining_pages(self, page_nums):
+        """
+        Returns the pages of page_nums that are not finished yet.
+        """
+        completed = set(self.data['completed_pages'])
+        return [page for page in page_nums if page not in completed]
+
+    def set_pending(self, page, links):
+        """
+        Records the product links of a page that still have to be scraped.
+        """
+        with self.lock:
+            self.data['pending_urls'][str(page)] = list(links)
+            self._save()
+
+    def pending_urls(self):
+        """
+        Returns the outstanding product links of unfinished pages, keyed by page number.
+        """
+        return {int(page): list(links) for page, links in self.data['pending_urls'].items()}
+
+    def complete_page(self, page):
+        """
+        Marks a page as finished and drops its outstanding product links.
+        """
+        with self.lock:
+            if page not in self.data['completed_pages']:
+                self.data['completed_pages'].append(page)
+            self.data['pending_urls'].pop(str(page), None)
+            self._save()
+
+    def _save(self):
+        try:
+            temp_path = f'{self.path}.tmp'
+            with open(temp_path, 'w') as file:
+                json.dump(self.data, file)
+            os.replace(temp_path, self.path) # never leave a half written manifest behind
+        except Exception as e:
+            logger.error(f"Error saving the run manifest {self.path}: {e}")
+            raise e
@@ -1,26 +1,124 @@
-import pandas as pd
+import argparse
 import os
+from contextlib import ExitStack
 import tcg_scraper_functions as tcg
+from tcg_scraper_pool import ScraperPool
+import tcg_http_fetcher as fetcher
+from tcg_url_index import ScrapedUrlIndex
+from tcg_run_manifest import RunManifest
+from tcg_change_detection import SnapshotStore
+from tcg_price_history import PriceHistoryStore
+from tcg_delta import DeltaPublisher
+from tcg_html_extractors import EXTRACTORS, set_default_extractor
+from tcg_page_cache import set_default_cache
+from tcg_card_catalog import CardCatalog, set_default_catalog, read_daily_rows, DEFAULT_COMPACT_DIR
 import logging
-import logging.config
-from upload_to_s3 import upload_file
+from tcg_logging import configure_logging, get_log_file
+from upload_to_s3 import upload_file, upload_files, upload_new_bytes
 import tcg_validations as vtcg
+from tcg_metrics import metrics, DEFAULT_METRICS_DIR
 
-# Get the absolute directory of the current script
-abs_dir = os.path.dirname(os.path.abspath(__file__))
+# Get the custom Logger from Configuration File
+logger = logging.getLogger(__name__)
 
-# Construct the absolute path to the logging configuration file
-logging_config_path = os.path.join(abs_dir, '..', 'util', 'logging_to_file.conf')
+def _quit_drivers(drivers):
+    # quits the drivers the pool did not take, e.g. when every page was finished before a resumed run
+    while drivers:
+        try:
+            drivers.pop().quit()
+        except Exception as e:
+            logging.error(f"Error while closing driver: {e}")
 
-logging.config.fileConfig(fname=logging_config_path)
+def parse_args(args=None):
+    """
+    Parses the command line arguments of the scraper.
 
-# Get the custom Logger from Configuration File
-logger = logging.getLogger(__name__)
+    Args:
+        args (list, optional): The arguments to parse. Defaults to sys.argv.
 
-def main():
+    Returns:
+        argparse.Namespace: The parsed arguments.
+    """
+    parser = argparse.ArgumentParser(description="Scrape One Piece TCG card data from tcgplayer.com.")
+    parser.add_argument('--workers', type=int, default=int(os.getenv('OPTCG_WORKERS', '1')),
+                        help="Number of headless browsers scraping pages in parallel (env: OPTCG_WORKERS).")
+    parser.add_argument('--http', action='store_true', default=os.getenv('OPTCG_HTTP_FETCH') == '1',
+                        help="Fetch product pages over HTTP instead of clicking through them (env: OPTCG_HTTP_FETCH=1).")
+    parser.add_argument('--http-workers', type=int, default=int(os.getenv('OPTCG_HTTP_WORKERS', '8')),
+                        help="Maximum number of product pages fetched at the same time (env: OPTCG_HTTP_WORKERS).")
+    parser.add_argument('--rate', type=float, default=float(os.getenv('OPTCG_RATE', '0')),
+                        help="Requests per second per host in http mode, enables the adaptive crawl scheduler (env: OPTCG_RATE).")
+    parser.add_argument('--extractor', choices=list(EXTRACTORS), default=os.getenv('OPTCG_EXTRACTOR', 'soup'),
+                        help="HTML parser the product pages are read with (env: OPTCG_EXTRACTOR).")
+    parser.add_argument('--parse-workers', type=int, default=int(os.getenv('OPTCG_PARSE_WORKERS', '0')),
+                        help="Parse the product pages in this many processes while the browsers keep navigating, 0 parses them inline (env: OPTCG_PARSE_WORKERS).")
+    parser.add_argument('--grid', action='store_true', default=os.getenv('OPTCG_GRID') == '1',
+                        help="Read the cards from the search result tiles without opening product pages; the buylist and median prices stay empty (env: OPTCG_GRID=1).")
+    parser.add_argument('--enrich', action='store_true', default=os.getenv('OPTCG_ENRICH') == '1',
+                        help="Read the cards from the search result tiles and open the product pages only for the prices the tiles do not show (env: OPTCG_ENRICH=1).")
+    parser.add_argument('--cache', action='store_true', default=os.getenv('OPTCG_PAGE_CACHE') == '1',
+                        help="Keep the HTML of every fetched page zstd compressed under cache/pages, for optcg reparse (env: OPTCG_PAGE_CACHE=1).")
+    parser.add_argument('--catalog', action='store_true', default=os.getenv('OPTCG_CATALOG') == '1',
+                        help="Give every card a stable id in output/card_catalog.db and write the rows as (card_id, date, prices) under output/compact instead of the full daily csv (env: OPTCG_CATALOG=1).")
+    parser.add_argument('--resume', action='store_true',
+                        help="Resume today's run: skip finished search pages and scrape the outstanding product urls first.")
+    parser.add_argument('--incremental', action='store_true', default=os.getenv('OPTCG_INCREMENTAL') == '1',
+                        help="Only scrape products whose search result tile changed since the last run (env: OPTCG_INCREMENTAL=1).")
+    parser.add_argument('--parquet', action='store_true', default=os.getenv('OPTCG_PARQUET') == '1',
+                        help="Also write the rows as Parquet partitioned by date under output/parquet (env: OPTCG_PARQUET=1).")
+    parser.add_argument('--history', action='store_true', default=os.getenv('OPTCG_HISTORY') == '1',
+                        help="Add today's validated rows to the price history database output/price_history.db (env: OPTCG_HISTORY=1).")
+    parser.add_argument('--delta', action='store_true', default=os.getenv('OPTCG_DELTA') == '1',
+                        help="Also publish the inserts, price updates and delistings since the last published run under output/deltas (env: OPTCG_DELTA=1).")
+    parser.add_argument('--upload', action='store_true', default=os.getenv('OPTCG_UPLOAD') == '1',
+                        help="Upload today's data, the new log lines and the new scraped urls to S3_OPTCG_BUCKET_NAME (env: OPTCG_UPLOAD=1).")
+    return parser.parse_args(args)
+
+def main(workers=1, http=False, http_workers=8, rate=0, extractor='soup', parse_workers=0, grid=False, enrich=False,
+         cache=False, catalog=False, resume=False, incremental=False, parquet=False, history=False, delta=False, upload=False):
     """
     Main function to run the scraper
+
+    Args:
+        workers (int): Number of headless browsers the search pages are shared between.
+        http (bool): Fetch product pages over HTTP instead of clicking through them in the browser.
+        http_workers (int): Maximum number of product pages fetched at the same time in http mode.
+        rate (float): Requests per second per host in http mode. When set, every fetch goes through
+            a rate limited crawl scheduler that backs off on 429/5xx responses and timeouts.
+        extractor (str): HTML parser the product pages are read with, one of tcg_html_extractors.EXTRACTORS.
+        parse_workers (int): Parse the product pages the browsers open in this many processes, so
+            navigation and parsing overlap. Only used when the cards are clicked through in the browser.
+        grid (bool): Read the cards from the search result tiles, one page load per search page
+            instead of one per card. Takes precedence over http for the product pages.
+        enrich (bool): Like grid, then open the product page of every card for the foil market,
+            buylist and listed median prices the tiles do not show.
+        cache (bool): Store the HTML of every product page, and of the search pages in grid mode,
+            in the page cache so the rows can be parsed again later without crawling, see tcg_reparse.
+        catalog (bool): Parse the name, type and set of a product only the first time it is seen,
+            keep them in the card catalog under a stable card_id, and write today's rows as compact
+            (card_id, date, prices) rows to output/compact/optcg_prices_YYYYMMDD.csv instead of the
+            full daily csv. Validation, history and delta read them expanded through the catalog, and
+            upload sends the catalog along as output/compact/card_catalog.csv.
+        resume (bool): Continue today's run from its manifest instead of starting over from page 1.
+        incremental (bool): Carry the rows of products whose search result tile did not change
+            forward from the last snapshot, marked 'unchanged', and only scrape the rest.
+        parquet (bool): Also write the rows as typed Parquet partitioned by date.
+        history (bool): Add today's rows to the price history database once they are validated.
+        delta (bool): Write the changes of today's rows since the last published snapshot, keyed by
+            card identity, as a delta file and manifest for the downstream loader to upsert.
+        upload (bool): Upload today's data to the S3_OPTCG_BUCKET_NAME bucket, and only the bytes
+            appended to the log and the scraped url ledger since their last upload. With delta,
+            the delta and its manifest are uploaded under deltas/, the manifest last.
+
+    Durations and counts of every stage are written to logs/run_summary_YYYYMMDD.json and
+    logs/optcg_metrics.prom (Prometheus text format) when the run ends, also when it fails.
     """
+    metrics.reset()
+    file_date = None
+    page_cache = None
+    card_catalog = None
+    # the drivers, the daily file, the Parquet files and the scheduler of the scrape, closed also when it fails
+    scrape_resources = ExitStack()
     try:
         print("executing script")
         bucket = os.getenv('S3_OPTCG_BUCKET_NAME')
@@ -31,37 +129,138 @@ def main():
         data_file_path = f'{parent_dir}/output/optcg_data_{file_date}.csv'
         url_file_path = f'{parent_dir}/logs/card_link_list.csv'
 
+        if catalog:
+            card_catalog = set_default_catalog(CardCatalog())
+            # the identity of the cards is in the catalog, the daily file only holds their ids and prices
+            data_file_path = os.path.join(DEFAULT_COMPACT_DIR, f'optcg_prices_{file_date}.csv')
+
+        set_default_extractor(extractor)
+        if cache:
+            from tcg_page_cache import PageCache # zstandard is only loaded when pages are cached
+            page_cache = set_default_cache(PageCache())
+        url_index = ScrapedUrlIndex(url_file_path) # loaded once for the whole run
+        manifest = RunManifest(file_date, resume=resume) # checkpoint of finished pages and outstanding urls
+        snapshot = SnapshotStore() if incremental else None # last row and tile fingerprint of every product
+
         driver = tcg.create_driver()
-        elements = tcg.download_elements_from_webpage(driver, url="https://www.tcgplayer.com/search/one-piece-card-game/product?productLineName=one-piece-card-game&page=1&view=grid&ProductTypeName=Cards")
-        page_nums = tcg.get_max_page_number(driver) # get the max number of pages to scrape
+        drivers = [driver] # the first worker reuses the driver that is already open
+        scrape_resources.callback(_quit_drivers, drivers) # quits it if no worker took it
+        page_nums = manifest.pages
+        if not page_nums:
+            elements = tcg.download_elements_from_webpage(driver, url=tcg.build_search_url(1))
+            page_nums = tcg.get_max_page_number(driver) # get the max number of pages to scrape
+            manifest.set_pages(page_nums)
+
+        session = None
+        scheduler = None
+        if http:
+            # the scheduler does the retrying when it is used
+            session = fetcher.create_session(pool_size=http_workers, max_retries=0 if rate else 3)
+        if http and rate:
+            scheduler = fetcher.create_scheduler(session, rate=rate, max_in_flight=http_workers).start()
+            scrape_resources.callback(scheduler.stop)
+
+        parquet_sink = None
+        if parquet:
+            from tcg_parquet_writer import ParquetSink # pyarrow is only loaded when Parquet is written
+            parquet_sink = ParquetSink()
+            scrape_resources.callback(parquet_sink.close) # writes the footers, without them the files are unreadable
+        df_validator = vtcg.StreamingValidator() # validates the rows as they are written
+        if os.path.isfile(data_file_path):
+            # rows written earlier today, e.g. before a crash, are part of today's report
+            for chunk in read_daily_rows(data_file_path, card_catalog):
+                df_validator.write(chunk)
+        sinks = [df_validator] + ([parquet_sink] if parquet_sink is not None else [])
+        pool = ScraperPool(workers, date_column, data_file_path, url_index,
+                           driver_factory=lambda: drivers.pop() if drivers else tcg.create_driver(),
+                           http_session=session, http_workers=http_workers, http_scheduler=scheduler,
+                           manifest=manifest, snapshot=snapshot, sinks=sinks, grid=grid, enrich=enrich,
+                           parse_workers=parse_workers, extractor=extractor,
+                           row_transform=card_catalog.compact if card_catalog is not None else None)
+        scrape_resources.callback(pool.close)
+
+        # finish the product urls a crashed run left outstanding before loading any search page
+        for page, links in manifest.pending_urls().items():
+            if http:
+                links = [link for link in links if (date_column, link) not in url_index]
+                card_data,urls = fetcher.fetch_card_data(links, date_column, session=session,
+                                                         max_workers=http_workers, scheduler=scheduler)
+            else:
+                card_data,urls = tcg.get_card_data_from_links(links, driver, date_column, url_index=url_index)
+            if snapshot is not None:
+                card_data = snapshot.record([(card, url['url']) for card, url in zip(card_data, urls)], fingerprints={})
+            pool.write_rows(card_data)
+            url_index.add_many(urls)
+            remaining = [link for link in links if (date_column, link) not in url_index]
+            if remaining:
+                manifest.set_pending(page, remaining) # the page is scraped again below
+            else:
+                manifest.complete_page(page)
+
+        page_nums = manifest.remaining_pages(page_nums)
+        logging.info(f"{len(page_nums)} search page(s) left to scrape.")
 
-        for page in page_nums:
-            url = f"https://www.tcgplayer.com/search/one-piece-card-game/product?productLineName=one-piece-card-game&page={page}&view=grid&ProductTypeName=Cards"
-            elements = tcg.download_elements_from_webpage(driver, url=url) # get the webpage elements to scrape
-            card_data,urls = tcg.get_card_data(elements, driver, date_column) # scrape card data from page
-            tcg.write_csv(data_file_path, card_data)
-            tcg.write_csv(url_file_path, urls) 
+        pool.run(page_nums)
+        scrape_resources.close()
+        if snapshot is not None:
+            snapshot.save() # written once per run, not once per page
+
+        if scheduler is not None:
+            logging.info(f"Crawl throughput: {scheduler.metrics.snapshot()} Host rates: {scheduler.host_rates()}")
 
         # Validate the data 
         logging.info("Starting data validation...")
-        df = pd.read_csv(data_file_path)
-        df_validator = vtcg.DataFrameValidator(df)
         df_validator.df_show_schema()
         df_validator.validate_lowest_price()
-        df_validator.check_for_dupes()
+        num_of_dupes = df_validator.check_for_dupes(dropped=pool.row_sink.duplicates)
         df_validator.count_nulls()
         df_validator.row_count()
         logging.info("Validation completed...")
 
-        logging.info("Removing duplicates...")
-        df = df.drop_duplicates()
-        logging.info("Duplicates removed...")
-        df.to_csv(data_file_path, index=False, mode='w')
+        # rows are deduplicated as they are written, only files of older runs can still hold duplicates
+        if num_of_dupes > 0: # only rewrite the file when there is something to remove
+            logging.info("Removing duplicates...")
+            import pandas as pd
+            df = pd.read_csv(data_file_path)
+            df = df.drop_duplicates()
+            logging.info("Duplicates removed...")
+            df.to_csv(data_file_path, index=False, mode='w')
+
+        if page_cache is not None:
+            page_cache.evict() # keep the cache within its size and age limits
+
+        if history:
+            logging.info("Adding today's rows to the price history...")
+            with PriceHistoryStore() as store:
+                for chunk in read_daily_rows(data_file_path, card_catalog):
+                    store.ingest_rows(chunk)
+
+        delta_manifest = None
+        if delta:
+            logging.info("Computing the delta since the last published snapshot...")
+            publisher = DeltaPublisher()
+            delta_manifest = publisher.prepare((row for chunk in read_daily_rows(data_file_path, card_catalog)
+                                                for row in chunk), date_column)
 
         # once data is scraped, load files to s3 
-        #logging.info("Loading data into s3 bucket...")
-        #upload_file(file_path, bucket=bucket) # upload today's data to s3
-        #upload_file(file_name='../logs/tcg_pipeline.log', bucket=bucket) # upload logs to s3
+        if upload:
+            logging.info("Loading data into s3 bucket...")
+            data_files = [data_file_path]
+            if card_catalog is not None:
+                # the compact rows only hold card ids, their readers need the catalog too
+                catalog_file_path = os.path.join(DEFAULT_COMPACT_DIR, 'card_catalog.csv')
+                card_catalog.export_csv(catalog_file_path)
+                data_files.append(catalog_file_path)
+            upload_files(data_files, bucket=bucket) # upload today's data to s3
+            for append_only_file in [url_file_path, get_log_file()]:
+                if os.path.isfile(append_only_file):
+                    upload_new_bytes(append_only_file, bucket=bucket) # upload what was appended since the last run
+            if delta_manifest is not None:
+                # the loader starts on the manifest, so it goes up once the delta is there
+                for path in [delta_manifest['delta_path'], delta_manifest['manifest_path']]:
+                    upload_file(path, bucket, object_name=f'deltas/{os.path.basename(path)}')
+        if delta_manifest is not None:
+            publisher.commit(delta_manifest) # the next delta is computed against today's rows
         logging.info("Logging completed...")
 
     except Exception as e:
@@ -70,5 +269,21 @@ def main():
         raise e
     else:
         logging.info("TCG Pipeline script is completed.")
+    finally:
+        scrape_resources.close() # nothing left to close once the scrape finished
+        if card_catalog is not None:
+            set_default_catalog(None)
+            card_catalog.close()
+        if page_cache is not None:
+            set_default_cache(None)
+            page_cache.close()
+        if file_date is not None:
+            metrics.write_json(os.path.join(DEFAULT_METRICS_DIR, f'run_summary_{file_date}.json'))
+            metrics.write_prometheus(os.path.join(DEFAULT_METRICS_DIR, 'optcg_metrics.prom'))
+        logging.info(f"Where the time went:\n{metrics.report()}")
 if __name__== "__main__":
-    main()
\ No newline at end of file
+    args = parse_args()
+    configure_logging()
+    main(workers=args.workers, http=args.http, http_workers=args.http_workers, rate=args.rate,
+         extractor=args.extractor, parse_workers=args.parse_workers, grid=args.grid, enrich=args.enrich, cache=args.cache, catalog=args.catalog, resume=args.resume,
+         incremental=args.incremental, parquet=args.parquet, history=args.history, delta=args.delta, upload=args.upload)
\ No newline at end of file
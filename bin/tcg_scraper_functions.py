@@ -1,37 +1,41 @@
 import re
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.common.by import By
-from webdriver_manager.chrome import ChromeDriverManager
-from selenium.webdriver.chrome.options import Options
-import time 
-from bs4 import BeautifulSoup
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import StaleElementReferenceException
 from selenium.webdriver.support.ui import WebDriverWait
 import os
 from datetime import datetime
 import csv 
+from collections import namedtuple
 import logging
-import logging.config
 import tcg_data_preprocessing as pp
-import numpy as np
-import time
+from tcg_page_readiness import wait_for_page_ready, readiness_stats
+from tcg_url_index import ScrapedUrlIndex
+from tcg_html_extractors import default_extractor, GRID_TILE_SCRIPT, GRID_FIELD_SELECTORS, TILE_SELECTOR
+from tcg_metrics import metrics, timed
+from tcg_driver_factory import default_driver_factory
+from tcg_page_cache import cache_page, default_cache, SEARCH
+from tcg_card_catalog import default_catalog, parse_identity
 from selenium.common.exceptions import TimeoutException
-import pandas as pd
-import os 
 
-# Get the absolute directory of the current script
-abs_dir = os.path.dirname(os.path.abspath(__file__))
+# Get the custom Logger from Configuration File
+logger = logging.getLogger(__name__)
 
-# Construct the absolute path to the logging configuration file
-logging_config_path = os.path.join(abs_dir, '..', 'util', 'logging_to_file.conf')
+SEARCH_URL = "https://www.tcgplayer.com/search/one-piece-card-game/product?productLineName=one-piece-card-game&page={page}&view=grid&ProductTypeName=Cards"
 
-logging.config.fileConfig(fname=logging_config_path)
+def build_search_url(page):
+    """
+    Builds the tcgplayer.com search results URL for a given page number.
 
-# Get the custom Logger from Configuration File
-logger = logging.getLogger(__name__)
+    Args:
+        page (int): The search results page number.
+
+    Returns:
+        str: The URL of the search results page.
+    """
+    return SEARCH_URL.format(page=page)
 
+@timed('write')
 def write_csv(file_name, dict_data):
     """
     Writes a list of dictionaries to a CSV file.
@@ -46,6 +50,7 @@ def write_csv(file_name, dict_data):
     Returns:
         None
     """
+    row_count = len(dict_data) # dict_data is reused as the loop variable below
     try:
         if not os.path.isfile(file_name):
             with open(file_name, 'w', newline='') as file:
@@ -63,6 +68,7 @@ def write_csv(file_name, dict_data):
         logger.error(f'Error in the method write_csv(): {e}')
         raise e
     else:
+        metrics.increment('rows_written', row_count)
         logger.info(f'Successful write to {file_name} was successful.')
 
 def get_todays_date():
@@ -88,32 +94,20 @@ def create_driver():
     """
     Creates and returns a Chrome driver with specified options.
 
+    The driver binary path is resolved once and cached, and the driver reuses a persistent
+    profile with an HTTP cache and does not download images, fonts or tracking scripts, see
+    tcg_driver_factory.DriverFactory.
+
     Returns:
         driver (WebDriver): The created Chrome driver.
 
     Raises:
         Exception: If there is an error while creating the driver.
     """
-    try:
-        # Setup Chrome options
-        logging.info("Creating driver")
-        chrome_options = Options()
-        chrome_options.add_argument("--headless") 
-        chrome_options.add_argument("--no-sandbox")
-        chrome_options.add_argument("--disable-dev-shm-usage")
-        chrome_options.set_capability("browserVersion", "98")
-
-        driver = webdriver.Chrome(service=Service(ChromeDriverManager(version='114.0.5735.90').install()), options=chrome_options)
-
-
-    except Exception as e:
-        logger.error(f"Failed to start the Chrome driver. Exception: {e}")
-        raise e
-    else:
-        logger.info("Driver successfully created.")
-    return driver
+    return default_driver_factory()()
 
 
+@timed('search_page')
 def download_elements_from_webpage(driver, url):
     """
     Downloads elements from a webpage using the given driver and URL.
@@ -203,47 +197,137 @@ def get_max_page_number(driver):
             logging.error(f"Error in the method get_max_page_number(): {e}")
             raise e 
 
-def get_card_data(elements, driver, date):
+def clean_card_link(href):
     """
-    Get the card data from a list of elements.
+    Strips the tracking query string from a product link.
+
+    Args:
+        href (str): The href of a search result tile.
+
+    Returns:
+        str: The product link without the '?xid=' suffix, or None if the link has no such suffix.
+    """
+    match = re.search(r'.*(?=\?xid)', href)
+    return match.group(0) if match else None
+
+def get_product_links(elements):
+    """
+    Collects the product links of every tile on a search results page in one pass.
+
+    Args:
+        elements: The search result elements returned by download_elements_from_webpage().
+
+    Returns:
+        list: The cleaned product links, in the order they appear on the page.
+    """
+    links = [clean_card_link(element.get_attribute('href')) for element in elements]
+    return [link for link in links if link is not None]
+
+PRICE_COLUMNS = ['current_lowest_price', 'normal_market_price', 'foil_market_price', 'normal_buylist_price',
+                 'foil_buylist_price', 'normal_listed_median_price', 'foil_listed_median_price']
+CARD_COLUMNS = ['full_product_name', 'name', 'type', 'set'] + PRICE_COLUMNS + ['date']
+
+class CardRow(namedtuple('CardRow', CARD_COLUMNS)):
+    """
+    Compact, immutable row of one card, in the column order of the daily csv.
+
+    A named tuple with no per instance __dict__, so a row takes a fraction of the memory of the
+    equivalent dictionary.
+    """
+    __slots__ = ()
+
+    def as_dict(self):
+        return dict(zip(self._fields, self))
+
+@timed('parse')
+def parse_card_html(html, date, extractor=None):
+    """
+    Parses the HTML of a product page into a card dictionary.
+
+    Args:
+        html (str): The HTML of the product page after all JavaScript has been executed.
+        date (str): The current date.
+        extractor (optional): The HTML extractor to read the page with, see tcg_html_extractors.
+            Defaults to the one selected by OPTCG_EXTRACTOR, BeautifulSoup if unset.
+
+    Returns:
+        dict: The card data.
+
+    Raises:
+        AttributeError: If one of the expected elements is missing from the page.
+    """
+    if extractor is None:
+        extractor = default_extractor()
+    lowest_price_text, product_name, price_texts = extractor.extract(html)
+
+    current_lowest_listed_price = pp.convert_to_number(lowest_price_text)
+    logger.debug("Current lowest price collected...")
+    
+    # the identity of a product never changes, the catalog parses it the first time it is seen
+    catalog = default_catalog()
+    name, card_type, product_set = catalog.identity(product_name) if catalog is not None else parse_identity(product_name)
+    logger.debug("Product name, set and type collected...")
+    
+    scraped_prices = [pp.convert_to_number(price) for price in price_texts]
+    logger.debug("Prices collected...")
+
+    card = {
+        'full_product_name': product_name,
+        'name': name,
+        'type': card_type,
+        'set': product_set,
+        'current_lowest_price': current_lowest_listed_price,
+        'normal_market_price': pp.NAN,
+        'foil_market_price': pp.NAN,
+        'normal_buylist_price': pp.NAN,
+        'foil_buylist_price': pp.NAN,
+        'normal_listed_median_price': pp.NAN,
+        'foil_listed_median_price': pp.NAN,
+        'date': date }
+
+    price_names = ['normal_market_price', 'foil_market_price', 'normal_buylist_price', 'foil_buylist_price', 
+                'normal_listed_median_price', 'foil_listed_median_price']
+
+    for price_name, price_value in zip(price_names, scraped_prices):
+        card[price_name] = price_value
+    return card
+
+def iter_card_data(elements, driver, date, url_index=None, raw=False):
+    """
+    Get the card data from a list of elements, one card at a time.
+
+    Every card is yielded as soon as its product page is parsed, so the caller can write it
+    before the next card is scraped and nothing but the card in progress is held in memory.
 
     Args:
         elements: A list of elements to get the card data from.
         driver: The WebDriver instance.
         date: The current date.
+        url_index (ScrapedUrlIndex, optional): Index of the links already scraped. Pass the same
+            index for every page of a run so the ledger is only read once.
+        raw (bool): Yield the HTML of the product page instead of parsing it, for a caller that
+            parses elsewhere, see tcg_parse_pipeline.ParsePipeline.
 
-    Returns:
-        A list of dictionaries containing the card data.
+    Yields:
+        tuple: The CardRow of a card, or its HTML with raw, and its cleaned product link, None if the tile had no link.
 
    Raises:
         StaleElementReferenceException: If a stale element reference exception occurs when clicking on a web element.
         Exception: If any other exception occurs during the execution of the function.
     Example Usage:
         elements = driver.find_elements(By.CSS_SELECTOR, "div.search-result__content > a")
-        card_data = get_card_data(elements, driver, '2021-10-01') """
+        for row, link in iter_card_data(elements, driver, '2021-10-01'):
+            ... """
     
     logging.info("Getting card data...")
-    card_list = []
-    url_list = []
+    cards = 0
 
     wait_time = 10
+    ready_timeout = 5
     attempts = 0
     max_attempts = 3
-    scraped_cards_file_path = os.path.join(abs_dir, '..', 'logs', 'card_link_list.csv')
-
-    #scraped_cards_file_path = 'logs/card_link_list.csv'
-
-    # check if link has already been scraped
-    if not os.path.exists(scraped_cards_file_path):
-        # Create an empty DataFrame with desired columns and save it as csv
-        df = pd.DataFrame(columns=['date', 'url'])
-        df.to_csv(scraped_cards_file_path, index=False)
-        logging.info(f"New file created at {scraped_cards_file_path}.")
-
-    # Read file and get the scraped urls 
-    df = pd.read_csv(scraped_cards_file_path)
-    df = df[df['date'] == date]
-    list_of_values = pd.Series(df['url']).tolist()
+    if url_index is None:
+        url_index = ScrapedUrlIndex()
 
     # iterate over each element and click on it
     while attempts < max_attempts:
@@ -255,76 +339,34 @@ def get_card_data(elements, driver, date):
                 
                 #elements = driver.find_elements(By.CSS_SELECTOR, "div.search-result__content > a")
                 
-                card_link = elements[i].get_attribute('href')
-                match = re.search(r'.*(?=\?xid)', card_link)
-                card_link = match.group(0) if match else None
-                print(card_link)
+                card_link = clean_card_link(elements[i].get_attribute('href'))
+                logger.debug("Opening product page %s", card_link)
 
-                if card_link in list_of_values:
-                    logging.info(f"Link {elements[i].get_attribute('href')} has already been scraped.")
+                if (date, card_link) in url_index:
+                    logger.debug("Link %s has already been scraped.", card_link)
                     continue
 
                 # click on the element
-                elements[i].click()
+                with metrics.timer('navigation'):
+                    elements[i].click()
 
-                # Perform the operations you want on the new page
-                time.sleep(wait_time)
+                # wait until the nodes we parse are rendered instead of sleeping a fixed time
+                try:
+                    wait_for_page_ready(driver, timeout=ready_timeout)
+                except TimeoutException:
+                    driver.back() # return to the search results so the next card can be found
+                    raise
 
                 # You can use driver.page_source to get the HTML content of the page 
                 # after all JavaScript has been executed
-
                 html = driver.page_source
+                cache_page(card_link, date, html)
+                row = html if raw else CardRow(**parse_card_html(html, date))
 
-                # Then, you can parse this HTML as usual using BeautifulSoup
-
-                soup = BeautifulSoup(html, 'html.parser')
-
-                # Now you can select elements from the soup object as usual
-                
-                current_lowest_listed_price = pp.convert_to_number(soup.find('span', {'class': 'spotlight__price'}).text)
-                logging.info("Current lowest price collected...")
-                
-                product_name = soup.find('h1', {'class': 'product-details__name'}).text
-                name = pp.get_card_name(product_name)
-                logging.info("Product name collected...")
-                
-                product_set = re.split('- ', product_name, maxsplit=1)[1].strip()
-                logging.info("Product set collected...")
-                
-                prices_section = soup.find('section', class_='price-points price-guide__points')
-                scraped_prices = [pp.convert_to_number(span.text) for span in prices_section.find_all('span', class_='price')]
-                logging.info("Prices collected...")
-                
-                card_type = pp.get_card_type(product_name)
-
-                card = {
-                    'full_product_name': product_name,
-                    'name': name,
-                    'type': card_type,
-                    'set': product_set,
-                    'current_lowest_price': current_lowest_listed_price,
-                    'normal_market_price': np.nan,
-                    'foil_market_price': np.nan,
-                    'normal_buylist_price': np.nan,
-                    'foil_buylist_price': np.nan,
-                    'normal_listed_median_price': np.nan,
-                    'foil_listed_median_price': np.nan,
-                    'date': date }
-            
-                price_names = ['normal_market_price', 'foil_market_price', 'normal_buylist_price', 'foil_buylist_price', 
-                            'normal_listed_median_price', 'foil_listed_median_price']
-
-                for price_name, price_value in zip(price_names, scraped_prices):
-                    card[price_name] = price_value
-                
-                card_list.append(card) # add the dictionary containing all of the card data to the card_list variable 
-
-                # save link of the element
-                if card_link is not None:
-                    url_list.append({'url':card_link, 'date':date})
-
-                # navigate back to the original page
+                # navigate back to the original page before handing the card over
                 driver.back()
+                cards += 1
+                yield row, card_link
             except TimeoutException as e:
                 attempts += 1
                 if attempts >= max_attempts:
@@ -349,8 +391,173 @@ def get_card_data(elements, driver, date):
                 logging.error(f'Error with get_card_data() method: {e}') 
                 raise e
             else:
-                logging.info(f"Card data was successfully scraped for {len(card_list)} cards.")
-        return card_list, url_list
-    
+                logger.debug("Card data was successfully scraped for %d cards.", cards)
+        logging.info(f"Product page readiness of the run so far: {readiness_stats.summary()}")
+        return
+
+def get_card_data(elements, driver, date, url_index=None):
+    """
+    Get the card data from a list of elements.
 
-    
\ No newline at end of file
+    List version of iter_card_data(), kept for callers that need the whole page at once.
+
+    Args:
+        elements: A list of elements to get the card data from.
+        driver: The WebDriver instance.
+        date: The current date.
+        url_index (ScrapedUrlIndex, optional): Index of the links already scraped.
+
+    Returns:
+        A list of dictionaries containing the card data and a list of {'url', 'date'} dictionaries of the scraped links.
+    """
+    card_list = []
+    url_list = []
+    for row, card_link in iter_card_data(elements, driver, date, url_index=url_index):
+        card_list.append(row.as_dict())
+        if card_link is not None:
+            url_list.append({'url':card_link, 'date':date})
+    return card_list, url_list
+
+def get_card_data_from_links(links, driver, date, url_index=None):
+    """
+    Get the card data by opening product links directly, without going through the search results.
+
+    Used to finish the outstanding product links of a resumed run. A link whose page does not
+    load or parse is logged and skipped, so it stays outstanding.
+
+    Args:
+        links (list): The product links to scrape.
+        driver: The WebDriver instance.
+        date: The current date.
+        url_index (ScrapedUrlIndex, optional): Index of the links already scraped.
+
+    Returns:
+        A list of dictionaries containing the card data and a list of {'url', 'date'} dictionaries of the scraped links.
+    """
+    if url_index is None:
+        url_index = ScrapedUrlIndex()
+    card_list = []
+    url_list = []
+    for link in links:
+        if (date, link) in url_index:
+            continue
+        try:
+            with metrics.timer('navigation'):
+                driver.get(link)
+            wait_for_page_ready(driver)
+            html = driver.page_source
+            cache_page(link, date, html)
+            card_list.append(parse_card_html(html, date))
+            url_list.append({'url':link, 'date':date})
+        except (TimeoutException, AttributeError, IndexError) as e:
+            logging.error(f'Error with get_card_data_from_links() method: {e} \n URL: {link}')
+    logging.info(f"Card data was successfully scraped for {len(card_list)} of {len(links)} link(s).")
+    return card_list, url_list
+
+# the prices a product page has and the search results grid does not show
+ENRICH_COLUMNS = ['foil_market_price', 'normal_buylist_price', 'foil_buylist_price', 'normal_listed_median_price',
+                  'foil_listed_median_price']
+
+def parse_grid_tile(title, set_name, market_price, lowest_price, date):
+    """
+    Parses the fields of a search result tile into a card dictionary.
+
+    The tile shows the product name, the set, a market price and the lowest listing. The market
+    price is stored as normal_market_price and the ENRICH_COLUMNS are left empty. A title that
+    does not end in the set gets ' - <set>' appended, so the card has the same full_product_name,
+    and the same identity downstream, as when its product page is parsed.
+
+    Args:
+        title (str): The product name shown on the tile.
+        set_name (str): The set shown on the tile, or None.
+        market_price (str): The market price text, or None.
+        lowest_price (str): The lowest listing price text, or None.
+        date (str): The current date.
+
+    Returns:
+        dict: The card data.
+
+    Raises:
+        AttributeError: If the tile has no title.
+    """
+    if title is None:
+        raise AttributeError("The search result tile has no title")
+    product_name = ' '.join(title.split())
+    if '- ' not in product_name and set_name:
+        product_name = f"{product_name} - {' '.join(set_name.split())}"
+    name_and_set = re.split('- ', product_name, maxsplit=1)
+
+    card = dict.fromkeys(CARD_COLUMNS, pp.NAN)
+    card.update({
+        'full_product_name': product_name,
+        'name': pp.get_card_name(product_name),
+        'type': pp.get_card_type(product_name),
+        'set': name_and_set[1].strip() if len(name_and_set) > 1 else None,
+        'current_lowest_price': pp.convert_to_number(lowest_price) if lowest_price else pp.NAN,
+        'normal_market_price': pp.convert_to_number(market_price) if market_price else pp.NAN,
+        'date': date })
+    return card
+
+def iter_grid_card_data(driver, date, url_index=None, enrich=False):
+    """
+    Get the card data of every tile of the search results page the driver is on, without opening product pages.
+
+    All tiles are read with one script in one round trip, see tcg_html_extractors.GRID_TILE_SCRIPT,
+    so a page of 24 cards costs a single page load. With enrich, the product page of every card
+    is opened directly afterwards to fill in the ENRICH_COLUMNS; a product page that does not load
+    or parse is logged and the card keeps its grid row.
+
+    Args:
+        driver: The WebDriver instance, on a search results page.
+        date: The current date.
+        url_index (ScrapedUrlIndex, optional): Index of the links already scraped.
+        enrich (bool): Open the product pages for the prices the grid does not show.
+
+    Yields:
+        tuple: The CardRow of a card and its cleaned product link.
+    """
+    if url_index is None:
+        url_index = ScrapedUrlIndex()
+    if default_cache() is not None:
+        # the tiles are read by script, the search page itself is only fetched when it is cached
+        cache_page(driver.current_url, date, driver.page_source, SEARCH)
+    tiles = driver.execute_script(GRID_TILE_SCRIPT, GRID_FIELD_SELECTORS, TILE_SELECTOR)
+    cards = 0
+    for href, title, set_name, market_price, lowest_price in tiles:
+        card_link = clean_card_link(href) if href else None
+        if card_link is None or (date, card_link) in url_index:
+            continue
+        try:
+            with metrics.timer('parse'):
+                card = parse_grid_tile(title, set_name, market_price, lowest_price, date)
+        except AttributeError as e:
+            logging.error(f'Error with iter_grid_card_data() method: {e} \n URL: {card_link}')
+            continue
+        if enrich:
+            try:
+                with metrics.timer('navigation'):
+                    driver.get(card_link)
+                wait_for_page_ready(driver)
+                html = driver.page_source
+                cache_page(card_link, date, html)
+                page = parse_card_html(html, date)
+                card.update((column, page[column]) for column in ENRICH_COLUMNS)
+            except (TimeoutException, AttributeError, IndexError) as e:
+                logging.error(f'Error enriching the grid row in iter_grid_card_data(): {e} \n URL: {card_link}')
+        cards += 1
+        yield CardRow(**card), card_link
+    logging.info(f"Card data was read from the grid for {cards} of {len(tiles)} tile(s).")
+
+def get_grid_card_data(driver, date, url_index=None, enrich=False):
+    """
+    List version of iter_grid_card_data().
+
+    Returns:
+        A list of dictionaries containing the card data and a list of {'url', 'date'} dictionaries of the scraped links.
+    """
+    card_list = []
+    url_list = []
+    for row, card_link in iter_grid_card_data(driver, date, url_index=url_index, enrich=enrich):
+        card_list.append(row.as_dict())
+        url_list.append({'url':card_link, 'date':date})
+    return card_list, url_list
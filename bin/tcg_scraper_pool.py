@@ -0,0 +1,290 @@
+import logging
+import queue
+import threading
+from selenium.common.exceptions import WebDriverException
+import tcg_scraper_functions as tcg
+import tcg_http_fetcher as fetcher
+from tcg_row_sink import CsvRowSink
+from tcg_parse_pipeline import ParsePipeline
+
+# Get the custom Logger from Configuration File
+logger = logging.getLogger(__name__)
+
+def driver_is_alive(driver):
+    """
+    Checks whether a web driver session is still usable.
+
+    Args:
+        driver: The WebDriver instance to check.
+
+    Returns:
+        bool: True if the browser still answers commands, False if the session has crashed or was closed.
+    """
+    try:
+        driver.current_url
+    except WebDriverException:
+        return False
+    return True
+
+class ScraperPool:
+    """
+    Scrapes search result pages in parallel with a pool of headless browsers.
+
+    Each worker thread owns its own driver and takes page numbers from a shared work queue. A
+    worker whose driver crashes gets a new driver and its page is put back in the queue. Card rows
+    are appended to the daily file through one CsvRowSink, which drops duplicates and never
+    interleaves rows from different workers; in the browser they are written as the cards are
+    scraped, so a crash loses at most the card in progress.
+
+    Args:
+        num_workers (int): Number of worker threads, each with its own driver.
+        date (str): The current date.
+        data_file_path (str): The daily csv.
+        url_index (ScrapedUrlIndex): Index of the links already scraped, shared by the workers.
+        driver_factory (callable): Creates a driver.
+        max_page_attempts (int): Attempts of a page before it fails the run.
+        http_session (requests.Session, optional): Fetch the product pages over HTTP, the drivers
+            only load the search pages.
+        http_workers (int): Product pages fetched at the same time in http mode.
+        http_scheduler (CrawlScheduler, optional): Scheduler the http fetches go through.
+        manifest (RunManifest, optional): Records the pending links and finished pages.
+        snapshot (SnapshotStore, optional): Only scrape the products whose search result tile changed.
+        sinks (list): Other sinks every batch of written rows is passed to, e.g. a ParquetSink or StreamingValidator.
+        grid (bool): Read the rows from the search result tiles, see tcg_scraper_functions.iter_grid_card_data().
+        enrich (bool): Like grid, then open the product pages for the prices the tiles do not show.
+        page_source (callable, optional): Called by a worker that finds the queue empty for more
+            pages, e.g. from a coordinator; an empty list means there is no work left.
+        on_page_failed (callable, optional): Called with a page and its error once it has failed max_page_attempts times.
+        parse_workers (int): Parse the product pages in this many processes while the browsers move
+            on, see ParsePipeline. A page is finished in the manifest once its rows are written.
+        extractor (str, optional): The extractor of the parse processes. Defaults to the process default.
+        row_transform (callable, optional): Turns a row into the row written to the daily file, see CsvRowSink.
+
+    Example usage:
+        pool = ScraperPool(4, '2024-01-01', 'output/optcg_data_20240101.csv', ScrapedUrlIndex())
+        pool.run(tcg.get_max_page_number(driver))
+    """
+    def __init__(self, num_workers, date, data_file_path, url_index,
+                 driver_factory=tcg.create_driver, max_page_attempts=3, http_session=None, http_workers=8,
+                 http_scheduler=None, manifest=None, snapshot=None, sinks=(), grid=False, enrich=False,
+                 page_source=None, on_page_failed=None, parse_workers=0, extractor=None,
+                 row_transform=None):
+        self.num_workers = num_workers
+        self.date = date
+        self.data_file_path = data_file_path
+        self.url_index = url_index
+        self.manifest = manifest
+        self.snapshot = snapshot
+        self.sinks = list(sinks)
+        self.grid = grid or enrich
+        self.enrich = enrich
+        self.row_sink = CsvRowSink(data_file_path, sinks=self.sinks, transform=row_transform)
+        self.driver_factory = driver_factory
+        self.max_page_attempts = max_page_attempts
+        self.http_session = http_session
+        self.http_workers = http_workers
+        self.http_scheduler = http_scheduler
+        self.page_source = page_source
+        self.on_page_failed = on_page_failed
+        self.parse_workers = parse_workers
+        self.extractor = extractor
+        self.parse_pipeline = None
+        self.pages = queue.Queue()
+        self.write_lock = threading.Lock()
+        self.attempts = {}
+        self.errors = []
+        self.restarts = 0
+        self.cards_written = 0
+
+    def run(self, page_nums):
+        """
+        Scrapes every page in page_nums and blocks until the work queue is drained.
+
+        Args:
+            page_nums (list): The search result page numbers to scrape.
+
+        Returns:
+            int: The number of card rows written to the daily file.
+
+        Raises:
+            RuntimeError: If pages are left over because no worker could start a driver.
+            Exception: The first error of a page that still failed after max_page_attempts attempts.
+            Exception: The first error of a row or manifest write of the parse pipeline.
+        """
+        for page in page_nums:
+            self.pages.put(page)
+
+        num_workers = self.num_workers if self.page_source else max(1, min(self.num_workers, len(page_nums)))
+        logger.info(f"Starting scraper pool with {num_workers} worker(s) for {len(page_nums)} page(s).")
+        if self.parse_workers and not self.grid and self.http_session is None and self.snapshot is None:
+            # the parse processes are shared by every browser, the cards are written from the pipeline's writer thread
+            self.parse_pipeline = ParsePipeline(self.date, self._write_card, workers=self.parse_workers,
+                                                max_pending=4 * self.parse_workers,
+                                                extractor=self.extractor or tcg.default_extractor().name)
+        workers = [threading.Thread(target=self._worker, name=f"scraper-worker-{i}", daemon=True)
+                   for i in range(num_workers)]
+        try:
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+        finally:
+            if self.parse_pipeline is not None:
+                pipeline, self.parse_pipeline = self.parse_pipeline, None
+                pipeline.close() # raises the first error of a row or manifest write
+                if pipeline.errors:
+                    logger.error(f"{pipeline.errors} product page(s) did not parse, "
+                                 f"their links stay outstanding in the manifest.")
+
+        if not self.pages.empty():
+            raise RuntimeError(f"Scraper pool stopped with {self.pages.qsize()} page(s) left, no worker could start a driver.")
+        if self.errors:
+            failed_pages = sorted(page for page, _ in self.errors)
+            logger.error(f"Scraper pool finished with failed page(s): {failed_pages}")
+            raise self.errors[0][1]
+        logger.info(f"Scraper pool finished. {self.cards_written} card(s) written, {self.restarts} driver restart(s).")
+        return self.cards_written
+
+    def _worker(self):
+        driver = None
+        try:
+            while True:
+                try:
+                    page = self.pages.get_nowait()
+                except queue.Empty:
+                    # the page source blocks until it has pages, an empty list means there is no work left
+                    new_pages = self.page_source() if self.page_source is not None else []
+                    if not new_pages:
+                        return
+                    for new_page in new_pages:
+                        self.pages.put(new_page)
+                    continue
+
+                if driver is None:
+                    try:
+                        driver = self.driver_factory()
+                    except Exception as e:
+                        # without a driver this worker cannot make progress, leave the page to the others
+                        self.pages.put(page)
+                        logger.error(f"Worker {threading.current_thread().name} could not start a driver: {e}")
+                        return
+
+                try:
+                    self._scrape_page(driver, page)
+                except Exception as e:
+                    if not driver_is_alive(driver):
+                        logger.error(f"Driver crashed on page {page}, restarting it: {e}")
+                        self._quit(driver)
+                        driver = None
+                        with self.write_lock:
+                            self.restarts += 1
+                    self._retry_or_fail(page, e)
+        finally:
+            if driver is not None:
+                self._quit(driver)
+
+    def write_rows(self, rows):
+        """
+        Appends the card rows that were not written before to the daily file and passes them to every sink.
+
+        Args:
+            rows (list): CardRow records or card dictionaries as returned by get_card_data().
+        """
+        if not rows:
+            return
+        written = self.row_sink.write(rows)
+        with self.write_lock:
+            self.cards_written += written
+
+    def _write_card(self, row, link):
+        self.write_rows([row])
+        if link is not None:
+            self.url_index.add(self.date, link)
+
+    def _finish_page(self, page, links):
+        # runs once every product page of the page went through the parse pipeline
+        remaining = [link for link in links if (self.date, link) not in self.url_index]
+        if remaining:
+            self.manifest.set_pending(page, remaining)
+        else:
+            self.manifest.complete_page(page)
+
+    def close(self):
+        """
+        Closes the daily file.
+        """
+        self.row_sink.close()
+
+    def _scrape_page(self, driver, page):
+        elements = tcg.download_elements_from_webpage(driver, url=tcg.build_search_url(page))
+        if self.snapshot is not None:
+            carried, carried_urls, fingerprints = self.snapshot.carry_forward(driver, self.date, self.url_index)
+            self.write_rows(carried)
+            self.url_index.add_many(carried_urls)
+        links = []
+        if self.manifest is not None:
+            links = [link for link in tcg.get_product_links(elements) if (self.date, link) not in self.url_index]
+            self.manifest.set_pending(page, links)
+        if self.parse_pipeline is not None:
+            # the browser moves on to the next card while the parse processes work on this one
+            for html, link in tcg.iter_card_data(elements, driver, self.date, url_index=self.url_index, raw=True):
+                self.parse_pipeline.submit(html, link)
+            if self.manifest is not None:
+                self.parse_pipeline.when_written(lambda: self._finish_page(page, links))
+            logger.info(f"Page {page} navigated by {threading.current_thread().name}.")
+            return
+        if self.http_session is None and self.snapshot is None:
+            # write every card as soon as it is scraped instead of collecting the page first
+            if self.grid:
+                rows = tcg.iter_grid_card_data(driver, self.date, url_index=self.url_index, enrich=self.enrich)
+            else:
+                rows = tcg.iter_card_data(elements, driver, self.date, url_index=self.url_index)
+            for row, link in rows:
+                self.write_rows([row])
+                if link is not None:
+                    self.url_index.add(self.date, link)
+        else:
+            # the http fetches of a page run concurrently and the snapshot is recorded per page
+            if self.grid:
+                pairs = [(row.as_dict(), link) for row, link in
+                         tcg.iter_grid_card_data(driver, self.date, url_index=self.url_index, enrich=self.enrich)]
+            elif self.http_session is not None:
+                card_data, urls = fetcher.get_card_data_over_http(elements, self.date, session=self.http_session,
+                                                                  max_workers=self.http_workers,
+                                                                  scheduler=self.http_scheduler,
+                                                                  url_index=self.url_index)
+                # fetch_card_data() drops a failed page from both lists, so they stay in step
+                pairs = [(card, url['url']) for card, url in zip(card_data, urls)]
+            else:
+                pairs = [(row.as_dict(), link) for row, link in
+                         tcg.iter_card_data(elements, driver, self.date, url_index=self.url_index)]
+            if self.snapshot is not None:
+                card_data = self.snapshot.record(pairs, fingerprints)
+            else:
+                card_data = [card for card, _ in pairs]
+            self.write_rows(card_data)
+            self.url_index.add_many([{'url': link, 'date': self.date} for _, link in pairs if link is not None])
+        if self.manifest is not None:
+            self.manifest.complete_page(page)
+        logger.info(f"Page {page} scraped by {threading.current_thread().name}.")
+
+    def _retry_or_fail(self, page, error):
+        with self.write_lock:
+            self.attempts[page] = self.attempts.get(page, 0) + 1
+            attempts = self.attempts[page]
+        if attempts < self.max_page_attempts:
+            logger.info(f"Putting page {page} back in the queue. Attempt {attempts} failed: {error}")
+            self.pages.put(page)
+        else:
+            logger.error(f"Page {page} failed after {attempts} attempt(s): {error}")
+            with self.write_lock:
+                self.errors.append((page, error))
+            if self.on_page_failed is not None:
+                self.on_page_failed(page, error)
+
+    @staticmethod
+    def _quit(driver):
+        try:
+            driver.quit()
+        except Exception as e:
+            logger.error(f"Error while closing driver: {e}")
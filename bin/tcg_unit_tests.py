@@ -1,12 +1,51 @@
 import unittest
 from unittest.mock import patch, Mock, MagicMock
-from tcg_validations import DataFrameValidator
+from tcg_validations import DataFrameValidator, StreamingValidator
 import pandas as pd
 from tcg_scraper_functions import get_todays_date, get_max_page_number, download_elements_from_webpage, get_card_data
 from datetime import datetime
-from selenium.common.exceptions import TimeoutException
+from selenium.common.exceptions import TimeoutException, WebDriverException
 from selenium.webdriver.remote.webelement import WebElement
 import numpy as np
+from tcg_scraper_pool import ScraperPool
+from tcg_scraper_functions import parse_card_html, write_csv, CardRow, get_grid_card_data, ENRICH_COLUMNS
+from tcg_row_sink import CsvRowSink, read_csv_rows
+from tcg_parse_pipeline import ParsePipeline
+from tcg_html_extractors import EXTRACTORS, get_extractor, benchmark_extractors, extract_grid_tiles
+from tcg_http_fetcher import create_session, create_scheduler, fetch_card_data, fetch_product_links
+from tcg_fixture_server import FixtureServer, FIXTURES_DIR
+from tcg_crawl_scheduler import CrawlScheduler, CrawlError, FetchResult
+from tcg_page_readiness import wait_for_page_ready, ReadinessStats
+from tcg_url_index import ScrapedUrlIndex
+from tcg_run_manifest import RunManifest
+from tcg_change_detection import SnapshotStore, tile_fingerprint
+from tcg_parquet_writer import ParquetSink, read_parquet_history
+from tcg_price_history import PriceHistoryStore, PRICE_COLUMNS, card_key
+from tcg_delta import DeltaPublisher, SqliteDeltaLoader, state_row
+from tcg_crawl_coordinator import LeaseStore, ShardWorker, Coordinator
+from tcg_page_cache import PageCache, set_default_cache
+from tcg_reparse import reparse
+from tcg_card_catalog import CardCatalog, set_default_catalog, read_daily_rows
+from tcg_benchmark import run_replay, compare_to_baseline
+from tcg_metrics import RunMetrics, metrics
+from tcg_logging import DebugSampler
+import tcg_driver_factory
+from tcg_driver_factory import DriverFactory, resolve_driver_path, BLOCKED_URL_PATTERNS
+import logging
+import json
+import csv
+import tcg_card_catalog as catalog_module
+import subprocess
+import sys
+import tcg_data_preprocessing as pp
+from upload_to_s3 import upload_files, upload_new_bytes
+from moto import mock_aws
+import boto3
+import os
+import time
+import tempfile
+import itertools
+import threading
 
 class TestDataFrameValidator(unittest.TestCase):
     def setUp(self):
@@ -111,3 +150,1012 @@ class TestDownloadElementsFromWebpage(unittest.TestCase):
             download_elements_from_webpage(mock_driver, mock_url)
         self.assertEqual(mock_error_logging.call_count, 3)  # assert the error is called three times
 
+class TestScraperPool(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.url_file_path = os.path.join(self.temp_dir.name, 'card_link_list.csv')
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    @patch('tcg_scraper_pool.tcg.iter_card_data')
+    @patch('tcg_scraper_pool.tcg.download_elements_from_webpage')
+    def test_run_scrapes_every_page(self, mock_download, mock_iter_card_data):
+        links = itertools.count()
+        def iter_card_data(elements, driver, date, url_index):
+            link = f'link-{next(links)}'
+            yield {'name': link, 'date': date}, link
+        mock_iter_card_data.side_effect = iter_card_data
+        data_file_path = os.path.join(self.temp_dir.name, 'data.csv')
+        pool = ScraperPool(3, '2024-01-01', data_file_path, ScrapedUrlIndex(self.url_file_path), driver_factory=Mock)
+
+        result = pool.run([1, 2, 3, 4, 5])
+        pool.close()
+
+        self.assertEqual(result, 5)
+        self.assertEqual(mock_download.call_count, 5)
+        self.assertEqual(len(pd.read_csv(data_file_path)), 5) # card rows of every page
+        self.assertEqual(len(ScrapedUrlIndex(self.url_file_path)), 5) # urls appended to the ledger
+
+    @patch('tcg_scraper_pool.tcg.iter_card_data')
+    @patch('tcg_scraper_pool.tcg.download_elements_from_webpage')
+    def test_run_restarts_crashed_driver(self, mock_download, mock_iter_card_data):
+        crashed_driver = Mock()
+        type(crashed_driver).current_url = property(Mock(side_effect=WebDriverException('chrome not reachable')))
+        drivers = [crashed_driver, Mock()]
+        mock_download.side_effect = [WebDriverException('chrome not reachable'), [Mock()]]
+        mock_iter_card_data.return_value = iter([({'name': 'card'}, None)])
+        pool = ScraperPool(1, '2024-01-01', os.path.join(self.temp_dir.name, 'data.csv'),
+                           ScrapedUrlIndex(self.url_file_path), driver_factory=lambda: drivers.pop(0))
+
+        result = pool.run([1])
+        pool.close()
+
+        self.assertEqual(result, 1)
+        self.assertEqual(pool.restarts, 1)
+        crashed_driver.quit.assert_called_once()
+
+    @patch('tcg_scraper_pool.tcg.get_product_links')
+    @patch('tcg_scraper_pool.tcg.iter_card_data')
+    @patch('tcg_scraper_pool.tcg.download_elements_from_webpage')
+    def test_parse_workers_parse_the_captured_pages_in_processes(self, mock_download, mock_iter_card_data, mock_links):
+        pages = {}
+        for name in sorted(os.listdir(os.path.join(FIXTURES_DIR, 'product'))):
+            with open(os.path.join(FIXTURES_DIR, 'product', name)) as file:
+                pages[f'https://www.tcgplayer.com/product/{name}'] = file.read()
+        broken = 'https://www.tcgplayer.com/product/broken.html'
+        links = {1: list(pages)[:2], 2: list(pages)[2:] + [broken]}
+        mock_download.side_effect = lambda driver, url: int(url.rsplit('page=', 1)[1].split('&')[0])
+        mock_links.side_effect = lambda page: links[page]
+        def iter_card_data(page, driver, date, url_index, raw):
+            self.assertTrue(raw) # the browser thread does not parse
+            for link in links[page]:
+                yield pages.get(link, '<html></html>'), link
+        mock_iter_card_data.side_effect = iter_card_data
+        data_file_path = os.path.join(self.temp_dir.name, 'data.csv')
+        manifest = RunManifest('20240101', manifest_dir=self.temp_dir.name)
+        pool = ScraperPool(2, '2024-01-01', data_file_path, ScrapedUrlIndex(self.url_file_path), driver_factory=Mock,
+                           manifest=manifest, parse_workers=2)
+
+        result = pool.run([1, 2])
+        pool.close()
+
+        self.assertEqual(result, 4)
+        rows = [row for chunk in read_csv_rows(data_file_path) for row in chunk]
+        expected = [parse_card_html(html, '2024-01-01') for html in pages.values()]
+        self.assertEqual(sorted(row['full_product_name'] for row in rows),
+                         sorted(card['full_product_name'] for card in expected))
+        self.assertEqual(manifest.remaining_pages([1, 2]), [2]) # the page with the broken product page
+        self.assertEqual(manifest.pending_urls(), {2: [broken]})
+
+    def test_a_failed_write_is_raised_not_counted_as_a_parse_error(self):
+        with open(os.path.join(FIXTURES_DIR, 'product', 'nami-op01-016.html')) as file:
+            html = file.read()
+        on_card = Mock(side_effect=OSError('No space left on device'))
+        pipeline = ParsePipeline('2024-01-01', on_card, workers=1)
+        pipeline.submit(html, 'https://www.tcgplayer.com/product/1')
+        deadline = time.monotonic() + 30
+        while pipeline.failure is None and time.monotonic() < deadline: # the writer thread hits the failure
+            time.sleep(0.01)
+        with self.assertRaises(OSError):
+            pipeline.submit(html, 'https://www.tcgplayer.com/product/2')
+        with self.assertRaises(OSError):
+            pipeline.close()
+        self.assertEqual((pipeline.cards, pipeline.errors), (0, 0))
+
+class TestCsvRowSink(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.file_name = os.path.join(self.temp_dir.name, 'optcg_data_20240101.csv')
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def row(self, name, price):
+        return CardRow(f'{name} (Parallel) - Romance Dawn', name, ['Parallel'], 'Romance Dawn', price,
+                       np.nan, np.nan, np.nan, np.nan, np.nan, np.nan, '2024-01-01')
+
+    def test_rows_are_flushed_and_deduplicated_across_runs(self):
+        validator = StreamingValidator()
+        sink = CsvRowSink(self.file_name, sinks=[validator])
+        self.assertTrue(sink.write_row(self.row('Nami', 5.0)))
+        self.assertFalse(sink.write_row(self.row('Nami', 5.0)))
+        # flushed per write, readable before the sink is closed
+        self.assertEqual(len(pd.read_csv(self.file_name)), 1)
+        sink.close()
+
+        with CsvRowSink(self.file_name) as resumed: # a resumed run knows what the crashed one wrote
+            self.assertEqual(resumed.write([self.row('Nami', 5.0), self.row('Zoro', 0.5)]), 1)
+
+        df = pd.read_csv(self.file_name)
+        self.assertEqual(df['name'].tolist(), ['Nami', 'Zoro'])
+        self.assertEqual(df['type'][0], "['Parallel']")
+        self.assertEqual(validator.row_count(), 1)
+
+    @patch('tcg_row_sink.hash', create=True, return_value=0)
+    def test_rows_with_the_same_hash_are_compared_before_they_are_dropped(self, mock_hash):
+        with CsvRowSink(self.file_name) as sink: # every row has the same hash
+            self.assertEqual(sink.write([self.row('Nami', 5.0), self.row('Zoro', 0.5), self.row('Luffy, "D"', 1.0)]), 3)
+            self.assertFalse(sink.write_row(self.row('Zoro', 0.5)))
+
+        with CsvRowSink(self.file_name) as resumed:
+            self.assertEqual(resumed.write([self.row('Luffy, "D"', 1.0), self.row('Sanji', 2.0)]), 1)
+
+        self.assertEqual(pd.read_csv(self.file_name)['name'].tolist(), ['Nami', 'Zoro', 'Luffy, "D"', 'Sanji'])
+
+class TestParseCardHtml(unittest.TestCase):
+    def test_parse_card_html(self):
+        with open(os.path.join(FIXTURES_DIR, 'product', 'nami-op01-016.html')) as file:
+            card = parse_card_html(file.read(), '2024-01-01')
+
+        self.assertEqual(card['full_product_name'], 'Nami (Parallel) - Romance Dawn')
+        self.assertEqual(card['name'], 'Nami')
+        self.assertEqual(card['type'], ['Parallel'])
+        self.assertEqual(card['set'], 'Romance Dawn')
+        self.assertEqual(card['current_lowest_price'], 5.49)
+        self.assertEqual(card['foil_listed_median_price'], 6.50)
+
+    def test_extractors_agree(self):
+        pages = []
+        for name in sorted(os.listdir(os.path.join(FIXTURES_DIR, 'product'))):
+            with open(os.path.join(FIXTURES_DIR, 'product', name)) as file:
+                pages.append(file.read())
+
+        for name in EXTRACTORS:
+            extractor = get_extractor(name)
+            for html in pages:
+                self.assertEqual(parse_card_html(html, '2024-01-01', extractor=extractor),
+                                 parse_card_html(html, '2024-01-01', extractor=get_extractor('soup')))
+            with self.assertRaises(AttributeError):
+                extractor.extract('<html><body><h1 class="product-details__name">Nami</h1></body></html>')
+        self.assertEqual(set(benchmark_extractors(pages, repeat=1)), set(EXTRACTORS))
+
+class TestGridExtraction(unittest.TestCase):
+    class GridDriver:
+        # stands in for a browser on the fixture search page, GRID_TILE_SCRIPT is run by extract_grid_tiles()
+        def __init__(self):
+            with open(os.path.join(FIXTURES_DIR, 'search.html')) as file:
+                self.page_source = file.read()
+            self.visits = []
+
+        def execute_script(self, script, *args):
+            return [[f'https://www.tcgplayer.com{href}'] + fields for href, *fields in extract_grid_tiles(self.page_source)]
+
+        def get(self, url):
+            self.visits.append(url)
+            with open(os.path.join(FIXTURES_DIR, 'product', url.rsplit('/', 1)[1])) as file:
+                self.page_source = file.read()
+
+    def product_pages(self):
+        pages = {}
+        for name in os.listdir(os.path.join(FIXTURES_DIR, 'product')):
+            with open(os.path.join(FIXTURES_DIR, 'product', name)) as file:
+                card = parse_card_html(file.read(), '2024-01-01')
+            pages[card['full_product_name']] = card
+        return pages
+
+    def test_grid_rows_match_product_pages_without_opening_them(self):
+        driver = self.GridDriver()
+        cards, urls = get_grid_card_data(driver, '2024-01-01')
+
+        self.assertEqual(driver.visits, [])
+        self.assertEqual(len(urls), 4)
+        pages = self.product_pages()
+        for card in cards:
+            page = pages[card['full_product_name']]
+            self.assertEqual({column: value for column, value in card.items() if column not in ENRICH_COLUMNS},
+                             {column: value for column, value in page.items() if column not in ENRICH_COLUMNS})
+            self.assertTrue(all(np.isnan(card[column]) for column in ENRICH_COLUMNS))
+
+    @patch('tcg_scraper_functions.wait_for_page_ready')
+    def test_enrich_fills_the_prices_the_grid_does_not_show(self, mock_wait):
+        driver = self.GridDriver()
+        url_index = ScrapedUrlIndex(os.path.join(tempfile.mkdtemp(), 'card_link_list.csv'))
+        url_index.add('2024-01-01', 'https://www.tcgplayer.com/product/nami-op01-016.html')
+        cards, urls = get_grid_card_data(driver, '2024-01-01', url_index=url_index, enrich=True)
+
+        self.assertEqual(len(driver.visits), 3) # the scraped link is skipped
+        pages = self.product_pages()
+        for card in cards:
+            self.assertEqual(card, pages[card['full_product_name']])
+
+class TestPageCache(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.cache = PageCache(self.cache_dir)
+        self.addCleanup(self.cache.close)
+
+    def fixture(self, *path):
+        with open(os.path.join(FIXTURES_DIR, *path)) as file:
+            return file.read()
+
+    def test_unchanged_pages_are_stored_once(self):
+        html = self.fixture('product', 'nami-op01-016.html')
+        self.cache.put('https://www.tcgplayer.com/product/nami-op01-016.html', '2024-01-01', html)
+        self.cache.put('https://www.tcgplayer.com/product/nami-op01-016.html', '2024-01-02', html)
+
+        self.assertEqual(self.cache.get('https://www.tcgplayer.com/product/nami-op01-016.html', '2024-01-02'), html)
+        self.assertIsNone(self.cache.get('https://www.tcgplayer.com/product/nami-op01-016.html', '2024-01-03'))
+        stats = self.cache.stats()
+        self.assertEqual((stats['pages'], stats['blobs']), (2, 1))
+        self.assertLess(stats['bytes'], stats['raw_bytes'])
+
+    def test_evict_drops_old_pages_then_the_oldest_dates_over_the_size_limit(self):
+        names = sorted(os.listdir(os.path.join(FIXTURES_DIR, 'product')))
+        hashes = [self.cache.put(name, f'2024-01-0{day}', self.fixture('product', name))
+                  for day, name in enumerate(names[:3], start=1)]
+        self.cache.max_bytes = self.cache.stats()['bytes'] - 1 # one date too many
+        self.assertEqual(self.cache.evict(), 1)
+        self.assertEqual([row[1] for row in self.cache.pages()], ['2024-01-02', '2024-01-03'])
+        self.assertFalse(os.path.exists(self.cache.blob_path(hashes[0])))
+
+        self.assertEqual(self.cache.evict(now=time.time() + 91 * 86400), 2) # the last date is only dropped by age
+        self.assertEqual(self.cache.stats()['pages'], 0)
+
+    @patch('tcg_scraper_functions.wait_for_page_ready')
+    def test_reparse_of_a_cached_run_matches_the_scraped_rows(self, mock_wait):
+        driver = TestGridExtraction.GridDriver()
+        driver.current_url = 'https://www.tcgplayer.com/search/one-piece-card-game/product?page=1'
+        set_default_cache(self.cache)
+        self.addCleanup(set_default_cache, None)
+        url_index = ScrapedUrlIndex(os.path.join(self.cache_dir, 'card_link_list.csv'))
+        url_index.add('2024-01-01', 'https://www.tcgplayer.com/product/nami-op01-016.html')
+        cards, urls = get_grid_card_data(driver, '2024-01-01', url_index=url_index, enrich=True)
+
+        self.assertEqual(self.cache.stats()['pages'], 4) # the search page and the 3 product pages opened
+        output_path = os.path.join(self.cache_dir, 'reparsed.csv')
+        result = reparse('2024-01-01', cache_dir=self.cache_dir, output_path=output_path, workers=2)
+
+        self.assertEqual((result['pages'], result['rows'], result['failed']), (4, 4, 0))
+        rows = {row['full_product_name']: row for chunk in read_csv_rows(output_path) for row in chunk}
+        for card in cards: # the product page rows, not the grid rows, of the enriched cards
+            self.assertEqual(rows[card['full_product_name']]['foil_listed_median_price'], card['foil_listed_median_price'])
+        nami = [row for name, row in rows.items() if 'Nami' in name][0]
+        self.assertTrue(np.isnan(nami['foil_listed_median_price'])) # only its search result tile was cached
+
+class TestCardCatalog(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.db_path = os.path.join(self.temp_dir.name, 'card_catalog.db')
+        self.pages = []
+        for name in sorted(os.listdir(os.path.join(FIXTURES_DIR, 'product'))):
+            with open(os.path.join(FIXTURES_DIR, 'product', name)) as file:
+                self.pages.append(file.read())
+
+    def test_identity_is_parsed_once_and_ids_are_stable_across_runs(self):
+        with CardCatalog(self.db_path) as catalog:
+            set_default_catalog(catalog)
+            self.addCleanup(set_default_catalog, None)
+            with patch('tcg_card_catalog.parse_identity', wraps=catalog_module.parse_identity) as mock_parse:
+                cards = [parse_card_html(html, '2024-01-01') for html in self.pages + self.pages]
+            self.assertEqual(mock_parse.call_count, len(self.pages))
+            set_default_catalog(None)
+            self.assertEqual(cards[:len(self.pages)], [parse_card_html(html, '2024-01-01') for html in self.pages])
+            ids = [catalog.card_id(card) for card in cards[:len(self.pages)]]
+
+        with CardCatalog(self.db_path) as catalog:
+            self.assertEqual([catalog.card_id(card) for card in reversed(cards[:len(self.pages)])], ids[::-1])
+            self.assertEqual(len(catalog), len(self.pages))
+
+    def test_compact_rows_expand_to_the_daily_rows(self):
+        cards = [parse_card_html(html, '2024-01-01') for html in self.pages]
+        compact_path = os.path.join(self.temp_dir.name, 'optcg_prices_20240101.csv')
+        with CardCatalog(self.db_path) as catalog:
+            validator = MagicMock()
+            sink = CsvRowSink(compact_path, sinks=[validator], transform=catalog.compact)
+            sink.write(cards)
+            sink.close()
+            self.assertEqual(validator.write.call_args[0][0], cards) # the sinks get the full rows
+            with open(compact_path) as file:
+                self.assertEqual(next(csv.reader(file))[:2], ['card_id', 'date'])
+            expanded = [row for chunk in read_daily_rows(compact_path, catalog) for row in chunk]
+
+        daily_path = os.path.join(self.temp_dir.name, 'optcg_data_20240101.csv')
+        write_csv(daily_path, cards)
+        self.assertEqual(len(expanded), len(cards))
+        for row, daily in zip(expanded, [row for chunk in read_csv_rows(daily_path) for row in chunk]):
+            self.assertEqual(set(row), set(daily))
+            for column, value in daily.items():
+                if isinstance(value, float) and np.isnan(value):
+                    self.assertTrue(row[column] is None or np.isnan(row[column]))
+                else:
+                    self.assertEqual(row[column], value, column)
+        self.assertLess(os.path.getsize(compact_path), os.path.getsize(daily_path))
+
+    def test_types_keep_their_order_through_the_catalog(self):
+        card = {'full_product_name': 'Shanks (Parallel) (Box Topper) - Romance Dawn', 'name': 'Shanks',
+                'type': ['Parallel', 'Box Topper', 'Tournament Pack Vol. 1, Finals'], 'set': 'Romance Dawn',
+                **{column: 1.0 for column in PRICE_COLUMNS}, 'date': '2024-01-01'}
+        compact_path = os.path.join(self.temp_dir.name, 'optcg_prices_20240101.csv')
+        with CardCatalog(self.db_path) as catalog:
+            with CsvRowSink(compact_path, transform=catalog.compact) as sink:
+                sink.write([card])
+        with CardCatalog(self.db_path) as catalog: # read back from the database
+            expanded = [row for chunk in read_daily_rows(compact_path, catalog) for row in chunk]
+            self.assertEqual(catalog.identity(card['full_product_name'])[1], card['type'])
+        self.assertEqual(expanded[0]['type'], str(card['type'])) # what the daily csv holds without --catalog
+
+class TestHttpFetcher(unittest.TestCase):
+    def test_fetch_card_data_from_fixture_server(self):
+        with FixtureServer() as server:
+            session = create_session()
+            links = fetch_product_links(session, server.url('search.html'))
+            card_data, urls = fetch_card_data(links, '2024-01-01', session=session)
+
+        self.assertEqual(len(links), 4)
+        self.assertEqual(len(card_data), 4)
+        self.assertEqual(urls[0], {'url': links[0], 'date': '2024-01-01'})
+        self.assertEqual(card_data[0]['name'], 'Monkey.D.Luffy')
+
+    def test_fetch_card_data_through_scheduler(self):
+        with FixtureServer() as server:
+            session = create_session(max_retries=0)
+            with create_scheduler(session, rate=50) as scheduler:
+                links = fetch_product_links(session, server.url('search.html'), scheduler=scheduler)
+                card_data, _ = fetch_card_data(links, '2024-01-01', scheduler=scheduler)
+
+        self.assertEqual(len(card_data), 4)
+        self.assertEqual(scheduler.metrics.requests, 5)
+
+    def test_fetch_card_data_is_concurrent(self):
+        latency = 0.3
+        with FixtureServer(latency=latency) as server:
+            session = create_session()
+            links = [server.url('product/nami-op01-016.html')] * 8
+            start = time.perf_counter()
+            card_data, _ = fetch_card_data(links, '2024-01-01', session=session, max_workers=8)
+            elapsed = time.perf_counter() - start
+
+        self.assertEqual(len(card_data), 8)
+        self.assertLess(elapsed, len(links) * latency / 2) # well under the time of fetching one by one
+
+class TestReplayBenchmark(unittest.TestCase):
+    def test_replays_fixtures_through_every_stage(self):
+        for http in (False, True):
+            results = run_replay(FIXTURES_DIR, repeat=2, http=http)
+
+            self.assertEqual(results['cards'], 8)
+            self.assertGreater(results['cards_per_sec'], 0)
+            self.assertEqual(results['stages']['write_csv']['count'], 2)
+            self.assertEqual(results['stages']['validate']['count'], 2)
+        self.assertEqual(compare_to_baseline(results, results), [])
+
+    def test_compare_to_baseline_flags_slow_downs(self):
+        baseline = {'cards_per_sec': 100.0, 'stages': {'get_card_data': {'p95': 10.0}}}
+        results = {'cards_per_sec': 70.0, 'stages': {'get_card_data': {'p95': 11.0}, 'validate': {'p95': 5.0}}}
+
+        self.assertEqual(len(compare_to_baseline(results, baseline, tolerance=0.2)), 1)
+        self.assertEqual(len(compare_to_baseline(results, baseline, tolerance=0.05)), 2)
+
+class TestRunMetrics(unittest.TestCase):
+    def test_summary_and_exports(self):
+        run_metrics = RunMetrics()
+        for duration in [0.1, 0.2, 0.3, 0.4]:
+            run_metrics.record('parse', duration)
+        with self.assertRaises(ValueError):
+            with run_metrics.timer('upload'):
+                raise ValueError('failed upload is still timed')
+        run_metrics.increment('rows_written', 25)
+
+        summary = run_metrics.summary()
+        self.assertEqual(summary['stages']['parse']['count'], 4)
+        self.assertAlmostEqual(summary['stages']['parse']['total'], 1.0)
+        self.assertEqual(summary['stages']['parse']['p50'], 0.3)
+        self.assertEqual(summary['stages']['upload']['count'], 1)
+        self.assertEqual(summary['counters'], {'rows_written': 25})
+
+        for duration in range(10000): # only a fixed-size sample is kept for the percentiles
+            run_metrics.record('navigate', duration / 10000)
+        stats = run_metrics.durations['navigate']
+        self.assertEqual(len(stats.sample), stats.sample_size)
+        navigate = run_metrics.summary()['stages']['navigate']
+        self.assertEqual((navigate['count'], navigate['max']), (10000, 0.9999))
+        self.assertAlmostEqual(navigate['p50'], 0.5, delta=0.1)
+
+        prometheus = run_metrics.to_prometheus()
+        self.assertIn('optcg_stage_duration_seconds_count{stage="parse"} 4', prometheus)
+        self.assertIn('optcg_rows_written_total 25', prometheus)
+        self.assertIn('parse', run_metrics.report())
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'run_summary.json')
+            run_metrics.write_json(path)
+            with open(path) as file:
+                self.assertEqual(json.load(file)['counters'], {'rows_written': 25})
+
+    def test_pipeline_stages_are_instrumented(self):
+        metrics.reset()
+        with open(os.path.join(FIXTURES_DIR, 'product', 'nami-op01-016.html')) as file:
+            card = parse_card_html(file.read(), '2024-01-01')
+        with tempfile.TemporaryDirectory() as temp_dir:
+            write_csv(os.path.join(temp_dir, 'data.csv'), [card, card])
+        DataFrameValidator(pd.DataFrame([card])).row_count()
+
+        summary = metrics.summary()
+        self.assertEqual({stage: stats['count'] for stage, stats in summary['stages'].items()},
+                         {'parse': 1, 'write': 1, 'validate': 1})
+        self.assertEqual(summary['counters'], {'rows_written': 2})
+
+class TestLogging(unittest.TestCase):
+    def test_configured_once_behind_a_queue(self):
+        # logging is configured once per process, so it is configured in its own process, not the test run's
+        code = ("import json, logging, tcg_logging; from logging.handlers import QueueHandler; "
+                "listener = tcg_logging.configure_logging(); "
+                "print(json.dumps([tcg_logging.configure_logging() is listener, "
+                "any(isinstance(handler, QueueHandler) for handler in logging.getLogger().handlers), "
+                "any(isinstance(handler, QueueHandler) for handler in logging.getLogger('tcg_scraper_functions').handlers), "
+                "listener.handlers[0].baseFilename, tcg_logging.get_log_file()]))")
+        with tempfile.TemporaryDirectory() as temp_dir:
+            log_file = os.path.join(temp_dir, 'test.log')
+            env = dict(os.environ, OPTCG_LOG_FILE=log_file)
+            result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                                    cwd=os.path.dirname(os.path.abspath(__file__)), env=env, check=True)
+        self.assertEqual(json.loads(result.stdout.splitlines()[-1]), [True, True, True, log_file, log_file])
+
+    def test_debug_sampler_keeps_one_in_every(self):
+        sampler = DebugSampler(every=10)
+        def record(level, message):
+            return logging.LogRecord('tcg_data_preprocessing', level, __file__, 1, message, ('$1.00',), None)
+
+        kept = [sampler.filter(record(logging.DEBUG, 'Parsed %s')) for _ in range(25)]
+
+        self.assertEqual(kept.count(True), 3)
+        self.assertTrue(sampler.filter(record(logging.INFO, 'Parsed %s')))
+        self.assertEqual(sampler.summary(), {'Parsed %s': 25})
+
+class TestDriverFactory(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache_path = os.path.join(self.temp_dir.name, 'chromedriver_path.json')
+        self.binary = os.path.join(self.temp_dir.name, 'chromedriver')
+        open(self.binary, 'w').close()
+        tcg_driver_factory._driver_paths.clear()
+
+    def tearDown(self):
+        tcg_driver_factory._driver_paths.clear()
+        self.temp_dir.cleanup()
+
+    @patch('tcg_driver_factory.ChromeDriverManager')
+    def test_driver_path_is_resolved_once(self, mock_manager):
+        mock_manager.return_value.install.return_value = self.binary
+
+        self.assertEqual(resolve_driver_path('114', self.cache_path), self.binary)
+        self.assertEqual(resolve_driver_path('114', self.cache_path), self.binary)
+        tcg_driver_factory._driver_paths.clear() # a new run only has the file cache
+        self.assertEqual(resolve_driver_path('114', self.cache_path), self.binary)
+        self.assertEqual(mock_manager.return_value.install.call_count, 1)
+
+        os.remove(self.binary) # the cached binary is gone, install again
+        resolve_driver_path('114', self.cache_path)
+        self.assertEqual(mock_manager.return_value.install.call_count, 2)
+
+    @patch('tcg_driver_factory.resolve_driver_path')
+    @patch('tcg_driver_factory.webdriver.Chrome')
+    def test_drivers_get_their_own_cached_profile_and_block_resources(self, mock_chrome, mock_resolve):
+        mock_resolve.return_value = self.binary
+        factory = DriverFactory(profile_root=self.temp_dir.name)
+
+        factory()
+        factory()
+
+        profiles = [call.kwargs['options'].arguments for call in mock_chrome.call_args_list]
+        self.assertIn(f"--user-data-dir={os.path.join(self.temp_dir.name, 'worker-0')}", profiles[0])
+        self.assertIn(f"--user-data-dir={os.path.join(self.temp_dir.name, 'worker-1')}", profiles[1])
+        self.assertEqual(mock_chrome.call_args.kwargs['options'].experimental_options['prefs'],
+                         {'profile.managed_default_content_settings.images': 2})
+        mock_chrome.return_value.execute_cdp_cmd.assert_called_with('Network.setBlockedURLs',
+                                                                    {'urls': BLOCKED_URL_PATTERNS})
+
+    @patch('tcg_driver_factory.resolve_driver_path')
+    @patch('tcg_driver_factory.webdriver.Chrome')
+    def test_profiles_are_claimed_across_processes_and_released_on_quit(self, mock_chrome, mock_resolve):
+        mock_resolve.return_value = self.binary
+        mock_chrome.side_effect = lambda **kwargs: MagicMock()
+        dead = subprocess.Popen([sys.executable, '-c', 'pass'])
+        dead.wait()
+        # a crashed run left its claim and Chrome's lock on worker-0
+        stale_dir = os.path.join(self.temp_dir.name, 'worker-0')
+        os.makedirs(stale_dir)
+        with open(os.path.join(stale_dir, DriverFactory.CLAIM_FILE), 'w') as file:
+            file.write(str(dead.pid))
+        os.symlink(f'host-{dead.pid}', os.path.join(stale_dir, 'SingletonLock'))
+
+        first = DriverFactory(profile_root=self.temp_dir.name)()
+        DriverFactory(profile_root=self.temp_dir.name)() # another process, no shared memory
+        first.quit()
+        DriverFactory(profile_root=self.temp_dir.name)()
+
+        profiles = [call.kwargs['options'].arguments for call in mock_chrome.call_args_list]
+        for profile, worker in zip(profiles, ['worker-0', 'worker-1', 'worker-0']):
+            self.assertIn(f"--user-data-dir={os.path.join(self.temp_dir.name, worker)}", profile)
+        self.assertFalse(os.path.lexists(os.path.join(stale_dir, 'SingletonLock')))
+
+class TestCrawlScheduler(unittest.TestCase):
+    def test_backs_off_and_retries_throttled_requests(self):
+        responses = [FetchResult(429, ''), FetchResult(503, ''), FetchResult(200, 'page')]
+        fetch = Mock(side_effect=responses)
+
+        with CrawlScheduler(fetch, rate=50, backoff_base=0.01) as scheduler:
+            result = scheduler.submit('http://example.com/product/1').result()
+            rate = scheduler.host_rates()['example.com']
+
+        self.assertEqual(result, 'page')
+        self.assertEqual(scheduler.metrics.throttled, 2)
+        self.assertEqual(scheduler.metrics.retries, 2)
+        self.assertLess(rate, 50) # the host rate was lowered after being throttled
+
+    def test_gives_up_on_non_retryable_status(self):
+        fetch = Mock(return_value=FetchResult(404, ''))
+
+        with CrawlScheduler(fetch) as scheduler:
+            results = scheduler.fetch_all(['http://example.com/missing'])
+
+        self.assertIsInstance(results[0], CrawlError)
+        self.assertEqual(fetch.call_count, 1)
+
+    def test_enforces_rate_per_host(self):
+        fetch = Mock(return_value=FetchResult(200, 'page'))
+
+        with CrawlScheduler(fetch, rate=20, burst=1) as scheduler:
+            start = time.perf_counter()
+            scheduler.fetch_all([f'http://example.com/product/{i}' for i in range(6)])
+            elapsed = time.perf_counter() - start
+
+        self.assertGreaterEqual(elapsed, 0.2) # 5 requests after the first one at 20 per second
+        self.assertEqual(scheduler.metrics.successes, 6)
+
+class TestWaitForPageReady(unittest.TestCase):
+    def test_returns_once_selectors_are_present(self):
+        mock_driver = Mock()
+        mock_driver.find_elements.return_value = [Mock()]
+        stats = ReadinessStats()
+
+        duration = wait_for_page_ready(mock_driver, timeout=1, stats=stats)
+
+        self.assertLess(duration, 1)
+        self.assertEqual(mock_driver.find_elements.call_count, 3) # one lookup per parsed node
+        self.assertEqual(stats.summary()['count'], 1)
+
+    def test_records_timeout(self):
+        mock_driver = Mock()
+        mock_driver.find_elements.return_value = []
+        stats = ReadinessStats()
+
+        with self.assertRaises(TimeoutException):
+            wait_for_page_ready(mock_driver, timeout=0.2, poll_frequency=0.05, stats=stats)
+
+        self.assertEqual(stats.summary()['timeouts'], 1)
+
+class TestScrapedUrlIndex(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.url_file_path = os.path.join(self.temp_dir.name, 'logs', 'card_link_list.csv')
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_add_persists_new_links_once(self):
+        url_index = ScrapedUrlIndex(self.url_file_path)
+        added = url_index.add_many([{'url': 'link-1', 'date': '2024-01-01'},
+                                    {'url': 'link-1', 'date': '2024-01-01'},
+                                    {'url': 'link-1', 'date': '2024-01-02'}])
+
+        reloaded = ScrapedUrlIndex(self.url_file_path)
+
+        self.assertEqual(added, 2)
+        self.assertIn(('2024-01-01', 'link-1'), reloaded)
+        self.assertNotIn(('2024-01-03', 'link-1'), reloaded)
+        self.assertEqual(len(reloaded), 2)
+
+    def test_reads_rows_appended_in_url_date_order(self):
+        os.makedirs(os.path.dirname(self.url_file_path))
+        with open(self.url_file_path, 'w') as file:
+            file.write('date,url\nhttps://www.tcgplayer.com/product/1,2024-01-01\n')
+
+        url_index = ScrapedUrlIndex(self.url_file_path)
+
+        self.assertIn(('2024-01-01', 'https://www.tcgplayer.com/product/1'), url_index)
+
+class TestRunManifest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_resume_skips_completed_pages(self):
+        manifest = RunManifest('20240101', manifest_dir=self.temp_dir.name)
+        manifest.set_pages([1, 2, 3])
+        manifest.complete_page(1)
+        manifest.set_pending(2, ['link-1', 'link-2'])
+
+        resumed = RunManifest('20240101', resume=True, manifest_dir=self.temp_dir.name)
+
+        self.assertEqual(resumed.pages, [1, 2, 3])
+        self.assertEqual(resumed.remaining_pages(resumed.pages), [2, 3])
+        self.assertEqual(resumed.pending_urls(), {2: ['link-1', 'link-2']})
+
+    def test_new_run_starts_over(self):
+        manifest = RunManifest('20240101', manifest_dir=self.temp_dir.name)
+        manifest.set_pages([1, 2])
+        manifest.complete_page(1)
+
+        restarted = RunManifest('20240101', manifest_dir=self.temp_dir.name)
+
+        self.assertEqual(restarted.pages, [])
+        self.assertEqual(restarted.remaining_pages([1, 2]), [1, 2])
+
+class TestSnapshotStore(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.url_index = ScrapedUrlIndex(os.path.join(self.temp_dir.name, 'card_link_list.csv'))
+        self.snapshot_path = os.path.join(self.temp_dir.name, 'card_snapshot.json')
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_carries_forward_unchanged_tiles(self):
+        mock_driver = Mock()
+        mock_driver.execute_script.return_value = [['https://www.tcgplayer.com/product/1?xid=a', 'Nami $5.75'],
+                                                   ['https://www.tcgplayer.com/product/2?xid=b', 'Zoro $0.41']]
+        snapshot = SnapshotStore(self.snapshot_path)
+        _, _, fingerprints = snapshot.carry_forward(mock_driver, '2024-01-01', self.url_index)
+        snapshot.record([({'name': 'Nami', 'date': '2024-01-01'}, 'https://www.tcgplayer.com/product/1'),
+                         ({'name': 'Zoro', 'date': '2024-01-01'}, 'https://www.tcgplayer.com/product/2')],
+                        fingerprints)
+        snapshot.save()
+
+        mock_driver.execute_script.return_value = [['https://www.tcgplayer.com/product/1?xid=a', 'Nami $5.75'],
+                                                   ['https://www.tcgplayer.com/product/2?xid=b', 'Zoro $0.52']]
+        carried, carried_urls, fingerprints = SnapshotStore(self.snapshot_path).carry_forward(
+            mock_driver, '2024-01-02', self.url_index)
+
+        self.assertEqual(carried, [{'name': 'Nami', 'date': '2024-01-02', 'scrape_status': 'unchanged'}])
+        self.assertEqual(carried_urls, [{'url': 'https://www.tcgplayer.com/product/1', 'date': '2024-01-02'}])
+        self.assertEqual(fingerprints['https://www.tcgplayer.com/product/2'], tile_fingerprint('Zoro $0.52'))
+
+    def test_a_card_without_a_link_does_not_shift_the_rows(self):
+        snapshot = SnapshotStore(self.snapshot_path)
+        snapshot.record([({'name': 'A'}, None), ({'name': 'B'}, 'linkB')], {'linkB': 'fpB'})
+        self.assertFalse(os.path.exists(self.snapshot_path)) # written once, by save()
+        snapshot.save()
+
+        self.assertEqual(SnapshotStore(self.snapshot_path).products['linkB']['row']['name'], 'B')
+
+class TestParquetSink(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def card(self, name, date, price):
+        return {'full_product_name': f'{name} (Parallel) - Romance Dawn', 'name': name, 'type': ['Parallel'],
+                'set': 'Romance Dawn', 'current_lowest_price': price, 'normal_market_price': np.nan,
+                'foil_market_price': 1.5, 'normal_buylist_price': np.nan, 'foil_buylist_price': np.nan,
+                'normal_listed_median_price': np.nan, 'foil_listed_median_price': np.nan, 'date': date}
+
+    def test_writes_typed_partitions(self):
+        with ParquetSink(self.temp_dir.name, row_group_size=2) as sink:
+            sink.write([self.card('Nami', '2024-01-01', 5.0), self.card('Zoro', '2024-01-01', 0.4),
+                        self.card('Nami', '2024-01-02', 5.5)])
+
+        df = read_parquet_history(self.temp_dir.name, columns=['name', 'type', 'current_lowest_price',
+                                                               'normal_market_price'], start_date='2024-01-02')
+
+        self.assertEqual(sink.rows_written, 3)
+        self.assertEqual(sorted(os.listdir(self.temp_dir.name)), ['date=2024-01-01', 'date=2024-01-02'])
+        self.assertEqual(df['name'].tolist(), ['Nami'])
+        self.assertEqual(list(df['type'][0]), ['Parallel'])
+        self.assertEqual(df['current_lowest_price'][0], 5.5)
+        self.assertTrue(pd.isna(df['normal_market_price'][0]))
+
+class TestPriceHistoryStore(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.store = PriceHistoryStore(os.path.join(self.temp_dir.name, 'history.db'))
+
+    def tearDown(self):
+        self.store.close()
+        self.temp_dir.cleanup()
+
+    def card(self, name, card_set, date, price):
+        return {'full_product_name': f'{name} (Parallel) - {card_set}', 'name': name, 'type': "['Parallel']",
+                'set': card_set, 'current_lowest_price': price, 'normal_market_price': price,
+                'foil_market_price': np.nan, 'normal_buylist_price': np.nan, 'foil_buylist_price': np.nan,
+                'normal_listed_median_price': np.nan, 'foil_listed_median_price': np.nan, 'date': date}
+
+    def test_queries_over_ingested_days(self):
+        self.store.ingest_rows([self.card('Nami', 'Romance Dawn', '2024-01-01', 5.0),
+                                self.card('Zoro', 'Romance Dawn', '2024-01-01', 1.0),
+                                self.card('Law', 'Worst Generation', '2024-01-01', 2.0)])
+        file_name = os.path.join(self.temp_dir.name, 'optcg_data_20240102.csv')
+        pd.DataFrame([self.card('Nami', 'Romance Dawn', '2024-01-02', 5.5),
+                      self.card('Zoro', 'Romance Dawn', '2024-01-02', 2.0),
+                      self.card('Law', 'Worst Generation', '2024-01-02', 1.0)]).to_csv(file_name, index=False)
+        self.store.ingest_csv(file_name)
+        self.store.ingest_rows([self.card('Nami', 'Romance Dawn', '2024-01-02', 6.0)]) # replaces the csv row
+
+        key = card_key('Nami  (Parallel) - Romance Dawn', 'romance dawn', ['Parallel'])
+        self.assertEqual(self.store.price_series(key), [('2024-01-01', 5.0), ('2024-01-02', 6.0)])
+        movers = self.store.top_movers('2024-01-01', '2024-01-02', limit=2)
+        self.assertEqual([(mover[0], mover[6]) for mover in movers],
+                         [('Zoro (Parallel) - Romance Dawn', 100.0), ('Law (Parallel) - Worst Generation', -50.0)])
+        self.assertEqual(self.store.set_aggregate('2024-01-02'),
+                         [('Romance Dawn', 2, 8.0, 4.0, 2.0, 6.0), ('Worst Generation', 1, 1.0, 1.0, 1.0, 1.0)])
+        with self.assertRaises(ValueError):
+            self.store.top_movers('2024-01-01', '2024-01-02', price_column='date; DROP TABLE prices')
+
+class TestStreamingValidator(unittest.TestCase):
+    def test_report_matches_dataframe_validator(self):
+        rows = [
+            {'name': 'Nami', 'type': ['Parallel'], 'current_lowest_price': 5.0, 'normal_market_price': 5.5, 'date': '2024-01-01'},
+            {'name': 'Nami', 'type': ['Parallel'], 'current_lowest_price': 5.0, 'normal_market_price': 5.5, 'date': '2024-01-01'},
+            {'name': 'Zoro', 'type': [], 'current_lowest_price': 0.5, 'normal_market_price': 0.4, 'date': '2024-01-01'},
+            {'name': 'Luffy', 'type': [], 'current_lowest_price': 2.0, 'normal_market_price': np.nan, 'date': '2024-01-01'},
+        ]
+        streaming = StreamingValidator()
+        streaming.write(rows[:2])
+        streaming.update_chunk(pd.DataFrame(rows[2:]))
+        batch = DataFrameValidator(pd.DataFrame(rows).astype({'type': str}))
+
+        self.assertEqual(streaming.validate_lowest_price(), batch.validate_lowest_price())
+        self.assertEqual(streaming.check_for_dupes(), batch.check_for_dupes())
+        with self.assertLogs(level='INFO') as logs:
+            self.assertEqual(streaming.check_for_dupes(dropped=2), batch.check_for_dupes())
+        self.assertIn("2 duplicated row(s) were dropped before they were written.", '\n'.join(logs.output))
+        self.assertEqual(streaming.count_nulls(), batch.count_nulls())
+        self.assertEqual(streaming.row_count(), batch.row_count())
+
+class TestBatchPreprocessing(unittest.TestCase):
+    def setUp(self):
+        self.prices = ['$1.50', '$0.35', '-', '$1,200.00', ' $2 ', '', '$12']
+        self.product_names = ['Monkey.D.Luffy (Alternate Art) - Romance Dawn', 'Trafalgar Law - Starter Deck 2: Worst Generation',
+                              'Nami', 'Roronoa Zoro - (Parallel)', 'Shanks (Box Topper) (Parallel) - Romance Dawn',
+                              'Sanji (Tournament Pack Vol. 2) - Promotion Cards', 'Uta (Manga) (009)']
+
+    def test_convert_to_number_batch_matches_scalar(self):
+        expected = [pp.convert_to_number(price) for price in self.prices]
+        self.assertEqual(pp.convert_to_number_batch(self.prices).tolist(), expected) # None where it fails, not NaN
+
+    def test_get_card_name_batch_matches_scalar(self):
+        expected = [pp.get_card_name(product_name) for product_name in self.product_names]
+        self.assertEqual(pp.get_card_name_batch(np.array(self.product_names)).tolist(), expected)
+
+    def test_get_card_type_batch_matches_scalar(self):
+        expected = [pp.get_card_type(product_name) for product_name in self.product_names]
+        self.assertEqual(pp.get_card_type_batch(pd.Series(self.product_names)).tolist(), expected)
+        self.assertEqual(pp.get_card_type_batch(pd.Series([None, 'Nami (Parallel) - Romance Dawn'])).tolist(),
+                         [pp.get_card_type(None), ['Parallel']]) # None like the scalar function, not []
+
+    def test_batch_functions_are_faster_on_a_backfill(self):
+        # a backfill repeats the same cards and prices every day
+        product_names = [f'{name} {card}' for card in range(300) for name in self.product_names] * 10
+        prices = self.prices * 3000
+        for scalar, batch, values in [(pp.get_card_name, pp.get_card_name_batch, product_names),
+                                      (pp.get_card_type, pp.get_card_type_batch, product_names),
+                                      (pp.convert_to_number, pp.convert_to_number_batch, prices)]:
+            start = time.perf_counter()
+            expected = [scalar(value) for value in values]
+            scalar_time = time.perf_counter() - start
+            start = time.perf_counter()
+            result = batch(values).tolist()
+            batch_time = time.perf_counter() - start
+            self.assertEqual(result, expected)
+            self.assertLess(batch_time, scalar_time / 2, scalar.__name__)
+
+class TestUploadToS3(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.env = patch.dict(os.environ, {'AWS_ACCESS_KEY_ID': 'testing', 'AWS_SECRET_ACCESS_KEY': 'testing',
+                                           'AWS_DEFAULT_REGION': 'us-east-1'})
+        self.env.start()
+        self.mock_aws = mock_aws()
+        self.mock_aws.start()
+        self.s3_client = boto3.client('s3')
+        self.s3_client.create_bucket(Bucket='optcg-test')
+
+    def tearDown(self):
+        self.mock_aws.stop()
+        self.env.stop()
+        self.temp_dir.cleanup()
+
+    def write(self, name, text, mode='w'):
+        path = os.path.join(self.temp_dir.name, name)
+        with open(path, mode) as file:
+            file.write(text)
+        return path
+
+    def test_upload_files(self):
+        paths = [self.write('optcg_data_20240101.csv', 'name\nNami\n'), self.write('optcg_data_20240102.csv', 'name\nZoro\n')]
+
+        uploaded = upload_files(paths, 'optcg-test', s3_client=self.s3_client)
+
+        self.assertEqual(uploaded, ['optcg_data_20240101.csv', 'optcg_data_20240102.csv'])
+        body = self.s3_client.get_object(Bucket='optcg-test', Key='optcg_data_20240102.csv')['Body'].read()
+        self.assertEqual(body, b'name\nZoro\n')
+
+    def test_upload_new_bytes_only_uploads_appended_bytes(self):
+        offsets_path = os.path.join(self.temp_dir.name, 'offsets.json')
+        log_path = self.write('tcg_pipeline.log', 'first line\n')
+        first = upload_new_bytes(log_path, 'optcg-test', offsets_path=offsets_path, s3_client=self.s3_client)
+        nothing = upload_new_bytes(log_path, 'optcg-test', offsets_path=offsets_path, s3_client=self.s3_client)
+        self.write('tcg_pipeline.log', 'second line\n', mode='a')
+        second = upload_new_bytes(log_path, 'optcg-test', offsets_path=offsets_path, s3_client=self.s3_client)
+
+        self.assertEqual((first, nothing, second), ('tcg_pipeline.log.part00000', None, 'tcg_pipeline.log.part00001'))
+        body = self.s3_client.get_object(Bucket='optcg-test', Key=second)['Body'].read()
+        self.assertEqual(body, b'second line\n')
+
+    def test_upload_new_bytes_uploads_a_replaced_file_as_a_new_generation(self):
+        offsets_path = os.path.join(self.temp_dir.name, 'offsets.json')
+        log_path = self.write('tcg_pipeline.log', 'first line\nsecond line\n')
+        upload_new_bytes(log_path, 'optcg-test', offsets_path=offsets_path, s3_client=self.s3_client)
+        self.write('tcg_pipeline.log', 'rotated\n') # shrank
+        rotated = upload_new_bytes(log_path, 'optcg-test', offsets_path=offsets_path, s3_client=self.s3_client)
+        self.write('tcg_pipeline.log', 'truncated in place, then grown past the offset\n', mode='r+')
+        grown = upload_new_bytes(log_path, 'optcg-test', offsets_path=offsets_path, s3_client=self.s3_client)
+
+        self.assertEqual((rotated, grown), ('tcg_pipeline.log.gen0001.part00000', 'tcg_pipeline.log.gen0002.part00000'))
+        def body(key):
+            return self.s3_client.get_object(Bucket='optcg-test', Key=key)['Body'].read()
+        self.assertEqual(body('tcg_pipeline.log.part00000'), b'first line\nsecond line\n') # the first generation is kept
+        self.assertEqual(body(grown), b'truncated in place, then grown past the offset\n')
+
+
+class TestOptcgCli(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.file_name = os.path.join(self.temp_dir.name, 'optcg_data_20240101.csv')
+        card = {'name': 'Nami', 'full_product_name': 'Nami (Parallel) - Romance Dawn', 'set': 'Romance Dawn',
+                'type': "['Parallel']", 'current_lowest_price': 5.0, 'normal_market_price': 5.5,
+                'foil_market_price': np.nan, 'date': '2024-01-01'}
+        pd.DataFrame([card, card, dict(card, name='Zoro', normal_market_price=4.0)]).to_csv(self.file_name, index=False)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_validate_loads_no_heavy_dependencies(self):
+        code = ("import json, sys, optcg; status = optcg.main(['validate', sys.argv[1], '--strict']); "
+                "print(json.dumps([status, sorted({'selenium', 'pandas', 'numpy', 'boto3', 'pyarrow', 'bs4'} & set(sys.modules))]))")
+        env = dict(os.environ, OPTCG_LOG_FILE=os.path.join(self.temp_dir.name, 'test.log'))
+        result = subprocess.run([sys.executable, '-c', code, self.file_name], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), env=env, check=True)
+        self.assertEqual(json.loads(result.stdout.splitlines()[-1]), [1, []]) # a duplicate and a price below the lowest
+
+    def test_csv_rows_validate_like_pandas_chunks(self):
+        rows = StreamingValidator()
+        for chunk in read_csv_rows(self.file_name, chunksize=2):
+            rows.write(chunk)
+        chunks = StreamingValidator()
+        for chunk in pd.read_csv(self.file_name, chunksize=2):
+            chunks.update_chunk(chunk)
+
+        self.assertEqual(rows.df_show_schema(), chunks.df_show_schema())
+        self.assertEqual(rows.count_nulls(), chunks.count_nulls())
+        self.assertEqual((rows.check_for_dupes(), rows.validate_lowest_price()),
+                         (chunks.check_for_dupes(), chunks.validate_lowest_price()))
+
+class TestDeltaPublisher(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.publisher = DeltaPublisher(os.path.join(self.temp_dir.name, 'deltas'))
+        self.loader = SqliteDeltaLoader(os.path.join(self.temp_dir.name, 'loader.db'))
+
+    def tearDown(self):
+        self.loader.close()
+        self.temp_dir.cleanup()
+
+    def card(self, name, price, date, card_type="['Parallel']"):
+        return {'full_product_name': f'{name} - Romance Dawn', 'name': name, 'type': card_type, 'set': 'Romance Dawn',
+                'current_lowest_price': price, 'normal_market_price': price, 'foil_market_price': np.nan,
+                'normal_buylist_price': np.nan, 'foil_buylist_price': np.nan, 'normal_listed_median_price': np.nan,
+                'foil_listed_median_price': np.nan, 'date': date}
+
+    def publish(self, rows, date):
+        file_name = os.path.join(self.temp_dir.name, f'optcg_data_{date}.csv')
+        pd.DataFrame(rows).to_csv(file_name, index=False)
+        manifest = self.publisher.prepare_csv(file_name, date)
+        self.publisher.commit(manifest)
+        return manifest
+
+    def test_applying_the_delta_chain_reproduces_the_full_snapshot(self):
+        days = [
+            [self.card('Nami', 5.0, '2024-01-01'), self.card('Zoro', 1.0, '2024-01-01'), self.card('Law', 2.0, '2024-01-01')],
+            [self.card('Nami', 5.0, '2024-01-02'), self.card('Zoro', 1.5, '2024-01-02'), self.card('Law', 2.0, '2024-01-02'),
+             self.card('Law', 3.0, '2024-01-02', card_type='[]')],
+            [self.card('Nami', 5.0, '2024-01-03'), self.card('Zoro', 1.5, '2024-01-03'), self.card('Law', 3.0, '2024-01-03', card_type='[]'),
+             self.card('Luffy', 9.0, '2024-01-03')],
+        ]
+        manifests = [self.publish(rows, rows[0]['date']) for rows in days]
+
+        self.assertEqual([(m['inserts'], m['updates'], m['deletes']) for m in manifests], [(3, 0, 0), (1, 1, 0), (1, 0, 1)])
+        with self.assertRaises(ValueError):
+            self.loader.apply(manifests[1]['manifest_path']) # out of sequence
+        for manifest in manifests:
+            self.loader.apply(manifest['manifest_path'])
+        expected = {card_key(row['full_product_name'], row['set'], row['type']): state_row(row) for row in days[-1]}
+        self.assertEqual(self.loader.snapshot(), expected)
+
+    def test_refuses_a_delta_delisting_most_cards(self):
+        self.publish([self.card('Nami', 5.0, '2024-01-01'), self.card('Zoro', 1.0, '2024-01-01'),
+                      self.card('Law', 2.0, '2024-01-01')], '2024-01-01')
+        with self.assertRaises(ValueError):
+            self.publisher.prepare([self.card('Nami', 5.0, '2024-01-02')], '2024-01-02')
+
+class TestShardedCrawl(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.shard_dir = os.path.join(self.temp_dir.name, 'shards')
+        self.store = LeaseStore(os.path.join(self.shard_dir, 'leases.db'))
+
+    def tearDown(self):
+        self.store.close()
+        self.temp_dir.cleanup()
+
+    def test_expired_leases_go_to_other_workers(self):
+        self.store.create_run('r1', '2024-01-01', [1, 2])
+        self.assertEqual(self.store.claim('r1', 'dead', lease_seconds=-1, batch=2), [1, 2]) # expires at once
+        self.assertEqual(self.store.claim('r1', 'alive', lease_seconds=60), [1])
+        self.assertFalse(self.store.complete('r1', 1, 'dead'))
+        self.assertTrue(self.store.complete('r1', 1, 'alive'))
+        self.store.release('r1', 2, 'dead') # an expired lease nobody took over yet can still be released
+        self.assertEqual(self.store.status('r1'), {'pending': 1, 'leased': 0, 'done': 1, 'failed': 0})
+        self.assertEqual(self.store.claim('r1', 'other', lease_seconds=-1), [2])
+        self.assertEqual(self.store.claim('r1', 'other', lease_seconds=-1), [2]) # third attempt
+        self.assertEqual(self.store.claim('r1', 'other'), [])
+        self.assertTrue(self.store.is_finished('r1'))
+        self.assertEqual(self.store.status('r1')['failed'], 1)
+
+    @patch('tcg_scraper_pool.tcg.iter_card_data')
+    @patch('tcg_scraper_pool.tcg.download_elements_from_webpage')
+    def test_workers_share_the_run_and_the_merge_drops_duplicates(self, mock_download, mock_iter_card_data):
+        def iter_card_data(elements, driver, date, url_index):
+            page = driver.page
+            yield {'full_product_name': f'card-{page} - Romance Dawn', 'name': f'card-{page}', 'type': [],
+                   'set': 'Romance Dawn', 'current_lowest_price': 1.0, 'date': date}, f'link-{page}'
+        def download(driver, url):
+            driver.page = int(url.split('page=')[1].split('&')[0])
+            return []
+        mock_iter_card_data.side_effect = iter_card_data
+        mock_download.side_effect = download
+        coordinator = Coordinator(self.store, shard_dir=self.shard_dir)
+        coordinator.plan(range(1, 7), run_id='r1', date='2024-01-01')
+        self.store.claim('r1', 'dead', lease_seconds=-1) # a worker died holding page 1
+
+        workers = [ShardWorker(self.store, 'r1', worker_id=f'worker-{i}', shard_dir=self.shard_dir, threads=2,
+                               poll_seconds=0.01, driver_factory=Mock) for i in range(2)]
+        threads = [threading.Thread(target=worker.run) for worker in workers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # a page scraped twice, by a worker whose lease expired, is merged once even though its price moved
+        with open(workers[0].shard_path, 'a', newline='') as file:
+            file.write('card-1 - Romance Dawn,card-1,[],Romance Dawn,1.5,2024-01-01\n')
+
+        output_path = os.path.join(self.temp_dir.name, 'optcg_data_r1.csv')
+        url_index = ScrapedUrlIndex(os.path.join(self.temp_dir.name, 'card_link_list.csv'))
+        self.assertEqual(coordinator.wait('r1', poll_seconds=0.01, timeout=5)['done'], 6)
+        self.assertEqual(coordinator.merge('r1', output_path, url_index=url_index), 6)
+        self.assertEqual(sorted(pd.read_csv(output_path)['name']), [f'card-{page}' for page in range(1, 7)])
+        self.assertEqual(len(url_index), 6)
+        self.assertEqual(coordinator.merge('r1', output_path), 0) # merging again adds nothing
+
+    @patch('tcg_scraper_pool.tcg.iter_card_data')
+    @patch('tcg_scraper_pool.tcg.download_elements_from_webpage')
+    def test_a_page_longer_than_its_lease_keeps_it(self, mock_download, mock_iter_card_data):
+        def iter_card_data(elements, driver, date, url_index):
+            time.sleep(0.5) # longer than the lease
+            self.assertEqual(self.store.claim('r1', 'other', lease_seconds=60), [])
+            yield {'full_product_name': 'card - Romance Dawn', 'set': 'Romance Dawn', 'type': [], 'date': date}, 'link'
+        mock_iter_card_data.side_effect = iter_card_data
+        mock_download.return_value = []
+        Coordinator(self.store, shard_dir=self.shard_dir).plan([1], run_id='r1', date='2024-01-01')
+
+        worker = ShardWorker(self.store, 'r1', worker_id='slow', shard_dir=self.shard_dir, lease_seconds=0.2,
+                             poll_seconds=0.01, driver_factory=Mock)
+
+        self.assertEqual(worker.run(), 1)
+        self.assertEqual(self.store.status('r1')['done'], 1)
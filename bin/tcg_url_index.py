@@ -0,0 +1,92 @@
+import csv
+import re
+import logging
+import os
+import threading
+
+# Get the absolute directory of the current script
+abs_dir = os.path.dirname(os.path.abspath(__file__))
+
+# Get the custom Logger from Configuration File
+logger = logging.getLogger(__name__)
+
+DEFAULT_URL_FILE_PATH = os.path.join(abs_dir, '..', 'logs', 'card_link_list.csv')
+
+DATE_PATTERN = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+
+class ScrapedUrlIndex:
+    """
+    In-memory index of the product links that have been scraped, keyed by (date, url).
+
+    The index is loaded once from the append-only card_link_list.csv ledger and new links are
+    appended to the ledger as they are added, so membership tests are O(1) set lookups and the
+    ledger is never read again during a run. The index is safe to share between threads.
+
+    Example usage:
+        url_index = ScrapedUrlIndex()
+        if ('2024-01-01', link) not in url_index:
+            ...
+            url_index.add('2024-01-01', link)
+    """
+    def __init__(self, file_path=DEFAULT_URL_FILE_PATH):
+        self.file_path = file_path
+        self.lock = threading.Lock()
+        self.keys = set()
+        self.fieldnames = ['date', 'url']
+        self._load()
+
+    def _load(self):
+        try:
+            if not os.path.exists(self.file_path):
+                os.makedirs(os.path.dirname(os.path.abspath(self.file_path)), exist_ok=True)
+                with open(self.file_path, 'w', newline='') as file:
+                    csv.writer(file).writerow(['date', 'url'])
+                logger.info(f"New file created at {self.file_path}.")
+            with open(self.file_path, newline='') as file:
+                reader = csv.DictReader(file)
+                self.fieldnames = reader.fieldnames or self.fieldnames
+                for row in reader:
+                    date, url = row['date'], row['url']
+                    # older runs appended rows in url,date order under a date,url header
+                    if not DATE_PATTERN.match(date or '') and DATE_PATTERN.match(url or ''):
+                        date, url = url, date
+                    self.keys.add((date, url))
+        except Exception as e:
+            logger.error(f"Error loading the scraped url index from {self.file_path}: {e}")
+            raise e
+        else:
+            logger.info(f"Loaded {len(self.keys)} scraped url(s) from {self.file_path}.")
+
+    def __contains__(self, key):
+        return key in self.keys
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, date, url):
+        """
+        Marks a product link as scraped on a given date.
+        """
+        self.add_many([{'url': url, 'date': date}])
+
+    def add_many(self, url_list):
+        """
+        Marks product links as scraped and appends the new ones to the ledger.
+
+        Args:
+            url_list (list): {'url', 'date'} dictionaries as returned by get_card_data().
+
+        Returns:
+            int: The number of links that were not in the index yet.
+        """
+        with self.lock:
+            new_rows = []
+            for item in url_list:
+                key = (item['date'], item['url'])
+                if item['url'] is not None and key not in self.keys:
+                    self.keys.add(key)
+                    new_rows.append({'date': item['date'], 'url': item['url']})
+            if new_rows:
+                with open(self.file_path, 'a', newline='') as file:
+                    csv.DictWriter(file, fieldnames=self.fieldnames).writerows(new_rows)
+        return len(new_rows)
@@ -1,15 +1,7 @@
 import logging
-import logging.config
-import os
+import threading
+from tcg_metrics import timed
 
-# Get the absolute directory of the current script
-abs_dir = os.path.dirname(os.path.abspath(__file__))
-
-# Construct the absolute path to the logging configuration file
-logging_config_path = os.path.join(abs_dir, '..', 'util', 'logging_to_file.conf')
-
-logging.config.fileConfig(fname=logging_config_path)
-    
 # Get the custom Logger from Configuration File
 logger = logging.getLogger(__name__)
 
@@ -17,6 +9,7 @@ class DataFrameValidator:
     def __init__(self, df):
         self.df = df
 
+    @timed('validate')
     def df_show_schema(self):
         try:
             logging.info(f"The DataFrame Schema Validation...")
@@ -29,6 +22,7 @@ class DataFrameValidator:
         else:
             logging.info("The DataFrame Schema Validation is completed.")
 
+    @timed('validate')
     def validate_lowest_price(self):
         try:
             logging.info("Validating the lowest price...")
@@ -43,6 +37,7 @@ class DataFrameValidator:
             logging.info(f"There are {false_count} price(s) where current_lowest_price is greater than the other stored prices.")
         return false_count
 
+    @timed('validate')
     def check_for_dupes(self):
         try:
             logging.info("Counting duplicate rows...")
@@ -55,6 +50,7 @@ class DataFrameValidator:
             logging.info(f"There are {num_of_dupes} duplicated row(s) that will be removed.")
         return num_of_dupes
 
+    @timed('validate')
     def count_nulls(self):
         try:
             logging.info("Counting number of null values by column...")
@@ -73,6 +69,7 @@ class DataFrameValidator:
                 logging.info(f"Column {key} has {value} null value(s).")
         return null_count_dict
 
+    @timed('validate')
     def row_count(self):
         try:
             logging.info("Getting the total row count...")            
@@ -83,3 +80,143 @@ class DataFrameValidator:
         else:
             logging.info(f"There are {df_count} row(s) in this table.")
         return df_count
+
+def _is_null(value):
+    # the same values pandas reads back as NaN from the csv
+    return value is None or value == '' or (isinstance(value, float) and value != value)
+
+def _normalize(value):
+    # the value as it is stored in the csv, so in-memory rows and csv chunks compare equal
+    if _is_null(value):
+        return None
+    if isinstance(value, list):
+        return str(value)
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    return value
+
+class StreamingValidator:
+    """
+    Incremental version of DataFrameValidator that validates rows as the scraper produces them.
+
+    Every check is updated in a single pass over each batch of rows: inferred column types for
+    the schema, the lowest price check, duplicates (with a hash set of the rows seen), null counts
+    and the row count. The report methods have the same names, logs and return values as the
+    DataFrameValidator of the written csv, without reading the file back.
+
+    Example usage:
+        validator = StreamingValidator()
+        validator.write(card_data)
+        validator.check_for_dupes()
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.columns = {}
+        self.seen = set()
+        self.num_of_dupes = 0
+        self.false_count = 0
+        self.rows = 0
+
+    @timed('validate')
+    def write(self, rows):
+        """
+        Updates every check with a batch of row dictionaries.
+        """
+        with self.lock:
+            for row in rows:
+                self._update_row(row)
+
+    def update_chunk(self, df):
+        """
+        Updates every check with a chunk of a DataFrame, e.g. one chunk of pd.read_csv(chunksize=...).
+        """
+        # not timed itself, write() records the validate time of the chunk once
+        self.write(df.to_dict('records'))
+
+    def _update_row(self, row):
+        self.rows += 1
+        for column, value in row.items():
+            stats = self.columns.setdefault(column, {'values': 0, 'types': set()})
+            if not _is_null(value):
+                stats['values'] += 1
+                stats['types'].add(type(value).__name__)
+
+        key = hash(tuple(_normalize(value) for value in row.values()))
+        if key in self.seen:
+            self.num_of_dupes += 1
+        else:
+            self.seen.add(key)
+
+        # mirrors df[price_cols].ge(df['current_lowest_price'], axis=0).all(axis=1), where a missing price fails
+        lowest = row.get('current_lowest_price')
+        prices = [value for column, value in row.items() if 'price' in column]
+        if _is_null(lowest) or any(_is_null(value) or value < lowest for value in prices):
+            self.false_count += 1
+
+    @staticmethod
+    def _dtype(types):
+        if not types:
+            return 'float64'
+        if types <= {'int', 'int64'}:
+            return 'int64'
+        if types <= {'int', 'int64', 'float', 'float64'}:
+            return 'float64'
+        return 'object'
+
+    @timed('validate')
+    def df_show_schema(self):
+        try:
+            logging.info(f"The DataFrame Schema Validation...")
+            with self.lock:
+                sch = {column: self._dtype(stats['types']) for column, stats in self.columns.items()}
+            logging.info(f"The DataFrame schema is: ")
+            logging.info(sch)
+        except Exception as e:
+            logging.error("Error in the method - df_show_schema(). Please check the Stack Trace. " + str(e))
+            raise e
+        else:
+            logging.info("The DataFrame Schema Validation is completed.")
+        return sch
+
+    @timed('validate')
+    def validate_lowest_price(self):
+        logging.info("Validating the lowest price...")
+        false_count = self.false_count
+        logging.info(f"There are {false_count} price(s) where current_lowest_price is greater than the other stored prices.")
+        return false_count
+
+    @timed('validate')
+    def check_for_dupes(self, dropped=0):
+        """
+        Reports the duplicated rows the validator was given.
+
+        Args:
+            dropped (int): Duplicates the CsvRowSink already dropped as they were scraped. The validator
+                only gets the written rows, so these are reported here and not counted again.
+
+        Returns:
+            int: The number of duplicated rows the validator was given, which are still in the file.
+        """
+        logging.info("Counting duplicate rows...")
+        num_of_dupes = self.num_of_dupes
+        if dropped:
+            logging.info(f"{dropped} duplicated row(s) were dropped before they were written.")
+        logging.info(f"There are {num_of_dupes} duplicated row(s) that will be removed.")
+        return num_of_dupes
+
+    @timed('validate')
+    def count_nulls(self):
+        logging.info("Counting number of null values by column...")
+        with self.lock:
+            # a column missing from a row counts as null, like the NaN pandas fills in
+            null_count_dict = {column: self.rows - stats['values'] for column, stats in self.columns.items()}
+        for key, value in null_count_dict.items():
+            logging.info(f"Column {key} has {value} null value(s).")
+        return null_count_dict
+
+    @timed('validate')
+    def row_count(self):
+        logging.info("Getting the total row count...")
+        df_count = self.rows
+        logging.info(f"There are {df_count} row(s) in this table.")
+        return df_count
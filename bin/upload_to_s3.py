@@ -1,21 +1,60 @@
-import logging
-import boto3
-from botocore.exceptions import ClientError
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
 import os
 import logging
-import logging.config
+import threading
+from tcg_metrics import metrics, timed
 
 # Get the absolute directory of the current script
 abs_dir = os.path.dirname(os.path.abspath(__file__))
 
-# Construct the absolute path to the logging configuration file
-logging_config_path = os.path.join(abs_dir, '..', 'util', 'logging_to_file.conf')
+logger = logging.getLogger(__name__)
 
-logging.config.fileConfig(fname=logging_config_path)
+MB = 1024 * 1024
 
-logger = logging.getLogger(__name__)
+_transfer_config = None
+
+DEFAULT_OFFSETS_PATH = os.path.join(abs_dir, '..', 'logs', 's3_upload_offsets.json')
+
+_s3_client = None
+_s3_client_lock = threading.Lock()
+
+def get_s3_client(max_pool_connections=16):
+    """
+    Returns the S3 client shared by every upload, creating it on first use.
+
+    Boto3 clients are thread safe, so one client with a connection pool large enough for the
+    concurrent uploads and their multipart parts is reused instead of building one per file.
+
+    Parameters:
+        max_pool_connections (int): Size of the client's connection pool.
+
+    Returns:
+        The S3 client.
+    """
+    global _s3_client
+    # boto3 takes a few hundred milliseconds to import, so it is only loaded once something is uploaded
+    import boto3
+    from botocore.config import Config
+    with _s3_client_lock:
+        if _s3_client is None:
+            _s3_client = boto3.client('s3', config=Config(max_pool_connections=max_pool_connections))
+    return _s3_client
+
+def get_transfer_config():
+    """
+    Returns the transfer configuration of upload_file(): files above 8 MB are uploaded in parallel parts.
+    """
+    global _transfer_config
+    from boto3.s3.transfer import TransferConfig
+    if _transfer_config is None:
+        _transfer_config = TransferConfig(multipart_threshold=8 * MB, multipart_chunksize=8 * MB, max_concurrency=8,
+                                          use_threads=True)
+    return _transfer_config
 
-def upload_file(file_name, bucket, object_name=None):
+@timed('upload')
+def upload_file(file_name, bucket, object_name=None, s3_client=None):
     """
     Uploads a file to an S3 bucket.
 
@@ -23,6 +62,7 @@ def upload_file(file_name, bucket, object_name=None):
         file_name (str): The name of the file to be uploaded.
         bucket (str): The name of the S3 bucket where the file will be uploaded.
         object_name (str, optional): The name of the object in the S3 bucket. If not specified, the base name of the file will be used.
+        s3_client (optional): The client to upload with. Defaults to the shared client.
 
     Returns:
         None
@@ -35,16 +75,135 @@ def upload_file(file_name, bucket, object_name=None):
         Logs an info message if the file is successfully uploaded to the S3 bucket.
     """
 
+    from botocore.exceptions import ClientError
+
     # If S3 object_name was not specified, use file_name
     if object_name is None:
         object_name = os.path.basename(file_name)
 
     # Upload the file
-    s3_client = boto3.client('s3')
+    if s3_client is None:
+        s3_client = get_s3_client()
     try:
-        s3_client.upload_file(file_name, bucket, object_name)
+        s3_client.upload_file(file_name, bucket, object_name, Config=get_transfer_config())
     except ClientError as e:
         logging.error(f"Error in the method upload_file: {e}")
         raise e
     else:
+        metrics.increment('bytes_uploaded', os.path.getsize(file_name))
         logging.info(f"{object_name} successfully uploaded to s3 bucket: {bucket}")
+
+def upload_files(file_names, bucket, max_workers=4, s3_client=None):
+    """
+    Uploads several files to an S3 bucket concurrently.
+
+    Parameters:
+        file_names (list): The names of the files to be uploaded. Each object is named after the base name of its file.
+        bucket (str): The name of the S3 bucket where the files will be uploaded.
+        max_workers (int): The number of files uploaded at the same time.
+        s3_client (optional): The client to upload with. Defaults to the shared client.
+
+    Returns:
+        list: The names of the uploaded objects.
+
+    Raises:
+        ClientError: The first upload error, once every other upload has finished.
+    """
+    if s3_client is None:
+        s3_client = get_s3_client()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(upload_file, file_name, bucket, None, s3_client) for file_name in file_names]
+    errors = [future.exception() for future in futures if future.exception() is not None]
+    if errors:
+        logging.error(f"{len(errors)} of {len(file_names)} upload(s) failed.")
+        raise errors[0]
+    return [os.path.basename(file_name) for file_name in file_names]
+
+# bytes at the start of an append-only file compared between uploads to tell a rotated file from a grown one
+HEAD_BYTES = 4096
+
+def _part_name(object_name, generation, part):
+    # generation 0 keeps the names of the parts uploaded before files were counted in generations
+    if generation == 0:
+        return f"{object_name}.part{part:05d}"
+    return f"{object_name}.gen{generation:04d}.part{part:05d}"
+
+def _head_digest(file, size):
+    file.seek(0)
+    return hashlib.sha256(file.read(size)).hexdigest()
+
+@timed('upload')
+def upload_new_bytes(file_name, bucket, object_name=None, offsets_path=DEFAULT_OFFSETS_PATH, s3_client=None):
+    """
+    Uploads only the bytes appended to a file since its last upload.
+
+    Meant for append-only files like tcg_pipeline.log and card_link_list.csv. S3 objects cannot be
+    appended to, so each upload writes the new bytes as the next numbered object
+    '<object_name>.part00000', '<object_name>.part00001', ... and the concatenation of the parts
+    is the whole file. The offset, part number, inode and a digest of the first bytes of every file
+    are kept in offsets_path. A file that shrank, has another inode or starts with other bytes was
+    replaced (e.g. rotated): it is uploaded from the beginning as the next generation,
+    '<object_name>.gen0001.part00000', ..., so the parts of the earlier generations stay whole.
+
+    Parameters:
+        file_name (str): The name of the file to be uploaded.
+        bucket (str): The name of the S3 bucket where the new bytes will be uploaded.
+        object_name (str, optional): Prefix of the part objects. Defaults to the base name of the file.
+        offsets_path (str): JSON file keeping the uploaded offset of every file.
+        s3_client (optional): The client to upload with. Defaults to the shared client.
+
+    Returns:
+        str: The name of the uploaded part object, or None if nothing was appended since the last upload.
+    """
+    from botocore.exceptions import ClientError
+
+    if object_name is None:
+        object_name = os.path.basename(file_name)
+    if s3_client is None:
+        s3_client = get_s3_client()
+
+    offsets = {}
+    if os.path.exists(offsets_path):
+        with open(offsets_path) as file:
+            offsets = json.load(file)
+    key = os.path.abspath(file_name)
+    state = offsets.get(key, {'offset': 0, 'part': 0})
+    generation = state.get('generation', 0)
+
+    with open(file_name, 'rb') as file:
+        stat = os.fstat(file.fileno())
+        # entries written before the inode and head were recorded are only checked for shrinking
+        replaced = stat.st_size < state['offset'] or state.get('inode', stat.st_ino) != stat.st_ino
+        if not replaced and 'head' in state:
+            # a file truncated in place and grown past the offset again keeps its inode, not its first bytes
+            replaced = _head_digest(file, min(state['offset'], HEAD_BYTES)) != state['head']
+        if replaced:
+            generation += 1
+            logging.info(f"{file_name} was replaced since its last upload, uploading it again from the start "
+                         f"as generation {generation}.")
+            state = {'offset': 0, 'part': 0}
+        file.seek(state['offset'])
+        new_bytes = file.read()
+        offset = state['offset'] + len(new_bytes)
+        head = _head_digest(file, min(offset, HEAD_BYTES))
+    if not new_bytes:
+        logging.info(f"No new bytes in {file_name} since its last upload.")
+        return None
+
+    part_name = _part_name(object_name, generation, state['part'])
+    try:
+        s3_client.put_object(Bucket=bucket, Key=part_name, Body=new_bytes)
+    except ClientError as e:
+        logging.error(f"Error in the method upload_new_bytes: {e}")
+        raise e
+
+    metrics.increment('bytes_uploaded', len(new_bytes))
+    offsets[key] = {'offset': offset, 'part': state['part'] + 1, 'generation': generation, 'inode': stat.st_ino,
+                    'head': head}
+    os.makedirs(os.path.dirname(os.path.abspath(offsets_path)), exist_ok=True)
+    temp_path = f'{offsets_path}.tmp'
+    with open(temp_path, 'w') as file:
+        json.dump(offsets, file)
+    os.replace(temp_path, offsets_path)
+    logging.info(f"{len(new_bytes)} new byte(s) of {file_name} uploaded to s3 bucket {bucket} as {part_name}")
+    return part_name